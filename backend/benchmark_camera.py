@@ -0,0 +1,479 @@
+"""
+Per-frame benchmarks for the camera pipeline.
+
+Color pipeline: compares the previous split/enhance/merge implementation
+with the lookup-table pipeline in color_pipeline.py on synthetic frames, and
+checks that both produce identical pixels.
+
+Transport (--transport): serves the same pre-encoded JPEGs to concurrent
+clients over the MJPEG stream and the binary WebSocket, with the API running
+in a separate process, and reports the server CPU time per delivered frame,
+delivered fps and bytes on the wire per frame.
+
+Pipeline (--pipeline): feeds synthetic (or --replay-path) frames at several
+resolutions through the pipeline stages - convert, color-correct, JPEG encode
+at each --qualities value, fan-out to --clients simulated stream clients -
+without camera hardware. Reports wall and CPU time per stage, bytes per frame
+at each quality and the achievable fps, serial and with the stages on
+separate threads.
+
+Every mode can write its results with --json, tagged with the git commit,
+and --compare prints the change against an earlier JSON file.
+
+Usage:
+    python benchmark_camera.py
+    python benchmark_camera.py --frames 200 --width 1280 --height 720
+    python benchmark_camera.py --transport --clients 4 --seconds 5
+    python benchmark_camera.py --pipeline --json before.json
+    python benchmark_camera.py --pipeline --resolutions 640x480,1920x1080 --compare before.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import subprocess
+import threading
+import time
+
+import PIL
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from color_pipeline import process_frame
+
+
+def legacy_convert_frame_to_rgb(frame):
+    """Previous implementation: allocate and copy channels one at a time"""
+    if len(frame.shape) == 3 and frame.shape[2] == 4:
+        rgb_frame = np.zeros((frame.shape[0], frame.shape[1], 3), dtype=np.uint8)
+        rgb_frame[:, :, 0] = frame[:, :, 2]  # R
+        rgb_frame[:, :, 1] = frame[:, :, 1]  # G
+        rgb_frame[:, :, 2] = frame[:, :, 0]  # B
+        return rgb_frame
+    return frame
+
+
+def legacy_process_frame(frame):
+    """Previous implementation: PIL split, three Brightness passes, merge"""
+    rgb_frame = legacy_convert_frame_to_rgb(frame)
+    mean_brightness = rgb_frame.mean()
+
+    image = Image.fromarray(rgb_frame, 'RGB')
+    if mean_brightness < 30:
+        image = ImageEnhance.Brightness(image).enhance(1.3)
+
+    r, g, b = image.split()
+    b = ImageEnhance.Brightness(b).enhance(0.98)
+    r = ImageEnhance.Brightness(r).enhance(1.01)
+    g = ImageEnhance.Brightness(g).enhance(1.00)
+    image = Image.merge('RGB', (r, g, b))
+    return np.array(image)
+
+
+def synthetic_frames(count, height, width, channels, dark=False, seed=1337):
+    """Random frames; dark frames stay under the low-light threshold"""
+    rng = np.random.default_rng(seed)
+    high = 50 if dark else 256
+    return [rng.integers(0, high, (height, width, channels), dtype=np.uint8) for _ in range(count)]
+
+
+def time_per_frame(fn, frames, repeat):
+    fn(frames[0])  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for frame in frames:
+            fn(frame)
+    return (time.perf_counter() - start) / (repeat * len(frames))
+
+
+def encoded_test_frames(count, width, height):
+    """Realistic JPEGs: synthetic camera frames through the color pipeline and the high tier"""
+    from camera_sources import SyntheticSource
+    from color_pipeline import process_frame_image
+    from stream_quality import TIERS_BY_NAME, DEFAULT_TIER, encode_jpeg
+
+    source = SyntheticSource(main_size=(width, height), fps=1000)
+    source.open()
+    quality = TIERS_BY_NAME[DEFAULT_TIER].quality
+    return [encode_jpeg(process_frame_image(source.capture().main), quality) for _ in range(count)]
+
+
+def _transport_server(port, fps, frames, conn):
+    """Child process: run the API and publish frames at fps; report CPU time on request"""
+    import uvicorn
+    import main as api
+
+    api.camera_pipeline.streaming = True
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    def publish():
+        index = 0
+        next_time = time.monotonic()
+        while True:
+            api.camera_pipeline.broadcaster.publish(frames[index % len(frames)])
+            index += 1
+            next_time += 1.0 / fps
+            time.sleep(max(0.0, next_time - time.monotonic()))
+
+    threading.Thread(target=publish, daemon=True).start()
+    conn.send("ready")
+    while conn.recv() == "cpu":
+        conn.send(time.process_time())
+    server.should_exit = True
+
+
+def _mjpeg_client(port, seconds, result):
+    """Read multipart parts, honouring each part's Content-Length"""
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.sendall(b"GET /api/camera/stream HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    sock.settimeout(2.0)
+    buffer = b""
+    frames = received = 0
+    deadline = time.monotonic() + seconds
+    try:
+        while time.monotonic() < deadline:
+            chunk = sock.recv(1 << 16)
+            if not chunk:
+                break
+            received += len(chunk)
+            buffer += chunk
+            while True:
+                start = buffer.find(b"Content-Length: ")
+                header_end = buffer.find(b"\r\n\r\n", start)
+                if start == -1 or header_end == -1:
+                    break
+                length = int(buffer[start + 16:buffer.index(b"\r\n", start)])
+                if len(buffer) < header_end + 4 + length:
+                    break
+                buffer = buffer[header_end + 4 + length:]
+                frames += 1
+    finally:
+        sock.close()
+    result.append((frames, received))
+
+
+def _websocket_client(port, seconds, result):
+    """Receive binary video messages and ack each one"""
+    from websockets.sync.client import connect
+    from video_transport import unpack_video_message
+
+    frames = received = 0
+    deadline = time.monotonic() + seconds
+    with connect(f"ws://127.0.0.1:{port}/api/camera/ws", max_size=None) as ws:
+        while time.monotonic() < deadline:
+            message = ws.recv(timeout=2.0)
+            received += len(message) + (4 if len(message) < 65536 else 10)  # plus frame header
+            sequence = unpack_video_message(message)[0]
+            ws.send(json.dumps({"ack": sequence}))
+            frames += 1
+    result.append((frames, received))
+
+
+def benchmark_color(args):
+    print(f"Color pipeline benchmark: {args.width}x{args.height}, "
+          f"{args.frames} frames x {args.repeat} repeats")
+    print("-" * 70)
+
+    results = {}
+    for channels, label in ((4, "XRGB8888"), (3, "RGB888")):
+        for dark in (False, True):
+            frames = synthetic_frames(args.frames, args.height, args.width, channels, dark=dark)
+
+            mismatched = 0
+            max_diff = 0
+            for frame in frames:
+                diff = np.abs(legacy_process_frame(frame).astype(np.int16) - process_frame(frame).astype(np.int16))
+                max_diff = max(max_diff, int(diff.max()))
+                mismatched += int(np.count_nonzero(diff))
+
+            legacy = time_per_frame(legacy_process_frame, frames, args.repeat)
+            lut = time_per_frame(process_frame, frames, args.repeat)
+
+            case = f"{label}, {'low light' if dark else 'normal'}"
+            results[case] = {"legacy_ms": legacy * 1000, "lut_ms": lut * 1000, "max_diff": max_diff}
+            print(f"{case:<24} legacy {legacy * 1000:7.3f} ms   lut {lut * 1000:7.3f} ms   "
+                  f"speedup {legacy / lut:5.2f}x   max diff {max_diff} ({mismatched} px)")
+
+    return results
+
+
+def benchmark_transport(args):
+    frames = encoded_test_frames(30, args.width, args.height)
+    jpeg_bytes = sum(len(frame) for frame in frames) / len(frames)
+    print(f"Transport benchmark: {args.width}x{args.height} JPEGs (avg {jpeg_bytes / 1024:.1f} KB), "
+          f"{args.clients} clients, {args.fps} fps, {args.seconds}s per transport")
+    print("-" * 70)
+
+    context = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = context.Pipe()
+    server = context.Process(target=_transport_server, args=(args.port, args.fps, frames, child_conn), daemon=True)
+    server.start()
+    parent_conn.recv()
+
+    results = {}
+    try:
+        for name, client in (("mjpeg", _mjpeg_client), ("websocket", _websocket_client)):
+            outcomes = []
+            threads = [threading.Thread(target=client, args=(args.port, args.seconds, outcomes))
+                       for _ in range(args.clients)]
+            parent_conn.send("cpu")
+            cpu_before = parent_conn.recv()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            parent_conn.send("cpu")
+            cpu_used = parent_conn.recv() - cpu_before
+
+            delivered = sum(frames for frames, _ in outcomes)
+            received = sum(size for _, size in outcomes)
+            results[name] = {
+                "frames_delivered": delivered,
+                "fps_per_client": delivered / (args.clients * args.seconds),
+                "server_cpu_ms_per_frame": cpu_used * 1000 / delivered if delivered else None,
+                "wire_bytes_per_frame": received / delivered if delivered else None,
+            }
+            result = results[name]
+            print(f"{name:<10} {result['fps_per_client']:6.1f} fps/client   "
+                  f"server cpu {result['server_cpu_ms_per_frame'] or 0:6.3f} ms/frame   "
+                  f"overhead {(result['wire_bytes_per_frame'] or jpeg_bytes) - jpeg_bytes:7.1f} B/frame")
+    finally:
+        parent_conn.send("stop")
+        server.join(timeout=5.0)
+        if server.is_alive():
+            server.terminate()
+    return results
+
+
+def measure(fn, items, repeat):
+    """Wall and CPU milliseconds per call of fn over items"""
+    fn(items[0])  # warm up
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in range(repeat):
+        for item in items:
+            fn(item)
+    calls = repeat * len(items)
+    return {
+        "ms": (time.perf_counter() - wall_start) * 1000 / calls,
+        "cpu_ms": (time.process_time() - cpu_start) * 1000 / calls,
+    }
+
+
+def measure_fanout(jpegs, clients, repeat):
+    """
+    Publish each JPEG on a FrameBroadcaster to `clients` threads that wrap it
+    as an MJPEG part like the stream endpoint, and time publish until every
+    client has its part.
+    """
+    from frame_broadcaster import FrameBroadcaster
+    from video_transport import mjpeg_part
+
+    broadcaster = FrameBroadcaster()
+    delivered = threading.Condition()
+    counts = {"parts": 0, "bytes": 0}
+    stop = threading.Event()
+
+    def client():
+        last_sequence = 0
+        while not stop.is_set():
+            frame = broadcaster.wait_for_frame(last_sequence, timeout=0.5)
+            if frame is None:
+                continue
+            last_sequence = frame.sequence
+            part = mjpeg_part(frame.data)
+            with delivered:
+                counts["parts"] += 1
+                counts["bytes"] += len(part)
+                delivered.notify_all()
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+
+    total = repeat * len(jpegs)
+    wall = 0.0
+    cpu_start = time.process_time()
+    try:
+        for index in range(total):
+            with delivered:
+                expected = counts["parts"] + clients
+            started = time.perf_counter()
+            broadcaster.publish(jpegs[index % len(jpegs)])
+            with delivered:
+                delivered.wait_for(lambda: counts["parts"] >= expected, timeout=5.0)
+            wall += time.perf_counter() - started
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=1.0)
+    return {
+        "clients": clients,
+        "ms": wall * 1000 / total,
+        "cpu_ms": (time.process_time() - cpu_start) * 1000 / total,
+        "bytes_per_frame": counts["bytes"] / total,
+    }
+
+
+def pipeline_test_frames(args, width, height):
+    """Raw frames as the capture stage hands them over (synthetic BGRX, or replayed RGB)"""
+    from camera_sources import ReplaySource, SyntheticSource
+
+    if args.replay_path:
+        source = ReplaySource(args.replay_path, main_size=(width, height), fps=1000)
+    else:
+        source = SyntheticSource(main_size=(width, height), fps=1000)
+    source.open()
+    try:
+        return [source.capture().main.copy() for _ in range(args.frames)]
+    finally:
+        source.close()
+
+
+def benchmark_pipeline(args):
+    from color_pipeline import color_correct, frame_to_image
+    from stream_quality import DEFAULT_TIER, TIERS_BY_NAME, encode_jpeg
+
+    resolutions = [tuple(int(n) for n in value.lower().split("x")) for value in args.resolutions.split(",")]
+    qualities = [int(value) for value in args.qualities.split(",")]
+    stream_quality = TIERS_BY_NAME[DEFAULT_TIER].quality
+    if stream_quality not in qualities:
+        qualities.append(stream_quality)
+
+    print(f"Pipeline benchmark: {'replay ' + args.replay_path if args.replay_path else 'synthetic'} frames, "
+          f"{args.frames} frames x {args.repeat} repeats, {args.clients} clients")
+    print("-" * 70)
+
+    results = {}
+    for width, height in resolutions:
+        frames = pipeline_test_frames(args, width, height)
+        images = [frame_to_image(frame) for frame in frames]
+        corrected = [color_correct(image) for image in images]
+
+        stages = {
+            "convert": measure(frame_to_image, frames, args.repeat),
+            "color": measure(color_correct, images, args.repeat),
+        }
+        encode = {}
+        for quality in qualities:
+            timing = measure(lambda image: encode_jpeg(image, quality), corrected, args.repeat)
+            timing["bytes_per_frame"] = sum(len(encode_jpeg(image, quality)) for image in corrected) / len(corrected)
+            encode[str(quality)] = timing
+        jpegs = [encode_jpeg(image, stream_quality) for image in corrected]
+        stages["encode"] = encode[str(stream_quality)]
+        stages["fanout"] = measure_fanout(jpegs, args.clients, args.repeat)
+
+        serial_ms = sum(stage["ms"] for stage in stages.values())
+        # convert + color share the process thread; encode and fan-out run beside it
+        slowest_ms = max(stages["convert"]["ms"] + stages["color"]["ms"], stages["encode"]["ms"],
+                         stages["fanout"]["ms"])
+        results[f"{width}x{height}"] = {
+            "stages": stages,
+            "encode_quality": encode,
+            "cpu_ms_per_frame": sum(stage["cpu_ms"] for stage in stages.values()),
+            "achievable_fps": {"serial": 1000 / serial_ms, "pipelined": 1000 / slowest_ms},
+        }
+
+        result = results[f"{width}x{height}"]
+        print(f"{width}x{height}")
+        for name, stage in stages.items():
+            label = f"{name} (q{stream_quality})" if name == "encode" else name
+            label = f"{name} x{args.clients}" if name == "fanout" else label
+            print(f"  {label:<16} {stage['ms']:8.3f} ms   cpu {stage['cpu_ms']:8.3f} ms")
+        for quality, timing in encode.items():
+            print(f"  jpeg q{quality:<3}        {timing['ms']:8.3f} ms   {timing['bytes_per_frame'] / 1024:8.1f} KB/frame")
+        print(f"  cpu per frame    {result['cpu_ms_per_frame']:8.3f} ms   achievable "
+              f"{result['achievable_fps']['serial']:6.1f} fps serial, "
+              f"{result['achievable_fps']['pipelined']:6.1f} fps pipelined")
+    return results
+
+
+def run_metadata(args):
+    """Where and on what the results were measured, so JSON files can be compared across commits"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.time(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pillow": PIL.__version__,
+        "args": vars(args),
+    }
+
+
+def flatten_metrics(results, prefix=""):
+    """{"640x480.stages.encode.ms": value, ...} for every number in a results dict"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_metrics(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare_results(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print("-" * 70)
+    print(f"Compared with {baseline_path} (commit {baseline['run'].get('commit')})")
+    old = flatten_metrics(baseline["results"])
+    for name, value in flatten_metrics(results).items():
+        if name in old and old[name]:
+            change = (value - old[name]) / old[name] * 100
+            print(f"  {name:<48} {old[name]:10.3f} -> {value:10.3f}   {change:+6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the camera pipeline")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--frames", type=int, default=30, help="Distinct synthetic frames per case")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--transport", action="store_true",
+                        help="Compare MJPEG and WebSocket delivery instead of the color pipeline")
+    parser.add_argument("--clients", type=int, default=4, help="Concurrent clients per transport")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Duration per transport")
+    parser.add_argument("--fps", type=int, default=30, help="Published frame rate for the transport benchmark")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Benchmark convert, color, encode and fan-out per resolution and JPEG quality")
+    parser.add_argument("--resolutions", default="640x480,1280x720,1920x1080",
+                        help="Comma-separated WIDTHxHEIGHT list for --pipeline")
+    parser.add_argument("--qualities", default="50,70,85,95", help="Comma-separated JPEG qualities for --pipeline")
+    parser.add_argument("--replay-path", help="Image directory or MJPEG file to use instead of synthetic frames")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Print the change against a JSON file from an earlier run")
+    args = parser.parse_args()
+
+    if args.transport:
+        results = benchmark_transport(args)
+    elif args.pipeline:
+        results = benchmark_pipeline(args)
+    else:
+        results = benchmark_color(args)
+
+    if args.compare:
+        compare_results(results, args.compare)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"run": run_metadata(args), "results": results}, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
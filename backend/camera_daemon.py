@@ -0,0 +1,106 @@
+"""
+Camera daemon: owns the camera and publishes raw RGB frames to shared memory.
+
+Only one process can hold the camera. Run this daemon instead, and every
+local process can read the frames from the shared-memory ring (see
+shared_frames.py):
+
+- the API, started with CAMERA_SOURCE=shm;
+- inference workers or scripts, with SharedFrameRing.attach(name).
+
+Frames are the sensor's main stream converted to RGB (no color correction),
+written once per capture and never JPEG-encoded.
+
+Usage (from the backend folder):
+    python camera_daemon.py
+    python camera_daemon.py --source synthetic --fps 30 --slots 4
+"""
+
+import argparse
+import os
+import signal
+import time
+
+import numpy as np
+
+from camera_sources import CameraSourceError, SOURCE_NAMES, create_camera_source
+from color_pipeline import convert_frame_to_rgb
+from frame_pacing import FrameScheduler, RateMeter
+from shared_frames import DEFAULT_SHM_NAME, SharedFrameRing
+
+STATUS_INTERVAL = 10.0
+
+
+def run_daemon(source, ring_name, slots, fps):
+    scheduler = FrameScheduler(fps)
+    rate = RateMeter()
+    ring = None
+    stop = []
+
+    def request_stop(signum, frame):
+        stop.append(signum)
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    source.open()
+    warm_until = time.monotonic() + source.warmup_seconds
+    # ring.write copies each frame out before the next capture, so one buffer is enough
+    frame_buffer = np.empty(source.frame_shape, dtype=np.uint8) if source.frame_shape else None
+    try:
+        next_status = time.monotonic() + STATUS_INTERVAL
+        while not stop:
+            scheduler.wait()
+            captured = source.capture(out=frame_buffer)
+            if time.monotonic() < warm_until:
+                continue  # Auto exposure and white balance still settling
+            rgb = convert_frame_to_rgb(captured.main)
+            if ring is None:
+                # Sized from the first frame: the sensor may round the requested size
+                ring = SharedFrameRing.create(ring_name, rgb.shape, slots=slots)
+                print(f"Publishing {rgb.shape[1]}x{rgb.shape[0]} frames to shared memory '{ring.name}' "
+                      f"({slots} slots)")
+            ring.write(rgb, captured.timestamp)
+            rate.tick()
+
+            if time.monotonic() >= next_status:
+                print(f"   {rate.fps:.1f} fps, sequence {ring.sequence}, {scheduler.skipped} slots skipped")
+                next_status += STATUS_INTERVAL
+    finally:
+        source.close()
+        if ring is not None:
+            ring.close()
+        print("Camera daemon stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish camera frames to a shared-memory ring")
+    parser.add_argument("--source", default=os.environ.get("CAMERA_SOURCE", "picamera2"),
+                        choices=[name for name in SOURCE_NAMES if name != "shm"])
+    parser.add_argument("--replay-path", default=os.environ.get("CAMERA_REPLAY_PATH"))
+    parser.add_argument("--name", default=os.environ.get("CAMERA_SHM_NAME", DEFAULT_SHM_NAME),
+                        help="Shared memory block name")
+    parser.add_argument("--slots", type=int, default=int(os.environ.get("CAMERA_SHM_SLOTS", "4")),
+                        help="Frames kept in the ring (readers get this many frame periods per view)")
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--camera-num", type=int, default=0)
+    args = parser.parse_args()
+
+    try:
+        source = create_camera_source(
+            args.source,
+            main_size=(args.width, args.height),
+            fps=args.fps,
+            replay_path=args.replay_path,
+            camera_num=args.camera_num,
+        )
+        run_daemon(source, args.name, args.slots, args.fps)
+    except CameraSourceError as e:
+        print(f"✗ {e}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,638 @@
+"""
+Staged camera pipeline: capture -> process -> encode.
+
+Each stage runs on its own thread, linked by bounded latest-wins queues:
+
+    capture  acquires a frame from the CameraSource (the only stage that
+             holds the camera lock) and publishes lores analysis frames
+    process  applies the color pipeline and keeps the sharpest-frame history
+    encode   JPEG-encodes every stream tier in use and publishes the result
+
+Pillow releases the GIL while processing and encoding, so the stages run in
+parallel on separate cores. A slow stage never builds up a backlog: when the
+next stage is busy, the newer item replaces the waiting one and the drop is
+counted. start/stop only wait for the capture call in progress, never for
+color processing or encoding.
+
+Capture is paced by a deadline scheduler (see frame_pacing), and the
+pipeline reports achieved fps, dropped frames and frame age, overall and for
+each connected stream.
+
+Capture is demand driven. Consumers (stream viewers, snapshot pollers, live
+analysis, recording) acquire and release the pipeline: with a consumer of
+JPEGs the camera runs at target_fps, otherwise the sensor idles at
+keep_warm_fps and frames are only color-processed into the capture history.
+JPEG encoding runs only while a consumer needs JPEGs, and only for the tiers
+in use: the ones stream viewers watch, plus the full-resolution default tier
+while recording or serving snapshots. Acquiring wakes the capture thread
+immediately, so a new viewer does not wait out an idle frame.
+
+Starting and stopping go through a lifecycle state machine (see
+CAMERA_STATES) run by its own thread: request_start()/request_stop() only
+record the wanted state and return at once, so opening the sensor and
+waiting out its warm-up never blocks the caller (the API's event loop).
+status() and wait_for_state() (or wait_for_state_async(), which parks no
+thread) tell clients when the first frame is ready.
+
+Frame buffers are reused rather than allocated per frame (see frame_pool):
+the capture stage copies each sensor frame once into a pooled buffer, which
+goes back to the pool once processed or dropped, and Pillow's intermediate
+images come from its block cache (configured once per process, see
+frame_pool.configure_pillow_blocks). metrics() reports allocations per frame.
+"""
+
+import asyncio
+import threading
+import time
+
+from color_pipeline import process_frame_image
+from frame_broadcaster import FrameBroadcaster
+from frame_history import FrameHistory
+from frame_pacing import AgeStats, FrameScheduler, RateMeter
+from frame_pool import FramePool, pillow_block_stats
+from live_analysis import LiveAnalyzer
+from stream_quality import DEFAULT_TIER, TierSubscriptions, encode_tiers
+
+# stream: MJPEG/WebSocket viewers; snapshot: polling clients (full-resolution JPEG);
+# analysis: live classification; recording: segment recorder
+CONSUMER_KINDS = ("stream", "snapshot", "analysis", "recording")
+
+# stopped -> starting (opening the source) -> warming (capturing, discarding frames
+# until the sensor settles and the first frame is processed) -> streaming
+# -> stopping (closing the source) -> stopped
+CAMERA_STATES = ("stopped", "starting", "warming", "streaming", "stopping")
+
+
+class LatestQueue:
+    """
+    Single-slot hand-off between stages; a new item replaces an unconsumed one.
+    on_drop(item) is called for every item replaced or cleared unconsumed.
+    """
+
+    def __init__(self, on_drop=None):
+        self._condition = threading.Condition()
+        self._item = None
+        self._has_item = False
+        self.dropped = 0
+        self.on_drop = on_drop
+
+    def put(self, item):
+        with self._condition:
+            if self._has_item:
+                self.dropped += 1
+                if self.on_drop is not None:
+                    self.on_drop(self._item)
+            self._item = item
+            self._has_item = True
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """Return the waiting item, or None if nothing arrives within timeout"""
+        with self._condition:
+            if not self._has_item:
+                self._condition.wait(timeout)
+                if not self._has_item:
+                    return None
+            item = self._item
+            self._item = None
+            self._has_item = False
+            return item
+
+    def clear(self):
+        with self._condition:
+            if self._has_item and self.on_drop is not None:
+                self.on_drop(self._item)
+            self._item = None
+            self._has_item = False
+
+
+class StageStats:
+    """Running timing statistics for one pipeline stage"""
+
+    def __init__(self, smoothing=0.1):
+        self.smoothing = smoothing
+        self.count = 0
+        self.avg_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, seconds):
+        ms = seconds * 1000.0
+        self.avg_ms = ms if self.count == 0 else self.avg_ms + self.smoothing * (ms - self.avg_ms)
+        self.max_ms = max(self.max_ms, ms)
+        self.count += 1
+
+    def snapshot(self):
+        return {"frames": self.count, "avg_ms": round(self.avg_ms, 3), "max_ms": round(self.max_ms, 3)}
+
+
+class CameraPipeline:
+    """
+    Owns one camera source and its capture, processing, encoding and fan-out.
+    Pipelines share no state or locks, so several cameras run side by side.
+    """
+
+    def __init__(self, source_factory, classify_fn, target_fps=30, history_frames=15, analysis_fps=2.0,
+                 keep_warm_fps=2.0, recorder=None, frame_pool_size=4, name="camera"):
+        """
+        source_factory() returns an unopened CameraSource; classify_fn takes an
+        RGB uint8 array and returns a detection result (for live analysis).
+        recorder is an optional FrameRecorder for the published JPEG frames.
+        frame_pool_size is the number of preallocated sensor frame buffers;
+        more than the frames in flight (capture, queued, processing) only
+        costs memory. name identifies the camera in thread names and metrics.
+        """
+        self.name = name
+        self.source_factory = source_factory
+        self.target_fps = target_fps
+        self.analysis_fps = analysis_fps
+        self.keep_warm_fps = keep_warm_fps
+
+        self.source = None
+        self.streaming = False
+        # Guards the source's lifecycle and capture calls only
+        self.lock = threading.Lock()
+        self._active = threading.Event()
+
+        # Lifecycle state (see CAMERA_STATES), changed under _state_condition
+        self.state = "stopped"
+        self.state_since = time.time()
+        self.last_error = None
+        self.startup_ms = None
+        self._state_condition = threading.Condition()
+        self._start_requested_at = None
+        self._want_running = False
+        self._lifecycle_pending = False
+        self._lifecycle_thread = None
+        self._warm_until = 0.0
+        # event loop -> asyncio.Event shared by every async status waiter on that loop
+        self._async_state_events = {}
+
+        # Latest encoded JPEG, published once per captured frame with a sequence number
+        self.broadcaster = FrameBroadcaster()
+        self.analysis_broadcaster = FrameBroadcaster()
+        self.live_analyzer = LiveAnalyzer(self.analysis_broadcaster, classify_fn, name=name)
+        self.history = FrameHistory(capacity=history_frames)
+        self.recorder = recorder
+        # Stream clients per quality tier; each tier in use is encoded once per frame (see jpeg_tiers)
+        self.tier_subscriptions = TierSubscriptions()
+        # Active consumers by kind; they decide capture rate and whether to encode
+        self.consumers = {kind: 0 for kind in CONSUMER_KINDS}
+        self._consumers_lock = threading.Lock()
+        self._demand_changed = threading.Event()
+        # kind -> monotonic expiry of a consumer held for polling clients (see lease)
+        self._leases = {}
+        # StreamStats of connected stream clients, by id
+        self.streams = {}
+
+        # Pillow's block cache is process wide; main sizes it once for all cameras
+        self.frame_pool = FramePool(frame_pool_size)
+        self._pillow_baseline = pillow_block_stats()
+
+        self._process_queue = LatestQueue(on_drop=self._release_captured)
+        self._encode_queue = LatestQueue()
+        self.stage_stats = {
+            "capture": StageStats(),
+            "process": StageStats(),
+            "encode": StageStats(),
+        }
+        self.scheduler = FrameScheduler(target_fps)
+        self.capture_rate = RateMeter()
+        self.publish_rate = RateMeter()
+        self.frame_age = AgeStats()
+        self._threads = []
+
+    @property
+    def viewers(self):
+        return self.consumers["stream"]
+
+    def acquire(self, kind):
+        """Register a consumer of `kind` (see CONSUMER_KINDS)"""
+        with self._consumers_lock:
+            self.consumers[kind] += 1
+        self._demand_changed.set()
+
+    def release(self, kind):
+        with self._consumers_lock:
+            self.consumers[kind] = max(0, self.consumers[kind] - 1)
+        self._demand_changed.set()
+
+    def lease(self, kind, seconds):
+        """
+        Hold one consumer of `kind` until `seconds` after the latest call, for
+        clients that poll instead of staying connected. Returns True if this
+        call newly activated the lease.
+        """
+        with self._consumers_lock:
+            activated = kind not in self._leases
+            if activated:
+                self.consumers[kind] += 1
+            self._leases[kind] = max(self._leases.get(kind, 0.0), time.monotonic() + seconds)
+        if activated:
+            self._demand_changed.set()
+        return activated
+
+    def _expire_leases(self):
+        now = time.monotonic()
+        with self._consumers_lock:
+            expired = [kind for kind, expires in self._leases.items() if expires <= now]
+            for kind in expired:
+                del self._leases[kind]
+                self.consumers[kind] = max(0, self.consumers[kind] - 1)
+        if expired:
+            self._demand_changed.set()
+
+    def wants_jpeg(self):
+        return any(self.consumers[kind] > 0 for kind in ("stream", "snapshot", "recording"))
+
+    def jpeg_tiers(self):
+        """Tiers to encode: every watched stream tier, plus the default one for recording and snapshots"""
+        tiers = set(self.tier_subscriptions.active())
+        if self.consumers["snapshot"] > 0 or self.consumers["recording"] > 0:
+            tiers.add(DEFAULT_TIER)
+        return tiers
+
+    def demanded_fps(self):
+        """Capture rate for the current consumers"""
+        if self.wants_jpeg():
+            return self.target_fps
+        if self.consumers["analysis"] > 0:
+            return max(self.keep_warm_fps, self.analysis_fps)
+        return self.keep_warm_fps
+
+    @property
+    def mode(self):
+        if not self.streaming:
+            return "stopped"
+        return "active" if self.wants_jpeg() else "keep_warm"
+
+    def start_analysis(self):
+        """Start live classification of the lores stream (an analysis consumer)"""
+        if self.live_analyzer.running:
+            return
+        self.live_analyzer.start()
+        self.acquire("analysis")
+
+    def stop_analysis(self):
+        if not self.live_analyzer.running:
+            return
+        self.live_analyzer.stop()
+        self.release("analysis")
+
+    def start_recording(self):
+        """Start writing published frames to disk (a recording consumer)"""
+        if self.recorder is None or self.recorder.running:
+            return
+        self.recorder.start(self.broadcaster)
+        self.acquire("recording")
+
+    def stop_recording(self):
+        if self.recorder is None or not self.recorder.running:
+            return
+        self.recorder.stop()
+        self.release("recording")
+
+    def _set_state(self, state, expected=None):
+        """Move to `state` (only from `expected`, if given); returns True if it changed"""
+        with self._state_condition:
+            if expected is not None and self.state != expected:
+                return False
+            self.state = state
+            self.state_since = time.time()
+            if state == "streaming" and self._start_requested_at is not None:
+                self.startup_ms = round((time.monotonic() - self._start_requested_at) * 1000, 1)
+                self._start_requested_at = None
+            self._state_condition.notify_all()
+            self._notify_async_state()
+        return True
+
+    def _notify_async_state(self):
+        """Wake async status waiters on every registered loop (caller holds _state_condition)"""
+        for loop in list(self._async_state_events):
+            if loop.is_closed():
+                del self._async_state_events[loop]
+                continue
+            loop.call_soon_threadsafe(self._set_async_state_event, loop)
+
+    def _set_async_state_event(self, loop):
+        """Runs on the waiters' loop: release them and let the next wait register a fresh event"""
+        with self._state_condition:
+            event = self._async_state_events.pop(loop, None)
+        if event is not None:
+            event.set()
+
+    def request_start(self):
+        """Start the camera in the background; returns status() right away"""
+        return self._request(True)
+
+    def request_stop(self):
+        """Stop the camera in the background; returns status() right away"""
+        return self._request(False)
+
+    def _request(self, running):
+        with self._state_condition:
+            self._want_running = running
+            self._lifecycle_pending = True
+            if running and self.state not in ("warming", "streaming"):
+                self.last_error = None
+                self.startup_ms = None
+                if self._start_requested_at is None:
+                    self._start_requested_at = time.monotonic()
+            # Report the transition straight away; the lifecycle thread does the work
+            if running and self.state == "stopped":
+                self._set_state("starting")
+            elif not running and self.state != "stopped":
+                self._set_state("stopping")
+            self._state_condition.notify_all()
+            if self._lifecycle_thread is None:
+                self._lifecycle_thread = threading.Thread(
+                    target=self._lifecycle_loop, name=f"{self.name}-lifecycle", daemon=True
+                )
+                self._lifecycle_thread.start()
+        return self.status()
+
+    def _lifecycle_loop(self):
+        """Apply the latest start/stop request; requests made meanwhile are applied next"""
+        while True:
+            with self._state_condition:
+                while not self._lifecycle_pending:
+                    self._state_condition.wait()
+                self._lifecycle_pending = False
+                want_running = self._want_running
+            try:
+                if want_running and self.state not in ("warming", "streaming"):
+                    self.start()
+                elif not want_running and (self.state != "stopped" or self.source is not None):
+                    self.stop()
+            except Exception as e:
+                # start() has recorded the error and gone back to stopped
+                print(f"Camera lifecycle error: {e}")
+
+    def wait_for_state(self, states, timeout):
+        """Block until the state is one of `states` or timeout passes; returns status()"""
+        with self._state_condition:
+            self._state_condition.wait_for(lambda: self.state in states, timeout=timeout)
+        return self.status()
+
+    async def wait_for_state_async(self, states, timeout):
+        """Async version of wait_for_state; never blocks the event loop or uses a thread"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            with self._state_condition:
+                if self.state in states:
+                    break
+                event = self._async_state_events.get(loop)
+                if event is None:
+                    event = asyncio.Event()
+                    self._async_state_events[loop] = event
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(event.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        return self.status()
+
+    def status(self):
+        with self._state_condition:
+            state, since, error = self.state, self.state_since, self.last_error
+        source = self.source
+        return {
+            "camera_id": self.name,
+            "state": state,
+            "ready": state == "streaming",
+            "since": since,
+            "error": error,
+            "startup_ms": self.startup_ms,
+            "camera": source.info() if source is not None else None,
+        }
+
+    def _ensure_threads(self):
+        if self._threads:
+            return
+        for name, target in (("capture", self._capture_loop),
+                             ("process", self._process_loop),
+                             ("encode", self._encode_loop)):
+            thread = threading.Thread(target=target, name=f"{self.name}-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def start(self):
+        """
+        Open the source if needed and start capturing (blocks while the source
+        is opened; prefer request_start). The state reaches "streaming" once
+        the first frame has been processed.
+        """
+        if self.streaming and self.state in ("warming", "streaming"):
+            return
+        if self._start_requested_at is None:
+            self._start_requested_at = time.monotonic()
+        self._set_state("starting")
+        try:
+            with self.lock:
+                if self.source is None:
+                    source = self.source_factory()
+                    source.open()
+                    self.source = source
+                    self.scheduler.set_fps(source.fps)
+                    self._warm_until = time.monotonic() + source.warmup_seconds
+                self.streaming = True
+                # Reset frame buffer
+                self.broadcaster.clear()
+        except Exception as e:
+            with self._state_condition:
+                self.last_error = str(e)
+                self._want_running = False
+            self._start_requested_at = None
+            self._set_state("stopped")
+            raise
+        self._set_state("warming")
+        self._ensure_threads()
+        self._active.set()
+
+    def stop(self):
+        """Stop streaming and release the source (prefer request_stop)"""
+        self._set_state("stopping")
+        self.streaming = False
+        self._active.clear()
+        self.scheduler.reset()
+        self.broadcaster.clear()
+
+        with self.lock:
+            if self.source is not None:
+                self.source.close()
+                self.source = None
+
+        self.analysis_broadcaster.clear()
+        self.history.clear()
+        self._process_queue.clear()
+        self._encode_queue.clear()
+        self._set_state("stopped")
+
+    def _release_captured(self, captured):
+        self.frame_pool.release(captured.main)
+
+    def _capture_loop(self):
+        next_analysis_time = 0.0
+        while True:
+            self._expire_leases()
+            if not self._active.wait(timeout=0.5):
+                continue
+            fps = self.demanded_fps()
+            if fps != self.scheduler.fps:
+                # Full rate while someone watches or records, keep-warm rate otherwise
+                self.scheduler.set_fps(fps)
+                with self.lock:
+                    if self.source is not None:
+                        self.source.set_frame_rate(fps)
+            # Sleep until this frame's deadline (skipping slots we are already late
+            # for); a new consumer cuts the sleep short
+            self.scheduler.wait(self._demand_changed)
+            if self.demanded_fps() != self.scheduler.fps:
+                # Woken by a consumer change: switch rate before the next capture
+                continue
+            try:
+                with self.lock:
+                    if self.source is None or not self.streaming:
+                        continue
+                    started = time.perf_counter()
+                    # Analysis path: small lores frame at its own (lower) rate
+                    now = time.monotonic()
+                    want_lores = self.live_analyzer.running and now >= next_analysis_time
+                    shape = self.source.frame_shape
+                    buffer = self.frame_pool.acquire(shape) if shape is not None else None
+                    try:
+                        captured = self.source.capture(want_lores=want_lores, out=buffer)
+                    except Exception:
+                        if buffer is not None:
+                            self.frame_pool.release(buffer)
+                        raise
+                if buffer is not None and captured.main is not buffer:
+                    # The source handed out its own array (e.g. preloaded replay frames)
+                    self.frame_pool.release(buffer)
+                if now < self._warm_until:
+                    # Auto exposure and white balance still settling: discard
+                    self._release_captured(captured)
+                    continue
+                self.stage_stats["capture"].record(time.perf_counter() - started)
+                self.capture_rate.tick()
+
+                if captured.lores is not None:
+                    next_analysis_time = now + 1.0 / self.analysis_fps
+                    self.analysis_broadcaster.publish(captured.lores, timestamp=captured.timestamp)
+
+                self._process_queue.put(captured)
+            except Exception as e:
+                print(f"Camera capture error: {e}")
+                import traceback
+                traceback.print_exc()
+                time.sleep(0.1)
+
+    def _process_loop(self):
+        while True:
+            captured = self._process_queue.get(timeout=0.5)
+            if captured is None:
+                continue
+            try:
+                started = time.perf_counter()
+                # Color LUTs applied straight from the sensor buffer
+                try:
+                    image = process_frame_image(captured.main)
+                finally:
+                    # The corrected image is a copy; the sensor buffer can be reused
+                    self._release_captured(captured)
+                # Pasted straight into the preallocated history slot
+                self.history.push_image(image, captured.timestamp)
+                self.stage_stats["process"].record(time.perf_counter() - started)
+                # First frame since start: the camera is ready
+                self._set_state("streaming", expected="warming")
+
+                # Skip JPEG encoding entirely while nobody needs JPEGs
+                if self.wants_jpeg():
+                    self._encode_queue.put((image, captured.timestamp))
+            except Exception as e:
+                print(f"Camera processing error: {e}")
+
+    def _encode_loop(self):
+        while True:
+            item = self._encode_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            image, timestamp = item
+            try:
+                started = time.perf_counter()
+                # Convert to JPEG, once per quality tier in use
+                variants = encode_tiers(image, self.jpeg_tiers())
+                self.stage_stats["encode"].record(time.perf_counter() - started)
+
+                if self.streaming and variants:
+                    # Publish once; stream clients wake up on the new sequence number
+                    self.broadcaster.publish(variants.get(DEFAULT_TIER), timestamp=timestamp, variants=variants)
+                    self.publish_rate.tick()
+                    self.frame_age.record(timestamp)
+            except Exception as e:
+                print(f"Camera encoding error: {e}")
+
+    def add_stream(self, stats):
+        """Register a connected stream client's StreamStats for metrics()"""
+        self.streams[stats.id] = stats
+
+    def remove_stream(self, stats):
+        self.streams.pop(stats.id, None)
+
+    def metrics(self):
+        return {
+            "camera": self.name,
+            "streaming": self.streaming,
+            "state": self.state,
+            "mode": self.mode,
+            "consumers": dict(self.consumers),
+            "viewers": self.viewers,
+            "target_fps": self.target_fps,
+            "keep_warm_fps": self.keep_warm_fps,
+            "capture_fps": round(self.capture_rate.fps, 2),
+            "published_fps": round(self.publish_rate.fps, 2),
+            "frames_published": self.broadcaster.sequence,
+            # Capture timestamp to publish of the encoded frame
+            "frame_age": self.frame_age.snapshot(),
+            "stages": {name: stats.snapshot() for name, stats in self.stage_stats.items()},
+            "dropped": {
+                "capture_deadline": self.scheduler.skipped,
+                "process_queue": self._process_queue.dropped,
+                "encode_queue": self._encode_queue.dropped,
+            },
+            "streams": [stats.snapshot() for stats in list(self.streams.values())],
+            "stream_tiers": self.tier_subscriptions.counts(),
+            "frame_history": self.history.stats(),
+            "buffers": self.buffer_stats(),
+        }
+
+    def buffer_stats(self):
+        """
+        Frame pool usage and fresh buffer allocations per processed frame.
+        Pillow's counters are process wide, so image work outside the
+        pipeline (uploads, snapshots) is included in them.
+        """
+        frames = self.stage_stats["process"].count
+        history = self.history.stats()
+        pillow = pillow_block_stats()
+        pillow_allocated = pillow["allocated_blocks"] - self._pillow_baseline["allocated_blocks"]
+        pillow_reused = pillow["reused_blocks"] - self._pillow_baseline["reused_blocks"]
+        pool = self.frame_pool.stats()
+        return {
+            "frame_pool": pool,
+            "pillow_blocks": {
+                "allocated": pillow_allocated,
+                "reused": pillow_reused,
+                "cached": pillow["blocks_cached"],
+            },
+            "frame_history": history,
+            "frames": frames,
+            "allocations_per_frame": {
+                "frame_pool": round(pool["allocated"] / frames, 3) if frames else None,
+                "pillow": round(pillow_allocated / frames, 3) if frames else None,
+                # Frames copied into the history through a temporary array
+                "frame_history": round(history["fallback_copies"] / frames, 3) if frames else None,
+            },
+        }
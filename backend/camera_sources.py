@@ -0,0 +1,485 @@
+"""
+Camera sources for the capture pipeline.
+
+The capture thread only talks to the CameraSource interface, so the API can
+run on a Raspberry Pi camera or, for benchmarks, CI and development laptops,
+on hardware-free sources:
+
+- Picamera2Source: the Pi camera (main preview stream plus optional lores
+  analysis stream).
+- SyntheticSource: a moving color-bar test pattern at a target fps.
+- ReplaySource: plays a directory of images or an MJPEG file at a target fps.
+- SharedMemorySource: reads frames published by camera_daemon.py, so the
+  camera can belong to a separate process.
+
+Select one with create_camera_source(name, ...); the API reads the name
+from the CAMERA_SOURCE environment variable, or a list of cameras with ids
+from CAMERAS (see parse_camera_configs).
+"""
+
+import glob
+import io
+import os
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image
+
+from color_pipeline import lores_to_rgb
+from shared_frames import DEFAULT_SHM_NAME, SharedFrameRing
+
+# Add system dist-packages to path for picamera2
+if '/usr/lib/python3/dist-packages' not in sys.path:
+    sys.path.insert(0, '/usr/lib/python3/dist-packages')
+
+# Try to import picamera2
+try:
+    from picamera2 import MappedArray, Picamera2
+    PICAMERA2_AVAILABLE = True
+except ImportError:
+    PICAMERA2_AVAILABLE = False
+
+# main: raw frame for the preview path (BGRX or RGB layout, see color_pipeline)
+# lores: RGB uint8 array sized for analysis, or None if not requested/available
+CapturedFrame = namedtuple("CapturedFrame", ["main", "lores", "timestamp"])
+
+SOURCE_NAMES = ("picamera2", "synthetic", "replay", "shm")
+
+# One camera of the rig: id used in the API, source name and its source-specific argument
+CameraConfig = namedtuple("CameraConfig", ["id", "source", "camera_num", "replay_path", "shm_name"])
+
+
+class CameraSourceError(Exception):
+    """Raised when a camera source cannot be opened"""
+
+
+class CameraSource:
+    """Interface for camera backends used by the capture thread"""
+
+    name = "base"
+    # Frames captured this long after open() are discarded while auto exposure
+    # and white balance settle
+    warmup_seconds = 0.0
+
+    def __init__(self, main_size=(640, 480), lores_size=None, fps=30):
+        self.main_size = main_size
+        self.lores_size = lores_size
+        self.fps = fps
+        # Set by open(): None when no analysis stream is available
+        self.lores_format = None
+        # Set by open() for sources that can fill a caller's buffer: (height, width, channels)
+        self.frame_shape = None
+
+    def open(self):
+        """Configure and start the source (may block while the sensor is configured)"""
+        raise NotImplementedError
+
+    def capture(self, want_lores=False, out=None):
+        """
+        Block until the next frame and return a CapturedFrame. `out` is an
+        optional preallocated uint8 array of frame_shape to copy the main
+        frame into; sources that cannot use it return their own array.
+        """
+        raise NotImplementedError
+
+    def set_frame_rate(self, fps):
+        """Change the delivered frame rate (used to idle the sensor between viewers)"""
+        self.fps = fps
+
+    def close(self):
+        """Stop the source and release its resources"""
+
+    def info(self):
+        return {
+            "source": self.name,
+            "main_size": self.main_size,
+            "lores_size": self.lores_size if self.lores_format else None,
+            "lores_format": self.lores_format,
+        }
+
+
+class _PacedSource(CameraSource):
+    """Base for simulated sources: deliver frames on a fixed fps clock like a sensor"""
+
+    def __init__(self, main_size=(640, 480), lores_size=None, fps=30):
+        super().__init__(main_size, lores_size, fps)
+        self._next_frame_time = None
+
+    def set_frame_rate(self, fps):
+        super().set_frame_rate(fps)
+        self._next_frame_time = None
+
+    def _wait_for_next_frame(self):
+        now = time.monotonic()
+        if self._next_frame_time is None or now - self._next_frame_time > 1.0:
+            self._next_frame_time = now
+        delay = self._next_frame_time - now
+        if delay > 0:
+            time.sleep(delay)
+        self._next_frame_time += 1.0 / self.fps
+
+
+class Picamera2Source(CameraSource):
+    """Raspberry Pi camera via Picamera2"""
+
+    name = "picamera2"
+    warmup_seconds = 1.5
+
+    def __init__(self, main_size=(640, 480), lores_size=None, fps=30, camera_num=0):
+        super().__init__(main_size, lores_size, fps)
+        self.camera_num = camera_num
+        self.camera = None
+
+    def _configure(self):
+        """
+        Configure the preview (main) stream plus, when the ISP supports it, a
+        lores stream for analysis. RGB lores works on Pi 5; older ISPs only
+        produce YUV420 lores.
+        """
+        if self.lores_size:
+            for lores_format in ("RGB888", "YUV420"):
+                try:
+                    config = self.camera.create_preview_configuration(
+                        main={"size": self.main_size, "format": "RGB888"},
+                        lores={"size": self.lores_size, "format": lores_format},
+                        colour_space="sRGB"
+                    )
+                    self.camera.configure(config)
+                    self.lores_format = lores_format
+                    return
+                except Exception:
+                    continue
+            print("Warning: lores stream not supported; live analysis disabled")
+
+        try:
+            config = self.camera.create_preview_configuration(
+                main={"size": self.main_size, "format": "RGB888"},
+                colour_space="sRGB"
+            )
+            self.camera.configure(config)
+        except:
+            config = self.camera.create_preview_configuration(main={"size": self.main_size})
+            self.camera.configure(config)
+
+    def _main_shape(self):
+        """Shape of the main stream array as configured (the sensor may round the size)"""
+        main = self.camera.camera_config["main"]
+        width, height = main["size"]
+        channels = 3 if main["format"] in ("RGB888", "BGR888") else 4
+        return (height, width, channels)
+
+    def open(self):
+        if not PICAMERA2_AVAILABLE:
+            raise CameraSourceError("picamera2 not available on this system")
+
+        self.camera = Picamera2(camera_num=self.camera_num)
+        self._configure()
+
+        # Set camera controls
+        try:
+            self.camera.set_controls({
+                "AwbEnable": True,
+                "AeEnable": True,
+            })
+        except:
+            pass
+
+        self.camera.start()
+        self.frame_shape = self._main_shape()
+
+    def set_frame_rate(self, fps):
+        super().set_frame_rate(fps)
+        if self.camera is None:
+            return
+        frame_us = int(1_000_000 / fps)
+        try:
+            self.camera.set_controls({"FrameDurationLimits": (frame_us, frame_us)})
+        except Exception as e:
+            print(f"Warning: could not set camera frame rate to {fps}: {e}")
+
+    def capture(self, want_lores=False, out=None):
+        request = self.camera.capture_request()
+        try:
+            if out is not None:
+                # One copy from the mapped sensor buffer into the caller's buffer
+                with MappedArray(request, "main") as mapped:
+                    np.copyto(out, mapped.array)
+                main = out
+            else:
+                main = request.make_array("main")
+            lores = None
+            if want_lores and self.lores_format is not None:
+                lores = request.make_array("lores")
+        finally:
+            request.release()
+
+        if lores is not None:
+            lores = lores_to_rgb(lores, self.lores_format, self.lores_size)
+        return CapturedFrame(main, lores, time.time())
+
+    def close(self):
+        if self.camera is not None:
+            self.camera.stop()
+            self.camera.close()
+            self.camera = None
+
+
+class SyntheticSource(_PacedSource):
+    """Moving color-bar test pattern, delivered as 4-channel BGRX frames like XRGB8888"""
+
+    name = "synthetic"
+
+    def open(self):
+        width, height = self.main_size
+        bars = np.array([
+            [255, 255, 255], [255, 255, 0], [0, 255, 255], [0, 255, 0],
+            [255, 0, 255], [255, 0, 0], [0, 0, 255], [40, 40, 40],
+        ], dtype=np.uint8)
+        columns = bars[(np.arange(width) * len(bars)) // width]
+
+        # Bars with a vertical brightness ramp, stored B, G, R, X
+        ramp = np.linspace(1.0, 0.4, height, dtype=np.float32)[:, None, None]
+        rgb = (columns[None, :, :] * ramp).astype(np.uint8)
+        self._pattern = np.empty((height, width, 4), dtype=np.uint8)
+        self._pattern[:, :, :3] = rgb[:, :, ::-1]
+        self._pattern[:, :, 3] = 255
+
+        self._frame_index = 0
+        self.lores_format = "RGB888" if self.lores_size else None
+        self.frame_shape = self._pattern.shape
+
+    def capture(self, want_lores=False, out=None):
+        self._wait_for_next_frame()
+
+        width, height = self.main_size
+        frame = out if out is not None else np.empty_like(self._pattern)
+        np.copyto(frame, self._pattern)
+        # A square moving across the bars so consecutive frames differ
+        box = max(8, height // 6)
+        x = (self._frame_index * 4) % max(1, width - box)
+        y = (height - box) // 2
+        frame[y:y + box, x:x + box, :3] = 0
+        self._frame_index += 1
+
+        lores = None
+        if want_lores and self.lores_size:
+            image = Image.frombuffer('RGB', (width, height), frame, 'raw', 'BGRX', 0, 1)
+            lores = np.asarray(image.resize(self.lores_size, Image.Resampling.BILINEAR))
+        return CapturedFrame(frame, lores, time.time())
+
+
+class ReplaySource(_PacedSource):
+    """Replays a directory of images or an MJPEG file in a loop"""
+
+    name = "replay"
+
+    def __init__(self, path, main_size=(640, 480), lores_size=None, fps=30):
+        super().__init__(main_size, lores_size, fps)
+        self.path = path
+
+    def _load_jpegs(self):
+        """Return a list of encoded images from the directory or MJPEG file"""
+        if os.path.isdir(self.path):
+            files = []
+            for ext in ('*.jpg', '*.jpeg', '*.JPG', '*.JPEG', '*.png', '*.PNG'):
+                files.extend(glob.glob(os.path.join(self.path, ext)))
+            encoded = []
+            for file_path in sorted(files):
+                with open(file_path, 'rb') as f:
+                    encoded.append(f.read())
+            return encoded
+
+        # MJPEG: concatenated JPEGs, split on start/end of image markers
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        encoded = []
+        start = data.find(b'\xff\xd8')
+        while start != -1:
+            end = data.find(b'\xff\xd9', start)
+            if end == -1:
+                break
+            encoded.append(data[start:end + 2])
+            start = data.find(b'\xff\xd8', end + 2)
+        return encoded
+
+    def open(self):
+        if not os.path.exists(self.path):
+            raise CameraSourceError(f"Replay path not found: {self.path}")
+
+        encoded = self._load_jpegs()
+        if not encoded:
+            raise CameraSourceError(f"No frames found in {self.path}")
+
+        # Decode once up front so replay cost does not pollute pipeline timings
+        self._frames = []
+        self._lores_frames = []
+        for data in encoded:
+            try:
+                image = Image.open(io.BytesIO(data)).convert('RGB')
+            except Exception as e:
+                print(f"Replay source: skipping undecodable frame: {e}")
+                continue
+            if image.size != tuple(self.main_size):
+                image = image.resize(self.main_size, Image.Resampling.BILINEAR)
+            self._frames.append(np.asarray(image))
+            if self.lores_size:
+                self._lores_frames.append(np.asarray(image.resize(self.lores_size, Image.Resampling.BILINEAR)))
+
+        if not self._frames:
+            raise CameraSourceError(f"No decodable frames in {self.path}")
+
+        self._frame_index = 0
+        self.lores_format = "RGB888" if self.lores_size else None
+        print(f"Replay source: {len(self._frames)} frames from {self.path} at {self.fps} fps")
+
+    def capture(self, want_lores=False, out=None):
+        # Frames are decoded up front and never modified: hand out the stored array
+        self._wait_for_next_frame()
+
+        index = self._frame_index % len(self._frames)
+        self._frame_index += 1
+        lores = self._lores_frames[index] if want_lores and self._lores_frames else None
+        return CapturedFrame(self._frames[index], lores, time.time())
+
+
+class SharedMemorySource(CameraSource):
+    """Frames from the camera daemon's shared-memory ring (see shared_frames.py)"""
+
+    name = "shm"
+
+    def __init__(self, shm_name, main_size=(640, 480), lores_size=None, fps=30, frame_timeout=2.0,
+                 reattach_interval=0.5):
+        """
+        When no frame arrives for reattach_interval seconds the ring is looked
+        up by name again, so a restarted daemon's new ring is picked up.
+        """
+        super().__init__(main_size, lores_size, fps)
+        self.shm_name = shm_name
+        self.frame_timeout = frame_timeout
+        self.reattach_interval = reattach_interval
+        self.reattached = 0
+        self._ring = None
+        self._last_sequence = 0
+
+    def open(self):
+        try:
+            self._use_ring(SharedFrameRing.attach(self.shm_name))
+        except FileNotFoundError:
+            raise CameraSourceError(
+                f"No camera daemon publishing to shared memory '{self.shm_name}'. Start camera_daemon.py first"
+            )
+        self._last_sequence = self._ring.sequence
+        self.lores_format = "RGB888" if self.lores_size else None
+
+    def _use_ring(self, ring):
+        self._ring = ring
+        height, width = ring.shape[:2]
+        self.main_size = (width, height)
+        self.frame_shape = ring.shape
+
+    def _reattach(self):
+        """Switch to a ring of a new generation under our name (daemon restarted); True if switched"""
+        try:
+            ring = SharedFrameRing.attach(self.shm_name)
+        except (FileNotFoundError, ValueError, OSError):
+            # Daemon down, or its new ring not initialized yet
+            return False
+        if ring.generation == self._ring.generation:
+            ring.close()
+            return False
+        print(f"Camera daemon ring '{self.shm_name}' was recreated; re-attaching")
+        self._ring.close()
+        self._use_ring(ring)
+        self._last_sequence = 0
+        self.reattached += 1
+        return True
+
+    def capture(self, want_lores=False, out=None):
+        deadline = time.monotonic() + self.frame_timeout
+        while True:
+            # A private copy (into `out` if given): the pipeline processes the frame after the ring has moved on
+            if out is not None and out.shape != self.frame_shape:
+                out = None  # Frame size changed with the new ring; the pool adapts on the next frame
+            wait = max(0.0, min(self.reattach_interval, deadline - time.monotonic()))
+            frame = self._ring.wait_for_frame(self._last_sequence, timeout=wait, out=out)
+            if frame is not None:
+                break
+            if self._reattach():
+                continue
+            if time.monotonic() >= deadline:
+                raise CameraSourceError(f"No new frame from the camera daemon in {self.frame_timeout}s")
+        self._last_sequence = frame.sequence
+
+        lores = None
+        if want_lores and self.lores_size:
+            image = Image.fromarray(frame.array, 'RGB')
+            lores = np.asarray(image.resize(self.lores_size, Image.Resampling.BILINEAR))
+        return CapturedFrame(frame.array, lores, frame.timestamp)
+
+    def close(self):
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+
+    def info(self):
+        return {**super().info(), "shm_name": self.shm_name, "reattached": self.reattached}
+
+
+def camera_source_available(name):
+    if name == "picamera2":
+        return PICAMERA2_AVAILABLE
+    return name in SOURCE_NAMES
+
+
+def parse_camera_configs(value, default_replay_path=None, default_shm_name=None):
+    """
+    Parse a camera list such as "canopy=picamera2:0,leaves=picamera2:1".
+    Each entry is id=source[:argument]; the argument is the camera number for
+    picamera2, the path for replay and the shared memory name for shm.
+    """
+    configs = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        camera_id, separator, spec = entry.partition("=")
+        source, _, argument = spec.partition(":")
+        camera_id, source = camera_id.strip(), source.strip()
+        if not separator or not camera_id or source not in SOURCE_NAMES:
+            raise CameraSourceError(
+                f"Invalid camera entry '{entry}'. Expected id=source[:argument] with source one of {list(SOURCE_NAMES)}"
+            )
+        if any(config.id == camera_id for config in configs):
+            raise CameraSourceError(f"Duplicate camera id '{camera_id}'")
+        try:
+            camera_num = int(argument) if source == "picamera2" and argument else 0
+        except ValueError:
+            raise CameraSourceError(f"Invalid camera number in '{entry}'")
+        configs.append(CameraConfig(
+            camera_id,
+            source,
+            camera_num,
+            (argument or default_replay_path) if source == "replay" else None,
+            (argument or default_shm_name) if source == "shm" else None,
+        ))
+    if not configs:
+        raise CameraSourceError("No cameras configured")
+    return configs
+
+
+def create_camera_source(name, main_size=(640, 480), lores_size=None, fps=30,
+                         replay_path=None, camera_num=0, shm_name=None):
+    """Build a camera source by name (see SOURCE_NAMES)"""
+    if name == "picamera2":
+        return Picamera2Source(main_size, lores_size, fps, camera_num=camera_num)
+    if name == "synthetic":
+        return SyntheticSource(main_size, lores_size, fps)
+    if name == "replay":
+        if not replay_path:
+            raise CameraSourceError("Replay source needs CAMERA_REPLAY_PATH (image directory or MJPEG file)")
+        return ReplaySource(replay_path, main_size, lores_size, fps)
+    if name == "shm":
+        return SharedMemorySource(shm_name or DEFAULT_SHM_NAME, main_size, lores_size, fps)
+    raise CameraSourceError(f"Unknown camera source: {name}. Must be one of: {list(SOURCE_NAMES)}")
@@ -0,0 +1,130 @@
+"""
+Camera color pipeline.
+
+Converts raw Picamera2 frames to RGB and applies the low-light brightness
+boost and per-channel color gains in a single lookup-table pass:
+
+- Channel reordering is done by Pillow's raw unpacker straight from the
+  sensor buffer (XRGB8888 arrives as B, G, R, X bytes), with no intermediate
+  NumPy arrays.
+- Brightness boost and per-channel gains are folded into two precomputed
+  3x256-entry tables (normal and low-light), applied with Image.point.
+- The low-light decision uses the exact frame mean computed from the
+  256-bin histogram instead of a float reduction over every pixel.
+
+The tables are built by running the original ImageEnhance operations over a
+0..255 ramp, so the output is pixel-identical to the previous
+split/enhance/merge implementation.
+"""
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+# Frames darker than this mean brightness get the low-light boost
+LOW_LIGHT_THRESHOLD = 30
+LOW_LIGHT_BOOST = 1.3
+
+# Very minimal color correction (R, G, B)
+CHANNEL_GAINS = (1.01, 1.00, 0.98)
+
+_HISTOGRAM_WEIGHTS = np.tile(np.arange(256, dtype=np.int64), 3)
+
+
+def _brightness_table(values, factor):
+    """Apply ImageEnhance.Brightness to a list of 8-bit values"""
+    ramp = Image.frombytes('L', (len(values), 1), bytes(values))
+    return list(ImageEnhance.Brightness(ramp).enhance(factor).tobytes())
+
+
+def build_color_luts(gains=CHANNEL_GAINS, boost=LOW_LIGHT_BOOST):
+    """
+    Build the flattened 768-entry (R, G, B) tables used by Image.point.
+    Returns (normal_lut, low_light_lut).
+    """
+    identity = list(range(256))
+    boosted = _brightness_table(identity, boost)
+
+    normal_lut = []
+    low_light_lut = []
+    for gain in gains:
+        normal_lut.extend(_brightness_table(identity, gain))
+        low_light_lut.extend(_brightness_table(boosted, gain))
+    return normal_lut, low_light_lut
+
+
+NORMAL_LUT, LOW_LIGHT_LUT = build_color_luts()
+
+
+def frame_to_image(frame):
+    """Wrap a camera frame as an RGB PIL image, reordering 4-channel BGRX frames while unpacking"""
+    if not frame.flags.c_contiguous:
+        frame = np.ascontiguousarray(frame)
+    height, width = frame.shape[:2]
+
+    if frame.ndim == 3 and frame.shape[2] == 4:
+        return Image.frombuffer('RGB', (width, height), frame, 'raw', 'BGRX', 0, 1)
+    if frame.ndim == 3 and frame.shape[2] == 3:
+        return Image.frombuffer('RGB', (width, height), frame, 'raw', 'RGB', 0, 1)
+    return Image.fromarray(frame).convert('RGB')
+
+
+def convert_frame_to_rgb(frame):
+    """Convert camera frame to an RGB array"""
+    if frame.ndim == 3 and frame.shape[2] == 4:
+        # Channels are B, G, R, X in memory; a reversed slice is a view
+        return frame[:, :, 2::-1]
+    return frame
+
+
+def yuv420_to_rgb(yuv, width, height):
+    """
+    Convert a planar YUV420 (I420) array, as returned by make_array for a
+    YUV420 stream, to RGB using the full-range BT.601 (JPEG) matrix.
+    """
+    stride = yuv.shape[1]
+    y = yuv[:height, :width].astype(np.float32)
+
+    chroma = yuv[height:height + height // 2].reshape(-1)
+    plane_size = (height // 2) * (stride // 2)
+    u = chroma[:plane_size].reshape(height // 2, stride // 2)[:, :width // 2]
+    v = chroma[plane_size:2 * plane_size].reshape(height // 2, stride // 2)[:, :width // 2]
+
+    # Chroma is subsampled 2x2; upsample by repetition
+    u = u.repeat(2, axis=0).repeat(2, axis=1)[:height, :width].astype(np.float32) - 128.0
+    v = v.repeat(2, axis=0).repeat(2, axis=1)[:height, :width].astype(np.float32) - 128.0
+
+    rgb = np.empty((height, width, 3), dtype=np.float32)
+    rgb[:, :, 0] = y + 1.402 * v
+    rgb[:, :, 1] = y - 0.344136 * u - 0.714136 * v
+    rgb[:, :, 2] = y + 1.772 * u
+    return np.clip(rgb, 0, 255).astype(np.uint8)
+
+
+def lores_to_rgb(frame, stream_format, size):
+    """Convert a lores stream array to an RGB array; size is (width, height)"""
+    if stream_format == "YUV420":
+        return yuv420_to_rgb(frame, size[0], size[1])
+    return np.ascontiguousarray(convert_frame_to_rgb(frame)[:size[1], :size[0]])
+
+
+def mean_brightness(image):
+    """Exact mean over all RGB channels, from the image histogram"""
+    histogram = np.asarray(image.histogram(), dtype=np.int64)
+    return int(histogram @ _HISTOGRAM_WEIGHTS) / (image.width * image.height * 3)
+
+
+def color_correct(image):
+    """Apply the low-light boost (if dark) and channel gains to an RGB PIL image"""
+    if mean_brightness(image) < LOW_LIGHT_THRESHOLD:
+        return image.point(LOW_LIGHT_LUT)
+    return image.point(NORMAL_LUT)
+
+
+def process_frame_image(frame):
+    """Color-correct a camera frame and return it as an RGB PIL image"""
+    return color_correct(frame_to_image(frame))
+
+
+def process_frame(frame):
+    """Apply minimal post-processing for natural look; returns an RGB array"""
+    return np.asarray(process_frame_image(frame))
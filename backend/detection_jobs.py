@@ -0,0 +1,284 @@
+"""
+Asynchronous detection jobs for Agri ROBO.
+
+A job scores a set of images (uploaded files or a server-side directory) on a
+bounded worker pool. Each job lives in its own directory under jobs_dir:
+
+    job.json        status and progress (rewritten atomically after every batch)
+    items.json      the image paths to score, in order
+    results.ndjson  one JSON result per image, appended as each batch completes
+    inputs/         uploaded images (only for upload jobs)
+
+Because everything is on disk, unfinished jobs are resumed from the last
+completed batch when the backend restarts.
+
+Job dicts are shared between the API and the workers; their status and
+progress only change under JobManager._lock.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+
+class JobLimitError(Exception):
+    """Raised when too many jobs are already queued or running"""
+
+
+def find_images(directory):
+    """Recursively list image files under a directory, sorted for stable ordering"""
+    image_paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                image_paths.append(os.path.join(root, name))
+    return image_paths
+
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class JobManager:
+    """Runs detection jobs on a bounded thread pool with on-disk state"""
+
+    def __init__(self, jobs_dir, score_fn, max_workers=2, batch_size=16, max_active_jobs=16):
+        """
+        score_fn takes a list of RGB PIL images and returns one result dict per
+        image (see inference.summarize_prediction).
+        """
+        self.jobs_dir = jobs_dir
+        self.score_fn = score_fn
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.max_active_jobs = max_active_jobs
+
+        self._jobs = {}
+        self._cancel_events = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._executor = None
+
+    def start(self):
+        """Load jobs from disk and resume any that did not finish"""
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self._stopping.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="detection-job")
+
+        resumed = 0
+        for job_id in sorted(os.listdir(self.jobs_dir)):
+            job_path = os.path.join(self.jobs_dir, job_id, "job.json")
+            if not os.path.exists(job_path):
+                continue
+            try:
+                with open(job_path, 'r') as f:
+                    job = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Skipping unreadable job {job_id}: {e}")
+                continue
+
+            self._jobs[job_id] = job
+            if job["status"] not in FINISHED_STATES:
+                job["status"] = JOB_QUEUED
+                self._enqueue(job_id)
+                resumed += 1
+
+        if resumed:
+            print(f"Resumed {resumed} unfinished detection job(s)")
+
+    def shutdown(self):
+        """Stop workers between batches; unfinished jobs resume on next start"""
+        self._stopping.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _job_dir(self, job_id):
+        return os.path.join(self.jobs_dir, job_id)
+
+    def results_path(self, job_id):
+        return os.path.join(self._job_dir(job_id), "results.ndjson")
+
+    def new_job_dir(self):
+        """Create an empty job directory (for saving uploads) and return (job_id, inputs_dir)"""
+        job_id = uuid.uuid4().hex[:12]
+        inputs_dir = os.path.join(self._job_dir(job_id), "inputs")
+        os.makedirs(inputs_dir, exist_ok=True)
+        return job_id, inputs_dir
+
+    def discard_job_dir(self, job_id):
+        """Remove a directory from new_job_dir() whose job was never submitted"""
+        with self._lock:
+            if job_id in self._jobs:
+                return
+        shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+
+    def submit(self, image_paths, source, job_id=None):
+        """Create a job for the given image paths and queue it"""
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if job["status"] not in FINISHED_STATES)
+            if active >= self.max_active_jobs:
+                raise JobLimitError(f"Too many active jobs ({active}). Try again later.")
+
+            if job_id is None:
+                job_id = uuid.uuid4().hex[:12]
+            os.makedirs(self._job_dir(job_id), exist_ok=True)
+
+            _write_json_atomic(os.path.join(self._job_dir(job_id), "items.json"), list(image_paths))
+            open(self.results_path(job_id), 'wb').close()
+
+            job = {
+                "id": job_id,
+                "status": JOB_QUEUED,
+                "source": source,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "total": len(image_paths),
+                "processed": 0,
+                "failed": 0,
+                "error": None,
+            }
+            self._jobs[job_id] = job
+            self._save(job)
+
+        self._enqueue(job_id)
+        return dict(job)
+
+    def _enqueue(self, job_id):
+        self._cancel_events[job_id] = threading.Event()
+        self._executor.submit(self._run, job_id)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def list(self):
+        with self._lock:
+            jobs = [dict(job) for job in self._jobs.values()]
+        return sorted(jobs, key=lambda j: j["created_at"], reverse=True)
+
+    def cancel(self, job_id):
+        """Request cancellation; takes effect before the job's next batch"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] not in FINISHED_STATES:
+                event = self._cancel_events.get(job_id)
+                if event is not None:
+                    event.set()
+                if job["status"] == JOB_QUEUED:
+                    self._finish(job, JOB_CANCELLED)
+            return dict(job)
+
+    def _save(self, job):
+        _write_json_atomic(os.path.join(self._job_dir(job["id"]), "job.json"), job)
+
+    def _finish(self, job, status, error=None):
+        """Record the final status (caller holds self._lock)"""
+        job["status"] = status
+        job["error"] = error
+        job["finished_at"] = time.time()
+        self._save(job)
+
+    def _completed_results(self, job_id):
+        """Count complete result lines, dropping a partial line left by a crash"""
+        path = self.results_path(job_id)
+        if not os.path.exists(path):
+            return 0
+        with open(path, 'rb') as f:
+            data = f.read()
+        complete = data[:data.rfind(b'\n') + 1]
+        if len(complete) != len(data):
+            with open(path, 'r+b') as f:
+                f.truncate(len(complete))
+        return complete.count(b'\n')
+
+    def _run(self, job_id):
+        with self._lock:
+            job = self._jobs[job_id]
+            cancel_event = self._cancel_events[job_id]
+            if job["status"] in FINISHED_STATES:
+                return
+
+        try:
+            with open(os.path.join(self._job_dir(job_id), "items.json"), 'r') as f:
+                image_paths = json.load(f)
+            processed = self._completed_results(job_id)
+
+            with self._lock:
+                # Cancelled while still queued
+                if job["status"] in FINISHED_STATES:
+                    return
+                job["processed"] = processed
+                job["status"] = JOB_RUNNING
+                job["started_at"] = job["started_at"] or time.time()
+                self._save(job)
+
+            with open(self.results_path(job_id), 'a') as results_file:
+                for start in range(processed, len(image_paths), self.batch_size):
+                    if cancel_event.is_set():
+                        with self._lock:
+                            self._finish(job, JOB_CANCELLED)
+                        return
+                    if self._stopping.is_set():
+                        return
+
+                    lines = self._score_batch(image_paths, start)
+                    results_file.write("".join(json.dumps(line) + "\n" for line in lines))
+                    results_file.flush()
+
+                    with self._lock:
+                        job["processed"] += len(lines)
+                        job["failed"] += sum(1 for line in lines if "error" in line)
+                        self._save(job)
+
+            with self._lock:
+                self._finish(job, JOB_COMPLETED)
+
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            with self._lock:
+                self._finish(job, JOB_FAILED, error=str(e))
+
+    def _score_batch(self, image_paths, start):
+        """Decode one batch, score the readable images, and keep per-image errors"""
+        lines = []
+        images = []
+        scored_lines = []
+        for index, path in enumerate(image_paths[start:start + self.batch_size], start=start):
+            line = {"index": index, "path": path}
+            lines.append(line)
+            try:
+                with Image.open(path) as image:
+                    images.append(image.convert('RGB'))
+                scored_lines.append(line)
+            except Exception as e:
+                line["error"] = f"Could not read image: {e}"
+
+        if images:
+            for line, result in zip(scored_lines, self.score_fn(images)):
+                line.update(result)
+        return lines
@@ -0,0 +1,335 @@
+"""
+Persistent detection log for Agri ROBO.
+
+Every detection result is appended to a SQLite database (WAL mode) so disease
+spread can be analysed across the season. The API only puts records on an
+in-memory queue; a background writer thread commits them in batches, so the
+request path never waits on disk.
+
+The writer also maintains per-class rollups (count and confidence sum per
+hour and per day) in the same transaction as the raw rows, so dashboard
+statistics are read from a handful of pre-aggregated buckets instead of
+scanning the whole log. Retention removes expired rows from the rollups as
+well, so both always describe the same detections.
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Optional
+
+# Rollup bucket sizes in seconds (buckets are aligned to UTC)
+BUCKET_SIZES = {
+    "hour": 3600,
+    "day": 86400,
+}
+
+# Upper bound on buckets returned by a single stats query
+MAX_STATS_BUCKETS = 2000
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp REAL NOT NULL,
+    source TEXT NOT NULL,
+    image_hash TEXT,
+    model_version TEXT,
+    disease TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    top_k TEXT NOT NULL,
+    latency_ms REAL
+);
+CREATE INDEX IF NOT EXISTS idx_detections_timestamp ON detections (timestamp);
+CREATE INDEX IF NOT EXISTS idx_detections_disease_timestamp ON detections (disease, timestamp);
+CREATE TABLE IF NOT EXISTS rollups (
+    bucket_seconds INTEGER NOT NULL,
+    bucket_start INTEGER NOT NULL,
+    disease TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    confidence_sum REAL NOT NULL,
+    PRIMARY KEY (bucket_seconds, bucket_start, disease)
+) WITHOUT ROWID;
+"""
+
+UPSERT_ROLLUP = """
+INSERT INTO rollups (bucket_seconds, bucket_start, disease, count, confidence_sum)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (bucket_seconds, bucket_start, disease) DO UPDATE SET
+    count = count + excluded.count,
+    confidence_sum = confidence_sum + excluded.confidence_sum
+"""
+
+
+def rollup_rows(rows):
+    """Aggregate (timestamp, disease, confidence) tuples into rollup upsert parameters"""
+    totals = defaultdict(lambda: [0, 0.0])
+    for timestamp, disease, confidence in rows:
+        for bucket_seconds in BUCKET_SIZES.values():
+            bucket_start = int(timestamp // bucket_seconds) * bucket_seconds
+            entry = totals[(bucket_seconds, bucket_start, disease)]
+            entry[0] += 1
+            entry[1] += confidence
+    return [key + (count, confidence_sum) for key, (count, confidence_sum) in totals.items()]
+
+
+class DetectionStore:
+    """SQLite-backed detection log with a batched background writer"""
+
+    def __init__(self, db_path, batch_size=100, flush_interval=1.0,
+                 retention_days=180, max_pending=10000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.retention_check_interval = 3600.0
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._last_retention_check = 0.0
+
+        self.written = 0
+        self.dropped = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def start(self):
+        """Create the schema and start the background writer"""
+        db_dir = os.path.dirname(os.path.abspath(self.db_path))
+        os.makedirs(db_dir, exist_ok=True)
+
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+            conn.commit()
+            self._backfill_rollups(conn)
+        finally:
+            conn.close()
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._writer_loop, name="detection-store-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the writer after flushing everything still queued"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def record(self, source, disease, confidence, top_k, image_hash=None,
+               model_version=None, latency_ms=None, timestamp=None):
+        """
+        Queue a detection for writing. Never blocks; returns False (and counts
+        the record as dropped) if the writer has fallen too far behind.
+        """
+        row = (
+            timestamp if timestamp is not None else time.time(),
+            source,
+            image_hash,
+            model_version,
+            disease,
+            float(confidence),
+            json.dumps(top_k),
+            latency_ms,
+        )
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _backfill_rollups(self, conn):
+        """Build rollups for a log created before rollups existed"""
+        if conn.execute("SELECT 1 FROM rollups LIMIT 1").fetchone() is not None:
+            return
+        rows = conn.execute("SELECT timestamp, disease, confidence FROM detections").fetchall()
+        if not rows:
+            return
+        with conn:
+            conn.executemany(UPSERT_ROLLUP, rollup_rows(rows))
+        print(f"Detection store: built rollups from {len(rows)} existing records")
+
+    def _writer_loop(self):
+        conn = self._connect()
+        try:
+            while not self._stop_event.is_set() or not self._queue.empty():
+                batch = self._next_batch()
+                if batch:
+                    self._write_batch(conn, batch)
+                self._maybe_apply_retention(conn)
+        finally:
+            conn.close()
+
+    def _next_batch(self):
+        """Block up to flush_interval for the first row, then drain up to batch_size"""
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self.flush_interval))
+        except queue.Empty:
+            return batch
+
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, conn, batch):
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO detections "
+                    "(timestamp, source, image_hash, model_version, disease, confidence, top_k, latency_ms) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    batch,
+                )
+                conn.executemany(UPSERT_ROLLUP, rollup_rows((row[0], row[4], row[5]) for row in batch))
+            self.written += len(batch)
+        except sqlite3.Error as e:
+            self.dropped += len(batch)
+            print(f"Detection store write error: {e}")
+
+    def _maybe_apply_retention(self, conn):
+        now = time.time()
+        if not self.retention_days or now - self._last_retention_check < self.retention_check_interval:
+            return
+        self._last_retention_check = now
+
+        cutoff = now - self.retention_days * 86400
+        try:
+            with conn:
+                # Take the expired rows out of their rollups in the same transaction,
+                # so /api/stats never counts detections /api/detections no longer has
+                for bucket_seconds in BUCKET_SIZES.values():
+                    expired = conn.execute(
+                        "SELECT CAST(timestamp / ? AS INTEGER) * ?, disease, COUNT(*), SUM(confidence) "
+                        "FROM detections WHERE timestamp < ? GROUP BY 1, 2",
+                        (bucket_seconds, bucket_seconds, cutoff),
+                    ).fetchall()
+                    conn.executemany(
+                        "UPDATE rollups SET count = count - ?, confidence_sum = confidence_sum - ? "
+                        "WHERE bucket_seconds = ? AND bucket_start = ? AND disease = ?",
+                        [(count, confidence_sum, bucket_seconds, bucket_start, disease)
+                         for bucket_start, disease, count, confidence_sum in expired],
+                    )
+                    # Buckets wholly before the cutoff go too (e.g. rows removed by an older version)
+                    conn.execute(
+                        "DELETE FROM rollups WHERE bucket_seconds = ? AND bucket_start + ? <= ?",
+                        (bucket_seconds, bucket_seconds, cutoff),
+                    )
+                conn.execute("DELETE FROM rollups WHERE count <= 0")
+                cursor = conn.execute("DELETE FROM detections WHERE timestamp < ?", (cutoff,))
+            if cursor.rowcount:
+                print(f"Detection store: removed {cursor.rowcount} records older than {self.retention_days} days")
+        except sqlite3.Error as e:
+            print(f"Detection store retention error: {e}")
+
+    def query(self, start: Optional[float] = None, end: Optional[float] = None,
+              disease: Optional[str] = None, page=1, page_size=50):
+        """Return one page of detections (newest first) filtered by time range and class"""
+        clauses = []
+        params = []
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("timestamp < ?")
+            params.append(end)
+        if disease:
+            clauses.append("disease = ?")
+            params.append(disease)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        conn = self._connect()
+        try:
+            conn.row_factory = sqlite3.Row
+            total = conn.execute(f"SELECT COUNT(*) FROM detections {where}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT * FROM detections {where} ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?",
+                params + [page_size, (page - 1) * page_size],
+            ).fetchall()
+        finally:
+            conn.close()
+
+        items = []
+        for row in rows:
+            item = dict(row)
+            item["top_k"] = json.loads(item["top_k"])
+            items.append(item)
+
+        return {
+            "items": items,
+            "page": page,
+            "page_size": page_size,
+            "total": total,
+        }
+
+    def rollup_stats(self, bucket="hour", start: Optional[float] = None,
+                     end: Optional[float] = None, disease: Optional[str] = None):
+        """
+        Return per-class counts and mean confidence per time bucket.
+        Reads only the rollup table, so the cost depends on the number of
+        buckets in the range, not on the size of the detection log.
+        """
+        if bucket not in BUCKET_SIZES:
+            raise ValueError(f"Invalid bucket. Must be one of: {list(BUCKET_SIZES)}")
+        bucket_seconds = BUCKET_SIZES[bucket]
+
+        if end is None:
+            end = time.time()
+        if start is None:
+            start = end - 24 * bucket_seconds
+        start = max(start, end - MAX_STATS_BUCKETS * bucket_seconds)
+
+        first_bucket = int(start // bucket_seconds) * bucket_seconds
+        params = [bucket_seconds, first_bucket, end]
+        disease_clause = ""
+        if disease:
+            disease_clause = "AND disease = ?"
+            params.append(disease)
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT bucket_start, disease, count, confidence_sum FROM rollups "
+                f"WHERE bucket_seconds = ? AND bucket_start >= ? AND bucket_start < ? {disease_clause} "
+                "ORDER BY bucket_start, disease",
+                params,
+            ).fetchall()
+        finally:
+            conn.close()
+
+        return {
+            "bucket": bucket,
+            "bucket_seconds": bucket_seconds,
+            "start": first_bucket,
+            "end": end,
+            "series": [
+                {
+                    "bucket_start": bucket_start,
+                    "disease": name,
+                    "count": count,
+                    "mean_confidence": round(confidence_sum / count, 2) if count else 0.0,
+                }
+                for bucket_start, name, count, confidence_sum in rows
+            ],
+        }
+
+    def stats(self):
+        return {
+            "pending": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,110 @@
+"""
+Frame broadcaster for camera streaming.
+
+The capture thread publishes each encoded frame once, tagged with a
+monotonically increasing sequence number. Stream clients remember the last
+sequence they sent and block until a newer frame exists, so every client
+receives each frame at most once and no client busy-polls.
+
+Async subscribers (the streaming endpoints) await an asyncio.Event per event
+loop instead of parking a threadpool thread on the condition. The capture
+thread wakes each loop once per frame via call_soon_threadsafe, however many
+viewers are waiting on it.
+"""
+
+import asyncio
+import threading
+import time
+from collections import namedtuple
+
+# variants maps stream tier name -> encoded bytes for the tiers encoded for this frame;
+# data is the default tier's bytes, or None when only scaled tiers were needed
+Frame = namedtuple("Frame", ["sequence", "data", "timestamp", "variants"], defaults=(None,))
+
+
+class FrameBroadcaster:
+    """Single-producer, many-consumer latest-frame broadcaster"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._frame = None
+        self._sequence = 0
+        # event loop -> asyncio.Event shared by every async waiter on that loop
+        self._async_events = {}
+
+    @property
+    def sequence(self):
+        return self._sequence
+
+    def publish(self, data, timestamp=None, variants=None):
+        """Publish a new frame and wake every waiting subscriber"""
+        with self._condition:
+            self._sequence += 1
+            self._frame = Frame(self._sequence, data, timestamp if timestamp is not None else time.time(), variants)
+            self._condition.notify_all()
+            self._notify_async()
+            return self._sequence
+
+    def latest(self):
+        """Return the latest Frame, or None if nothing has been published since the last clear"""
+        return self._frame
+
+    def wait_for_frame(self, after_sequence, timeout=None):
+        """
+        Block until a frame newer than after_sequence is available.
+        Returns the latest Frame (skipping any the caller missed), or None on
+        timeout or when the broadcaster is cleared.
+        """
+        with self._condition:
+            frame = self._frame
+            if frame is not None and frame.sequence > after_sequence:
+                return frame
+            self._condition.wait(timeout)
+            frame = self._frame
+            if frame is not None and frame.sequence > after_sequence:
+                return frame
+            return None
+
+    def clear(self):
+        """Drop the current frame (camera stopped) and wake subscribers so they can re-check state"""
+        with self._condition:
+            self._frame = None
+            self._condition.notify_all()
+            self._notify_async()
+
+    def _notify_async(self):
+        """Wake async waiters on every registered loop (caller holds the condition)"""
+        for loop in list(self._async_events):
+            if loop.is_closed():
+                del self._async_events[loop]
+                continue
+            loop.call_soon_threadsafe(self._set_async_event, loop)
+
+    def _set_async_event(self, loop):
+        """Runs on the waiters' loop: release them and let the next wait register a fresh event"""
+        with self._condition:
+            event = self._async_events.pop(loop, None)
+        if event is not None:
+            event.set()
+
+    async def wait_for_frame_async(self, after_sequence, timeout=None):
+        """Async version of wait_for_frame; never blocks the event loop or uses a thread"""
+        loop = asyncio.get_running_loop()
+        with self._condition:
+            frame = self._frame
+            if frame is not None and frame.sequence > after_sequence:
+                return frame
+            event = self._async_events.get(loop)
+            if event is None:
+                event = asyncio.Event()
+                self._async_events[loop] = event
+
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+        frame = self._frame
+        if frame is not None and frame.sequence > after_sequence:
+            return frame
+        return None
@@ -0,0 +1,157 @@
+"""
+Ring buffer of recent camera frames with a sharpness score per frame.
+
+The robot vibrates while it moves, so the latest frame is often motion
+blurred. The capture thread pushes every processed RGB frame into a fixed,
+preallocated ring; a capture request then picks the sharpest frame from the
+last few hundred milliseconds instead of whatever frame happens to be newest.
+
+Sharpness is the variance of a 4-neighbour Laplacian over a downsampled luma
+image, which is cheap enough to compute for every frame.
+
+Slots store 4 bytes per pixel, Pillow's own layout for RGB images, and each
+slot is also mapped as a Pillow image, so push_image() pastes a processed
+frame straight into its slot without an intermediate array.
+"""
+
+import threading
+
+import numpy as np
+from PIL import Image
+
+
+def sharpness_score(rgb, step=4):
+    """Laplacian variance of the luma of an RGB array, sampled every `step` pixels"""
+    small = rgb[::step, ::step].astype(np.float32)
+    luma = small[:, :, 0] * 0.299 + small[:, :, 1] * 0.587 + small[:, :, 2] * 0.114
+    laplacian = (
+        4.0 * luma[1:-1, 1:-1]
+        - luma[:-2, 1:-1] - luma[2:, 1:-1]
+        - luma[1:-1, :-2] - luma[1:-1, 2:]
+    )
+    return float(laplacian.var())
+
+
+class _SharpnessScratch:
+    """Preallocated float buffers for scoring frames of one size without per-frame allocations"""
+
+    def __init__(self, height, width, step):
+        self.step = step
+        small = (len(range(0, height, step)), len(range(0, width, step)))
+        self.luma = np.empty(small, dtype=np.float32)
+        self.channel = np.empty(small, dtype=np.float32)
+        self.laplacian = np.empty((small[0] - 2, small[1] - 2), dtype=np.float32)
+
+    def score(self, frame):
+        """Same measure as sharpness_score(frame, step), computed in the scratch buffers"""
+        step = self.step
+        luma, channel, laplacian = self.luma, self.channel, self.laplacian
+        np.multiply(frame[::step, ::step, 0], 0.299, out=luma, casting='unsafe')
+        for index, weight in ((1, 0.587), (2, 0.114)):
+            np.multiply(frame[::step, ::step, index], weight, out=channel, casting='unsafe')
+            luma += channel
+        np.multiply(luma[1:-1, 1:-1], 4.0, out=laplacian)
+        laplacian -= luma[:-2, 1:-1]
+        laplacian -= luma[2:, 1:-1]
+        laplacian -= luma[1:-1, :-2]
+        laplacian -= luma[1:-1, 2:]
+        # Variance as E[x^2] - E[x]^2, squaring in place instead of allocating x - mean
+        mean = float(laplacian.mean(dtype=np.float64))
+        np.square(laplacian, out=laplacian)
+        return max(0.0, float(laplacian.mean(dtype=np.float64)) - mean * mean)
+
+
+class FrameHistory:
+    """Fixed-capacity ring of recent RGB frames, preallocated on the first push"""
+
+    def __init__(self, capacity=15, step=4):
+        self.capacity = capacity
+        self.step = step
+        self._lock = threading.Lock()
+        # (capacity, height, width, 4): RGB plus Pillow's padding byte
+        self._frames = None
+        # Per slot, an RGBX Pillow image mapped onto the slot's memory
+        self._views = None
+        self._scratch = None
+        # Frames copied through an intermediate array because a slot could not be mapped
+        self.fallback_copies = 0
+        self._timestamps = np.zeros(capacity, dtype=np.float64)
+        self._scores = np.zeros(capacity, dtype=np.float64)
+        self._count = 0
+        self._next = 0
+
+    def _ensure_frames(self, height, width):
+        """Allocate the ring once per frame size (caller holds the lock)"""
+        if self._frames is not None and self._frames.shape[1:3] == (height, width):
+            return
+        # Memory stays bounded at capacity frames
+        self._frames = np.zeros((self.capacity, height, width, 4), dtype=np.uint8)
+        self._views = []
+        for slot in self._frames:
+            view = Image.frombuffer('RGBX', (width, height), slot, 'raw', 'RGBX', 0, 1)
+            # Pillow marks images it maps onto a buffer read-only; otherwise it made a copy
+            self._views.append(view if view.readonly else None)
+        self._scratch = _SharpnessScratch(height, width, self.step)
+        self._count = 0
+        self._next = 0
+
+    def _commit(self, timestamp):
+        """Score the slot just written and advance the ring (caller holds the lock)"""
+        score = self._scratch.score(self._frames[self._next])
+        self._timestamps[self._next] = timestamp
+        self._scores[self._next] = score
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+        return score
+
+    def push(self, rgb, timestamp):
+        """Copy an RGB array into the ring and score it; returns the sharpness score"""
+        with self._lock:
+            self._ensure_frames(rgb.shape[0], rgb.shape[1])
+            np.copyto(self._frames[self._next][:, :, :3], rgb)
+            return self._commit(timestamp)
+
+    def push_image(self, image, timestamp):
+        """Paste an RGB PIL image straight into the ring and score it; returns the sharpness score"""
+        width, height = image.size
+        with self._lock:
+            self._ensure_frames(height, width)
+            view = self._views[self._next]
+            if view is not None:
+                # Core paste: Image.paste would copy the read-only view first
+                view.im.paste(image.im, (0, 0, width, height))
+            else:
+                self.fallback_copies += 1
+                np.copyto(self._frames[self._next][:, :, :3], np.asarray(image))
+            return self._commit(timestamp)
+
+    def sharpest(self, window_seconds, now=None):
+        """
+        Return (frame, timestamp, score) for the sharpest frame captured within
+        window_seconds of the newest frame (or of `now`), or None if empty.
+        The frame is a copy, safe to use after the ring moves on.
+        """
+        with self._lock:
+            if self._count == 0:
+                return None
+            valid = slice(0, self._count)
+            timestamps = self._timestamps[valid]
+            newest = timestamps.max() if now is None else now
+            candidates = np.flatnonzero(timestamps >= newest - window_seconds)
+            if candidates.size == 0:
+                candidates = np.array([int(timestamps.argmax())])
+            best = candidates[int(self._scores[candidates].argmax())]
+            return self._frames[best][:, :, :3].copy(), float(self._timestamps[best]), float(self._scores[best])
+
+    def clear(self):
+        with self._lock:
+            self._count = 0
+            self._next = 0
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "frames": self._count,
+            "bytes": self._frames.nbytes if self._frames is not None else 0,
+            "fallback_copies": self.fallback_copies,
+        }
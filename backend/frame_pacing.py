@@ -0,0 +1,159 @@
+"""
+Frame pacing and rate measurement for the camera pipeline.
+
+FrameScheduler paces a loop on a fixed grid of deadlines (one per frame at
+the target fps) instead of sleeping a fixed time after each frame's work, so
+the achieved rate does not drift below the target as the work grows. When a
+frame runs late the missed slots are skipped and counted, rather than
+accumulating lag by trying to catch up.
+
+RateMeter and StreamStats report what actually happened: achieved fps,
+dropped frames and frame age (capture timestamp to send).
+"""
+
+import itertools
+import threading
+import time
+from collections import deque
+
+
+class FrameScheduler:
+    """Deadline-based pacing at a target fps; late frames skip slots instead of piling up"""
+
+    def __init__(self, target_fps):
+        self.fps = target_fps
+        self.interval = 1.0 / target_fps
+        self.skipped = 0
+        self._next_deadline = None
+
+    def set_fps(self, fps):
+        """Change the rate; the new grid starts at the next wait"""
+        self.fps = fps
+        self.interval = 1.0 / fps
+        self._next_deadline = None
+
+    def wait(self, wake=None):
+        """
+        Sleep until the next frame slot; returns the number of slots skipped.
+        Setting the optional `wake` event ends the sleep early (it is cleared).
+        """
+        now = time.monotonic()
+        missed = 0
+        # Local copies: reset() and set_fps() may be called from another thread meanwhile
+        deadline = self._next_deadline
+        interval = self.interval
+        if deadline is None:
+            deadline = now
+        elif now - deadline >= interval:
+            # More than a whole frame late: drop the missed slots, keep the grid
+            missed = int((now - deadline) / interval)
+            deadline += missed * interval
+            self.skipped += missed
+
+        delay = deadline - now
+        if delay > 0:
+            if wake is None:
+                time.sleep(delay)
+            elif wake.wait(delay):
+                wake.clear()
+                self._next_deadline = None
+                return missed
+        self._next_deadline = deadline + interval
+        return missed
+
+    def reset(self):
+        """Start a fresh grid at the next wait (e.g. after a pause)"""
+        self._next_deadline = None
+
+
+class RateMeter:
+    """Events per second over a sliding time window"""
+
+    def __init__(self, window_seconds=2.0):
+        self.window_seconds = window_seconds
+        self._times = deque()
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        while self._times and now - self._times[0] > self.window_seconds:
+            self._times.popleft()
+
+    def tick(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._times.append(now)
+            self._prune(now)
+
+    @property
+    def fps(self):
+        with self._lock:
+            # Events older than the window are dropped, so a stalled source decays to 0
+            self._prune(time.monotonic())
+            if len(self._times) < 2:
+                return 0.0
+            span = self._times[-1] - self._times[0]
+            return (len(self._times) - 1) / span if span > 0 else 0.0
+
+
+class AgeStats:
+    """Running frame age in milliseconds (capture timestamp to hand-off)"""
+
+    def __init__(self, smoothing=0.1):
+        self.smoothing = smoothing
+        self.last_ms = None
+        self.avg_ms = 0.0
+        self.max_ms = 0.0
+        self._count = 0
+
+    def record(self, captured_at, now=None):
+        now = time.time() if now is None else now
+        ms = max(0.0, now - captured_at) * 1000.0
+        self.last_ms = ms
+        self.avg_ms = ms if self._count == 0 else self.avg_ms + self.smoothing * (ms - self.avg_ms)
+        self.max_ms = max(self.max_ms, ms)
+        self._count += 1
+
+    def snapshot(self):
+        return {
+            "last_ms": round(self.last_ms, 1) if self.last_ms is not None else None,
+            "avg_ms": round(self.avg_ms, 1),
+            "max_ms": round(self.max_ms, 1),
+        }
+
+
+_stream_ids = itertools.count(1)
+
+
+class StreamStats:
+    """Achieved fps, skipped frames and frame age for one stream client"""
+
+    def __init__(self, tier):
+        self.id = next(_stream_ids)
+        self.tier = tier
+        self.started_at = time.time()
+        self.sent = 0
+        self.skipped = 0
+        self.rate = RateMeter()
+        self.age = AgeStats()
+        self._last_sequence = None
+
+    def record_send(self, sequence, captured_at):
+        """Call as a frame is handed to the client"""
+        if self._last_sequence is not None and sequence > self._last_sequence + 1:
+            # Frames published while this client was still sending the previous one
+            self.skipped += sequence - self._last_sequence - 1
+        self._last_sequence = sequence
+        self.sent += 1
+        self.rate.tick()
+        self.age.record(captured_at)
+
+    def snapshot(self):
+        return {
+            "id": self.id,
+            "tier": self.tier,
+            "connected_seconds": round(time.time() - self.started_at, 1),
+            "frames_sent": self.sent,
+            "frames_skipped": self.skipped,
+            "fps": round(self.rate.fps, 2),
+            "frame_age": self.age.snapshot(),
+        }
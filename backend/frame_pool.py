@@ -0,0 +1,96 @@
+"""
+Preallocated frame buffers for the camera pipeline.
+
+At 30 fps every fresh full-size frame buffer is a large allocation (mapped,
+page-faulted and unmapped again on the Pi), so the pipeline reuses a fixed
+set of buffers instead:
+
+- FramePool holds preallocated NumPy arrays for raw sensor frames. The
+  capture stage copies the sensor buffer into one, and the process stage
+  hands it back once the frame is color-corrected.
+- Pillow images (the unpacked frame, the color-corrected frame, scaled
+  stream tiers) come from Pillow's own block arena. By default it frees
+  every block; configure_pillow_blocks() lets it keep freed blocks for reuse.
+  The arena is process wide, so it is configured once for all cameras.
+
+Both report how many buffers were actually allocated, so the pipeline can
+expose allocations per frame.
+"""
+
+import threading
+
+import numpy as np
+from PIL import Image
+
+
+class FramePool:
+    """Fixed set of preallocated uint8 frame buffers of one shape"""
+
+    def __init__(self, size=4):
+        self.size = size
+        self.shape = None
+        # Buffers ever allocated: the pool fills plus overflow buffers
+        self.allocated = 0
+        # Acquires that found every pooled buffer in use
+        self.overflow = 0
+        self.acquired = 0
+        self._lock = threading.Lock()
+        self._free = []
+        self._owned = set()
+
+    def acquire(self, shape):
+        """
+        Return a free buffer of `shape`. The pool is (re)allocated when the
+        shape changes; when all buffers are in use a temporary one is
+        allocated and counted as overflow.
+        """
+        shape = tuple(shape)
+        with self._lock:
+            if shape != self.shape:
+                self.shape = shape
+                self._free = [np.empty(shape, dtype=np.uint8) for _ in range(self.size)]
+                self._owned = {id(buffer) for buffer in self._free}
+                self.allocated += self.size
+            self.acquired += 1
+            if self._free:
+                return self._free.pop()
+            self.overflow += 1
+            self.allocated += 1
+        return np.empty(shape, dtype=np.uint8)
+
+    def release(self, buffer):
+        """Return a buffer from acquire(); arrays the pool does not own are ignored"""
+        with self._lock:
+            if id(buffer) in self._owned and buffer.shape == self.shape:
+                self._free.append(buffer)
+
+    def stats(self):
+        with self._lock:
+            free = len(self._free)
+        return {
+            "size": self.size,
+            "shape": list(self.shape) if self.shape else None,
+            "free": free,
+            "acquired": self.acquired,
+            "allocated": self.allocated,
+            "overflow": self.overflow,
+        }
+
+
+def configure_pillow_blocks(frame_bytes, blocks, limit_bytes):
+    """
+    Size Pillow's process-wide block cache for frames of up to frame_bytes:
+    blocks of that size (page aligned), and up to `blocks` of them kept for
+    reuse, but never more than limit_bytes. Larger images (uploads) span
+    several blocks, so no upload-sized block is ever kept alive. Call once
+    per process; calling again replaces the settings.
+    """
+    block_size = max(4096, -(-frame_bytes // 4096) * 4096)
+    Image.core.set_block_size(block_size)
+    Image.core.set_blocks_max(max(0, min(blocks, limit_bytes // block_size)))
+    return {"block_size": block_size, "blocks_max": Image.core.get_blocks_max()}
+
+
+def pillow_block_stats():
+    """Pillow arena counters: allocated_blocks are fresh allocations, reused_blocks came from the cache"""
+    return Image.core.get_stats()
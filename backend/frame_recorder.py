@@ -0,0 +1,305 @@
+"""
+Rolling on-disk recording of the camera feed.
+
+The recorder is a camera pipeline consumer: it takes the already-encoded
+JPEG of every published frame and appends it, unchanged, to time-segmented
+MJPEG files under the recordings directory:
+
+    segment-<start_ms>.mjpeg   concatenated JPEG frames
+    segment-<start_ms>.idx     one fixed-size record per frame:
+                               (timestamp, byte offset, length)
+
+Writes happen on the recorder's own thread through large file buffers, so
+neither the pipeline nor the event loop ever waits on the SD card. Data and
+index are flushed at least once a second and when a segment is rotated.
+
+Total size is bounded by a quota: once exceeded, whole segments are evicted
+oldest first. A time range is served straight from the segment files by
+byte offset, without decoding or re-encoding any frame.
+"""
+
+import glob
+import os
+import struct
+import threading
+import time
+
+# timestamp (unix seconds), byte offset in the .mjpeg file, JPEG length
+INDEX_RECORD = struct.Struct("<dQI")
+
+WRITE_BUFFER_BYTES = 1 << 20
+FLUSH_INTERVAL = 1.0
+READ_CHUNK_BYTES = 1 << 16
+
+
+class Segment:
+    """One recorded segment: an MJPEG file and its frame index"""
+
+    def __init__(self, directory, start_ms):
+        self.start_ms = start_ms
+        base = os.path.join(directory, f"segment-{start_ms}")
+        self.data_path = base + ".mjpeg"
+        self.index_path = base + ".idx"
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.frames = 0
+        self.size = 0
+
+    def load_index(self):
+        """Read the index from disk, dropping records past the end of the data file"""
+        data_size = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+        records = []
+        with open(self.index_path, "rb") as f:
+            raw = f.read()
+        for offset in range(0, len(raw) - INDEX_RECORD.size + 1, INDEX_RECORD.size):
+            record = INDEX_RECORD.unpack_from(raw, offset)
+            if record[1] + record[2] > data_size:
+                # Written to the index but lost from the data file (unclean shutdown)
+                break
+            records.append(record)
+        return records
+
+    def refresh(self):
+        """Recompute frame count, time span and size from the files on disk"""
+        records = self.load_index()
+        self.frames = len(records)
+        self.first_timestamp = records[0][0] if records else None
+        self.last_timestamp = records[-1][0] if records else None
+        self.size = sum(
+            os.path.getsize(path) for path in (self.data_path, self.index_path) if os.path.exists(path)
+        )
+
+    def delete(self):
+        for path in (self.data_path, self.index_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # Eviction carries on with the other segments; the file is left behind
+                print(f"Warning: could not delete recording segment file {path}: {e}")
+
+    def info(self):
+        return {
+            "segment": os.path.basename(self.data_path),
+            "start": self.first_timestamp,
+            "end": self.last_timestamp,
+            "frames": self.frames,
+            "bytes": self.size,
+        }
+
+
+class FrameRecorder:
+    """Writes published JPEG frames to rolling MJPEG segments within a disk quota"""
+
+    def __init__(self, recordings_dir, segment_seconds=60, quota_bytes=2 * 1024 ** 3, name="camera"):
+        """name is the camera id, used in the recorder thread's name"""
+        self.name = name
+        self.recordings_dir = recordings_dir
+        self.segment_seconds = segment_seconds
+        self.quota_bytes = quota_bytes
+
+        self.recorded = 0
+        self.skipped = 0
+        self.evicted = 0
+
+        # Guards the segment list and the open segment's files
+        self._lock = threading.Lock()
+        self._segments = []
+        self._current = None
+        self._data_file = None
+        self._index_file = None
+        self._last_flush = 0.0
+
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._load_segments()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _load_segments(self):
+        """Pick up segments from a previous run"""
+        if not os.path.isdir(self.recordings_dir):
+            return
+        for index_path in glob.glob(os.path.join(self.recordings_dir, "segment-*.idx")):
+            name = os.path.basename(index_path)[len("segment-"):-len(".idx")]
+            try:
+                segment = Segment(self.recordings_dir, int(name))
+                segment.refresh()
+            except (ValueError, OSError) as e:
+                print(f"Warning: skipping unreadable recording segment {index_path}: {e}")
+                continue
+            if segment.frames == 0:
+                segment.delete()
+                continue
+            self._segments.append(segment)
+        self._segments.sort(key=lambda segment: segment.start_ms)
+
+    def start(self, broadcaster):
+        """Record every frame published on broadcaster until stop()"""
+        if self.running:
+            return
+        os.makedirs(self.recordings_dir, exist_ok=True)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, args=(broadcaster,), name=f"{self.name}-frame-recorder", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+
+    def _run(self, broadcaster):
+        last_sequence = broadcaster.sequence
+        try:
+            while not self._stop_event.is_set():
+                frame = broadcaster.wait_for_frame(last_sequence, timeout=0.5)
+                if frame is not None:
+                    if frame.sequence > last_sequence + 1:
+                        # Fell behind the pipeline (slow disk); newest frame wins
+                        self.skipped += frame.sequence - last_sequence - 1
+                    last_sequence = frame.sequence
+                    if frame.data is None:
+                        # Encoded before recording registered, with only scaled stream tiers
+                        continue
+                    try:
+                        self._write(frame.data, frame.timestamp)
+                    except OSError as e:
+                        print(f"Recording write error: {e}")
+                        time.sleep(0.5)
+                        continue
+
+                if time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+                    with self._lock:
+                        self._flush()
+                        self._evict()
+        finally:
+            with self._lock:
+                self._close_segment()
+
+    def _write(self, data, timestamp):
+        with self._lock:
+            if self._current is None or timestamp - self._current.first_timestamp >= self.segment_seconds:
+                self._close_segment()
+                self._open_segment(timestamp)
+
+            segment = self._current
+            self._index_file.write(INDEX_RECORD.pack(timestamp, self._data_file.tell(), len(data)))
+            self._data_file.write(data)
+            segment.size += len(data)
+            segment.frames += 1
+            segment.last_timestamp = timestamp
+            self.recorded += 1
+
+    def _open_segment(self, timestamp):
+        segment = Segment(self.recordings_dir, int(timestamp * 1000))
+        self._data_file = open(segment.data_path, "ab", buffering=WRITE_BUFFER_BYTES)
+        self._index_file = open(segment.index_path, "ab", buffering=WRITE_BUFFER_BYTES)
+        segment.first_timestamp = timestamp
+        self._current = segment
+        self._segments.append(segment)
+
+    def _close_segment(self):
+        """Flush and close the open segment, then enforce the quota (caller holds the lock)"""
+        if self._current is None:
+            return
+        self._data_file.close()
+        self._index_file.close()
+        self._data_file = self._index_file = None
+        self._current.refresh()
+        self._current = None
+        self._evict()
+
+    def _flush(self):
+        if self._current is not None:
+            self._data_file.flush()
+            self._index_file.flush()
+        self._last_flush = time.monotonic()
+
+    def _evict(self):
+        """Delete whole segments, oldest first, until the total fits the quota (never the open one)"""
+        total = sum(segment.size for segment in self._segments)
+        while total > self.quota_bytes and len(self._segments) > 1:
+            oldest = self._segments.pop(0)
+            oldest.delete()
+            total -= oldest.size
+            self.evicted += 1
+
+    def segments(self, start=None, end=None):
+        """Segment info for segments overlapping [start, end]"""
+        with self._lock:
+            segments = list(self._segments)
+        return [
+            segment.info() for segment in segments
+            if segment.first_timestamp is not None
+            and (start is None or segment.last_timestamp >= start)
+            and (end is None or segment.first_timestamp <= end)
+        ]
+
+    def open_frame_ranges(self, start, end):
+        """
+        (data_file, [(timestamp, offset, length), ...]) for every segment with
+        frames in [start, end], oldest first. Flushes the open segment first.
+        The data files are opened under the lock, so every listed frame stays
+        readable even if the quota evicts its segment meanwhile (the open file
+        outlives the unlink). Pass the result to iter_ranges(), which closes
+        the files, or to close_ranges().
+        """
+        ranges = []
+        with self._lock:
+            if self._current is not None:
+                self._data_file.flush()
+                self._index_file.flush()
+            for segment in self._segments:
+                if (segment.first_timestamp is None
+                        or segment.last_timestamp < start or segment.first_timestamp > end):
+                    continue
+                try:
+                    records = [record for record in segment.load_index() if start <= record[0] <= end]
+                    if records:
+                        ranges.append((open(segment.data_path, "rb"), records))
+                except FileNotFoundError:
+                    continue
+        return ranges
+
+    @staticmethod
+    def close_ranges(ranges):
+        for data_file, _ in ranges:
+            data_file.close()
+
+    @staticmethod
+    def iter_ranges(ranges):
+        """Yield the stored JPEG bytes of open_frame_ranges() output as one MJPEG byte stream"""
+        try:
+            for data_file, records in ranges:
+                # Frames are contiguous in the file: read the whole span in chunks
+                first_offset = records[0][1]
+                remaining = records[-1][1] + records[-1][2] - first_offset
+                data_file.seek(first_offset)
+                while remaining > 0:
+                    chunk = data_file.read(min(READ_CHUNK_BYTES, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+        finally:
+            FrameRecorder.close_ranges(ranges)
+
+    def stats(self):
+        with self._lock:
+            segments = list(self._segments)
+        return {
+            "running": self.running,
+            "recordings_dir": self.recordings_dir,
+            "segments": len(segments),
+            "bytes": sum(segment.size for segment in segments),
+            "quota_bytes": self.quota_bytes,
+            "oldest": segments[0].first_timestamp if segments else None,
+            "newest": segments[-1].last_timestamp if segments else None,
+            "frames_recorded": self.recorded,
+            "frames_skipped": self.skipped,
+            "segments_evicted": self.evicted,
+        }
@@ -0,0 +1,74 @@
+"""
+Shared preprocessing and prediction formatting for disease detection.
+
+Used by the upload endpoint, the detection job API and the bulk scoring CLI
+so every path feeds the model exactly the same pixels. This module only
+depends on NumPy and Pillow (no TensorFlow), so it can be imported from
+worker processes that never touch the model.
+"""
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+
+def format_class_name(class_name):
+    """Format a raw class name for display (handles Not_A_Leaf and Tomato___ classes)"""
+    if class_name == "Not_A_Leaf":
+        return "Not A Leaf"
+    return class_name.replace("Tomato___", "").replace("_", " ").title()
+
+
+def preprocess_image(image, img_size):
+    """
+    Enhance, resize and normalize a PIL image for the model.
+    img_size is (height, width) as reported by model.input_shape.
+    Returns a float32 array of shape (height, width, 3) in [0, 1].
+    """
+    # Convert to RGB if needed
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    # Image enhancement for better detection accuracy
+    # Enhance contrast (helps with disease visibility)
+    enhancer = ImageEnhance.Contrast(image)
+    image = enhancer.enhance(1.2)  # Increase contrast by 20%
+
+    # Enhance sharpness (helps with edge detection)
+    enhancer = ImageEnhance.Sharpness(image)
+    image = enhancer.enhance(1.1)  # Increase sharpness by 10%
+
+    # Resize image to match model input size (use high-quality resampling)
+    # PIL takes (width, height)
+    image = image.resize((img_size[1], img_size[0]), Image.Resampling.LANCZOS)
+
+    # Convert to array and normalize (matching training: rescale=1./255)
+    img_array = np.array(image, dtype=np.float32)
+    img_array = img_array / 255.0  # Normalize to [0, 1] range
+
+    # Ensure values are in valid range [0, 1]
+    return np.clip(img_array, 0.0, 1.0)
+
+
+def summarize_prediction(probabilities, class_mapping, top_k=3):
+    """Turn one row of model output into the API's detection result fields"""
+    predicted_class_idx = int(np.argmax(probabilities))
+    confidence = float(probabilities[predicted_class_idx] * 100)
+
+    # Get disease name from mapping
+    disease_name = class_mapping.get(predicted_class_idx, "Unknown")
+
+    # Get top-k predictions
+    prediction_dict = {}
+    for idx, prob in enumerate(probabilities):
+        prediction_dict[format_class_name(class_mapping.get(idx, "Unknown"))] = float(prob * 100)
+
+    sorted_predictions = sorted(prediction_dict.items(), key=lambda x: x[1], reverse=True)
+    top_predictions = [{"name": name, "confidence": round(conf, 2)} for name, conf in sorted_predictions[:top_k]]
+
+    return {
+        "disease": format_class_name(disease_name),
+        "confidence": round(confidence, 2),
+        "is_healthy": "healthy" in disease_name.lower(),
+        "top_predictions": top_predictions,
+        "raw_disease_name": disease_name,
+    }
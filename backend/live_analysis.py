@@ -0,0 +1,80 @@
+"""
+Live classification of the camera's low-resolution analysis stream.
+
+The capture thread publishes small RGB arrays (already sized for the model
+by the camera ISP's lores stream) to an analysis broadcaster at its own
+frame rate. LiveAnalyzer classifies the newest one whenever the model is
+free and keeps the latest result for the API.
+"""
+
+import threading
+import time
+
+
+class LiveAnalyzer:
+    """Background thread that classifies the newest analysis frame"""
+
+    def __init__(self, broadcaster, classify_fn, name="camera"):
+        """classify_fn takes an RGB uint8 array and returns a result dict; name is the camera id"""
+        self.name = name
+        self.broadcaster = broadcaster
+        self.classify_fn = classify_fn
+        self.latest = None
+        self.analyzed = 0
+        self.fps = 0.0
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-live-analysis", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def _run(self):
+        last_sequence = 0
+        last_finished = None
+        while not self._stop_event.is_set():
+            frame = self.broadcaster.wait_for_frame(last_sequence, timeout=0.5)
+            if frame is None:
+                continue
+            last_sequence = frame.sequence
+
+            try:
+                result = self.classify_fn(frame.data)
+            except Exception as e:
+                print(f"Live analysis error: {e}")
+                time.sleep(0.5)
+                continue
+
+            now = time.time()
+            self.latest = {
+                **result,
+                "sequence": frame.sequence,
+                "captured_at": frame.timestamp,
+                "analyzed_at": now,
+            }
+            self.analyzed += 1
+            if last_finished is not None:
+                self.fps += 0.2 * (1.0 / max(now - last_finished, 1e-6) - self.fps)
+            last_finished = now
+
+    def status(self):
+        return {
+            "running": self.running,
+            "analyzed": self.analyzed,
+            "fps": round(self.fps, 2),
+            "latest": self.latest,
+        }
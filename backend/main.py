@@ -1,30 +1,60 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Form, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, StreamingResponse, Response
 from contextlib import asynccontextmanager
 import numpy as np
-from PIL import Image, ImageEnhance, ImageFilter
+from PIL import Image
 from tensorflow.keras.models import load_model
 import tensorflow as tf
 import json
 import os
 import io
-from typing import Optional
-import sys
-import threading
+import hashlib
+import functools
+import base64
+import shutil
+from typing import List, Optional
 import time
+import asyncio
+from collections import deque
 
-# Add system dist-packages to path for picamera2
-if '/usr/lib/python3/dist-packages' not in sys.path:
-    sys.path.insert(0, '/usr/lib/python3/dist-packages')
+from detection_store import DetectionStore
+from detection_jobs import JobManager, JobLimitError, FINISHED_STATES, find_images
+from inference import preprocess_image, summarize_prediction
+from camera_pipeline import CameraPipeline
+from frame_pool import configure_pillow_blocks
+from frame_recorder import FrameRecorder
+from frame_pacing import StreamStats
+from video_transport import mjpeg_part, pack_video_message
+from stream_quality import AdaptiveTierController, DEFAULT_TIER, TIER_NAMES, encode_jpeg, frame_variant
 
-# Try to import picamera2
-try:
-    from picamera2 import Picamera2
-    PICAMERA2_AVAILABLE = True
-except ImportError:
-    PICAMERA2_AVAILABLE = False
-    print("Warning: picamera2 not available. Camera features will be disabled.")
+from camera_sources import CameraConfig, camera_source_available, create_camera_source, parse_camera_configs
+from motor_control import (
+    GPIOZERO_AVAILABLE, MOTOR_DIRECTIONS, MOTOR_DRIVER_NAMES, MotorController, MotorDriverError,
+    SimulatedMotorDriver, create_motor_driver,
+)
+
+# Camera source: picamera2 (Pi camera), synthetic (test pattern), replay
+# (directory of images or an MJPEG file, set with CAMERA_REPLAY_PATH) or shm
+# (frames published by camera_daemon.py to shared memory CAMERA_SHM_NAME)
+CAMERA_SOURCE = os.environ.get("CAMERA_SOURCE", "picamera2")
+CAMERA_REPLAY_PATH = os.environ.get("CAMERA_REPLAY_PATH")
+CAMERA_SHM_NAME = os.environ.get("CAMERA_SHM_NAME", "agri_robo_camera")
+# Several cameras, each with its own pipeline, e.g. "canopy=picamera2:0,leaves=picamera2:1"
+# (see parse_camera_configs). Without it there is one camera, id "0", from CAMERA_SOURCE.
+CAMERAS = os.environ.get("CAMERAS", "")
+if CAMERAS:
+    CAMERA_CONFIGS = parse_camera_configs(CAMERAS, CAMERA_REPLAY_PATH, CAMERA_SHM_NAME)
+else:
+    CAMERA_CONFIGS = [CameraConfig("0", CAMERA_SOURCE, 0, CAMERA_REPLAY_PATH, CAMERA_SHM_NAME)]
+CAMERA_CONFIGS_BY_ID = {config.id: config for config in CAMERA_CONFIGS}
+# Camera routes without ?camera= use the first camera
+DEFAULT_CAMERA_ID = CAMERA_CONFIGS[0].id
+CAMERA_ID_HELP = f"Camera id (see /api/cameras); defaults to '{DEFAULT_CAMERA_ID}'"
+for _config in CAMERA_CONFIGS:
+    if not camera_source_available(_config.source):
+        print(f"Warning: camera source '{_config.source}' for camera '{_config.id}' not available. "
+              f"Its camera features will be disabled.")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -38,7 +68,33 @@ async def lifespan(app: FastAPI):
         traceback.print_exc()
         print("API will start but disease detection will not work until model is available.")
     
+    try:
+        detection_store.start()
+        print(f"Detection log: {detection_store.db_path}")
+    except Exception as e:
+        print(f"Warning: detection log unavailable: {e}")
+    
+    job_manager.start()
+    
+    if RECORDING_AUTOSTART:
+        for pipeline in camera_pipelines.values():
+            pipeline.start_recording()
+    
+    try:
+        motor_controller.driver.open()
+    except MotorDriverError as e:
+        print(f"Warning: {e}. Using the simulated motor driver.")
+        motor_controller.driver = SimulatedMotorDriver()
+    
     yield
+    
+    # Shutdown
+    motor_controller.close()
+    for pipeline in camera_pipelines.values():
+        pipeline.stop_analysis()
+        pipeline.stop_recording()
+    job_manager.shutdown()
+    detection_store.stop()
 
 app = FastAPI(title="Agri ROBO API", version="1.0.0", lifespan=lifespan)
 
@@ -64,16 +120,160 @@ app.add_middleware(
 # Global variables for model and class mapping
 model = None
 class_mapping = None
+model_version = None
+
+# Persistent detection log (written in batches by a background thread)
+DETECTION_DB_PATH = os.environ.get(
+    "DETECTION_DB_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "detections.db")
+)
+DETECTION_RETENTION_DAYS = int(os.environ.get("DETECTION_RETENTION_DAYS", "180"))
+detection_store = DetectionStore(DETECTION_DB_PATH, retention_days=DETECTION_RETENTION_DAYS)
+
+# Asynchronous detection jobs (state and results kept on disk under JOBS_DIR)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JOBS_DIR = os.environ.get("JOBS_DIR", os.path.join(PROJECT_ROOT, "jobs"))
+# Server-side directories submitted as jobs must live under this root
+JOB_INPUT_ROOT = os.environ.get("JOB_INPUT_ROOT", PROJECT_ROOT)
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_BATCH_SIZE = int(os.environ.get("JOB_BATCH_SIZE", "16"))
+
+def score_images(images):
+    """Run a batch of RGB PIL images through the model (used by detection jobs)"""
+    if model is None or class_mapping is None:
+        raise RuntimeError("Model not loaded")
+    
+    expected_shape = model.input_shape[1:]
+    img_size = (expected_shape[0], expected_shape[1])
+    batch = np.stack([preprocess_image(image, img_size) for image in images])
+    predictions = model.predict(batch, verbose=0)
+    return [summarize_prediction(probabilities, class_mapping) for probabilities in predictions]
+
+job_manager = JobManager(JOBS_DIR, score_images, max_workers=JOB_WORKERS, batch_size=JOB_BATCH_SIZE)
+
+def classify_array(rgb_array):
+    """Classify one RGB uint8 array (e.g. a lores analysis frame)"""
+    return score_images([Image.fromarray(rgb_array, 'RGB')])[0]
+
+def classify_and_hash_array(rgb_array):
+    """classify_array plus the sha256 of the pixels logged with the detection"""
+    return classify_array(rgb_array), hashlib.sha256(rgb_array).hexdigest()
+
+def analysis_size():
+    """Lores stream size (width, height) matching the model input"""
+    if model is not None:
+        height, width = model.input_shape[1:3]
+        return (width, height)
+    return DEFAULT_ANALYSIS_SIZE
+
+# Camera settings
+CAMERA_TARGET_FPS = 30
+# Sensor rate while nobody watches, so capture can resume without re-opening the camera
+CAMERA_KEEP_WARM_FPS = float(os.environ.get("CAMERA_KEEP_WARM_FPS", "2"))
+CAMERA_MAIN_SIZE = (640, 480)
+# Preallocated sensor frame buffers reused by the capture pipeline
+CAMERA_FRAME_POOL_SIZE = int(os.environ.get("CAMERA_FRAME_POOL_SIZE", "4"))
+# Upper bound on freed Pillow image blocks kept for reuse (shared by all cameras)
+PILLOW_BLOCK_CACHE_MB = int(os.environ.get("PILLOW_BLOCK_CACHE_MB", "32"))
 
-# Global variables for camera
-camera = None
-camera_streaming = False
-camera_lock = threading.Lock()
-current_frame = None
+# Recent processed frames kept for capture, so /api/camera/capture can return
+# the sharpest (least motion-blurred) frame instead of the newest one
+CAPTURE_HISTORY_FRAMES = int(os.environ.get("CAPTURE_HISTORY_FRAMES", "15"))
+CAPTURE_WINDOW_MS = int(os.environ.get("CAPTURE_WINDOW_MS", "500"))
+
+# Snapshot polling keeps the camera at full rate for this long after each request
+SNAPSHOT_LEASE_SECONDS = float(os.environ.get("SNAPSHOT_LEASE_SECONDS", "5"))
+# Sequence numbers restart with the process, so ETags carry a per-process prefix
+SNAPSHOT_ETAG_PREFIX = f"{int(time.time() * 1000):x}"
+
+# Rolling recording of the published JPEG frames (MJPEG segments plus index)
+RECORDINGS_DIR = os.environ.get("RECORDINGS_DIR", os.path.join(PROJECT_ROOT, "recordings"))
+RECORDING_SEGMENT_SECONDS = int(os.environ.get("RECORDING_SEGMENT_SECONDS", "60"))
+RECORDING_QUOTA_MB = int(os.environ.get("RECORDING_QUOTA_MB", "2048"))
+# Record whenever the camera runs, without calling /api/recordings/start
+RECORDING_AUTOSTART = os.environ.get("RECORDING_AUTOSTART", "0") == "1"
+
+# Low-resolution analysis stream (Picamera2 "lores"), sized for the model input
+# and delivered at its own frame rate
+ANALYSIS_FPS = float(os.environ.get("ANALYSIS_FPS", "2"))
+DEFAULT_ANALYSIS_SIZE = (128, 128)
+
+# Motors: gpio (H-bridge via gpiozero) or simulated; gpio by default when gpiozero is installed
+MOTOR_DRIVER = os.environ.get("MOTOR_DRIVER", "gpio" if GPIOZERO_AVAILABLE else "simulated")
+# BCM pins: left forward, left backward, right forward, right backward
+MOTOR_PINS = tuple(int(pin) for pin in os.environ.get("MOTOR_PINS", "17,18,22,23").split(","))
+# Moving motors stop when no command or heartbeat arrives for this long
+MOTOR_DEADMAN_MS = int(os.environ.get("MOTOR_DEADMAN_MS", "500"))
+# Latency pings on the motor WebSocket
+MOTOR_PING_SECONDS = float(os.environ.get("MOTOR_PING_SECONDS", "1.0"))
+if MOTOR_DRIVER not in MOTOR_DRIVER_NAMES:
+    print(f"Warning: unknown motor driver '{MOTOR_DRIVER}'. Using the simulated motor driver.")
+    MOTOR_DRIVER = "simulated"
+motor_controller = MotorController(create_motor_driver(MOTOR_DRIVER, MOTOR_PINS),
+                                   deadman_seconds=MOTOR_DEADMAN_MS / 1000)
+
+def make_camera_source(config):
+    """Build a configured camera's source (opened by its pipeline)"""
+    return create_camera_source(
+        config.source,
+        main_size=CAMERA_MAIN_SIZE,
+        lores_size=analysis_size(),
+        fps=CAMERA_TARGET_FPS,
+        replay_path=config.replay_path,
+        camera_num=config.camera_num,
+        shm_name=config.shm_name,
+    )
+
+def make_camera_pipeline(config):
+    # With several cameras each records to its own folder, sharing the quota equally
+    if len(CAMERA_CONFIGS) == 1:
+        recordings_dir = RECORDINGS_DIR
+    else:
+        recordings_dir = os.path.join(RECORDINGS_DIR, config.id)
+    return CameraPipeline(
+        functools.partial(make_camera_source, config),
+        classify_array,
+        target_fps=CAMERA_TARGET_FPS,
+        history_frames=CAPTURE_HISTORY_FRAMES,
+        analysis_fps=ANALYSIS_FPS,
+        keep_warm_fps=CAMERA_KEEP_WARM_FPS,
+        frame_pool_size=CAMERA_FRAME_POOL_SIZE,
+        recorder=FrameRecorder(
+            recordings_dir,
+            segment_seconds=RECORDING_SEGMENT_SECONDS,
+            quota_bytes=RECORDING_QUOTA_MB * 1024 * 1024 // len(CAMERA_CONFIGS),
+            name=config.id,
+        ),
+        name=config.id,
+    )
+
+# One pipeline per camera: capture, color processing and JPEG encoding run on
+# separate threads; the camera endpoints read from its broadcasters. Pipelines
+# share no locks, so the cameras run in parallel.
+camera_pipelines = {config.id: make_camera_pipeline(config) for config in CAMERA_CONFIGS}
+camera_pipeline = camera_pipelines[DEFAULT_CAMERA_ID]
+
+# Pillow's block cache is process wide: size it once, for the largest frame (Pillow
+# stores RGB as 4 bytes per pixel) and per frame in flight the unpacked frame, the
+# color-corrected frame and a scaled tier, on every camera
+configure_pillow_blocks(
+    CAMERA_MAIN_SIZE[0] * CAMERA_MAIN_SIZE[1] * 4,
+    len(CAMERA_CONFIGS) * CAMERA_FRAME_POOL_SIZE * 3,
+    PILLOW_BLOCK_CACHE_MB * 1024 * 1024,
+)
+
+def get_camera(camera_id):
+    """Pipeline for a camera id (the default camera when None)"""
+    pipeline = camera_pipelines.get(camera_id or DEFAULT_CAMERA_ID)
+    if pipeline is None:
+        raise HTTPException(
+            status_code=404, detail=f"Unknown camera '{camera_id}'. Cameras: {list(camera_pipelines)}"
+        )
+    return pipeline
 
 def load_model_and_mapping():
     """Load the disease detection model and class mapping - TensorFlow 2.20.0 compatible"""
-    global model, class_mapping
+    global model, class_mapping, model_version
     
     # Get the project root directory (parent of backend folder)
     backend_dir = os.path.dirname(os.path.abspath(__file__))
@@ -138,6 +338,7 @@ def load_model_and_mapping():
             )
     
     print(f"Model loaded successfully! Input shape: {model.input_shape}")
+    model_version = f"{os.path.basename(model_path)}@{int(os.path.getmtime(model_path))}"
     
     with open(mapping_path, 'r') as f:
         mapping = json.load(f)
@@ -172,7 +373,25 @@ async def health_check():
         "model_path_checked": [model_path, model_path_best],
         "mapping_path_checked": mapping_path,
         "num_classes": len(class_mapping) if class_mapping else 0,
-        "tensorflow_version": tf.__version__
+        "model_version": model_version,
+        "camera_source": CAMERA_CONFIGS_BY_ID[DEFAULT_CAMERA_ID].source,
+        "camera_streaming": camera_pipeline.streaming,
+        "camera_state": camera_pipeline.state,
+        "stream_viewers": camera_pipeline.viewers,
+        "camera_pipeline": camera_pipeline.metrics(),
+        # Every camera's state, pipeline metrics and recorder; the camera_* fields above are the default camera's
+        "cameras": {
+            camera_id: {
+                **pipeline.status(),
+                "pipeline": pipeline.metrics(),
+                "recording": pipeline.recorder.stats(),
+            }
+            for camera_id, pipeline in camera_pipelines.items()
+        },
+        "tensorflow_version": tf.__version__,
+        "detection_log": detection_store.stats(),
+        "recording": camera_pipeline.recorder.stats(),
+        "motors": motor_controller.stats()
     }
 
 @app.post("/api/detect-disease")
@@ -181,6 +400,8 @@ async def detect_disease(file: UploadFile = File(...)):
     Detect disease from uploaded image using the trained CNN model.
     The model automatically detects the required input size (128x128 or 224x224).
     """
+    start_time = time.perf_counter()
+    
     if model is None or class_mapping is None:
         raise HTTPException(
             status_code=503,
@@ -199,6 +420,7 @@ async def detect_disease(file: UploadFile = File(...)):
         contents = await file.read()
         if len(contents) == 0:
             raise HTTPException(status_code=400, detail="Uploaded file is empty")
+        image_hash = hashlib.sha256(contents).hexdigest()
         
         image = Image.open(io.BytesIO(contents))
         
@@ -211,32 +433,7 @@ async def detect_disease(file: UploadFile = File(...)):
         expected_shape = model.input_shape[1:]  # Skip batch dimension
         img_size = (expected_shape[0], expected_shape[1])  # (height, width)
         
-        # Convert to RGB if needed
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Image enhancement for better detection accuracy
-        # Enhance contrast (helps with disease visibility)
-        enhancer = ImageEnhance.Contrast(image)
-        image = enhancer.enhance(1.2)  # Increase contrast by 20%
-        
-        # Enhance sharpness (helps with edge detection)
-        enhancer = ImageEnhance.Sharpness(image)
-        image = enhancer.enhance(1.1)  # Increase sharpness by 10%
-        
-        # Optional: Apply slight denoising (uncomment if images are noisy)
-        # image = image.filter(ImageFilter.MedianFilter(size=3))
-        
-        # Resize image to match model input size (use high-quality resampling)
-        image = image.resize(img_size, Image.Resampling.LANCZOS)
-        
-        # Convert to array and normalize (matching training: rescale=1./255)
-        img_array = np.array(image, dtype=np.float32)
-        img_array = img_array / 255.0  # Normalize to [0, 1] range
-        
-        # Ensure values are in valid range [0, 1]
-        img_array = np.clip(img_array, 0.0, 1.0)
-        
+        img_array = preprocess_image(image, img_size)
         img_array = np.expand_dims(img_array, axis=0)  # Add batch dimension
         
         # Verify shape matches model input
@@ -247,41 +444,22 @@ async def detect_disease(file: UploadFile = File(...)):
         
         # Make prediction
         predictions = model.predict(img_array, verbose=0)
-        predicted_class_idx = np.argmax(predictions[0])
-        confidence = float(predictions[0][predicted_class_idx] * 100)
-        
-        # Get disease name from mapping
-        disease_name = class_mapping.get(predicted_class_idx, "Unknown")
-        # Format disease name (handle Not_A_Leaf and Tomato___ classes)
-        if disease_name == "Not_A_Leaf":
-            formatted_disease = "Not A Leaf"
-        else:
-            formatted_disease = disease_name.replace("Tomato___", "").replace("_", " ").title()
-        
-        # Get top 3 predictions
-        top_predictions = []
-        prediction_dict = {}
-        for idx, prob in enumerate(predictions[0]):
-            class_name = class_mapping.get(idx, "Unknown")
-            # Format class name (handle Not_A_Leaf and Tomato___ classes)
-            if class_name == "Not_A_Leaf":
-                formatted_name = "Not A Leaf"
-            else:
-                formatted_name = class_name.replace("Tomato___", "").replace("_", " ").title()
-            prediction_dict[formatted_name] = float(prob * 100)
+        result = summarize_prediction(predictions[0], class_mapping)
         
-        sorted_predictions = sorted(prediction_dict.items(), key=lambda x: x[1], reverse=True)
-        top_predictions = [{"name": name, "confidence": round(conf, 2)} for name, conf in sorted_predictions[:3]]
-        
-        is_healthy = "healthy" in disease_name.lower()
+        # Log detection (queued; written to disk by the background writer)
+        detection_store.record(
+            source="upload",
+            disease=result["raw_disease_name"],
+            confidence=result["confidence"],
+            top_k=result["top_predictions"],
+            image_hash=image_hash,
+            model_version=model_version,
+            latency_ms=round((time.perf_counter() - start_time) * 1000, 2),
+        )
         
         return JSONResponse({
             "success": True,
-            "disease": formatted_disease,
-            "confidence": round(confidence, 2),
-            "is_healthy": is_healthy,
-            "top_predictions": top_predictions,
-            "raw_disease_name": disease_name,
+            **result,
             "model_info": {
                 "input_shape": str(model.input_shape),
                 "num_classes": len(class_mapping)
@@ -299,23 +477,248 @@ async def detect_disease(file: UploadFile = File(...)):
             detail=f"Error processing image: {str(e)}"
         )
 
-# Placeholder endpoints for motor and servo control (for future implementation)
+@app.get("/api/detections")
+def list_detections(
+    start: Optional[float] = Query(None, description="Start of time range (unix seconds, inclusive)"),
+    end: Optional[float] = Query(None, description="End of time range (unix seconds, exclusive)"),
+    disease: Optional[str] = Query(None, description="Raw class name, e.g. Tomato___Late_blight"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=500),
+):
+    """Page through logged detections, newest first"""
+    try:
+        return detection_store.query(start=start, end=end, disease=disease, page=page, page_size=page_size)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to query detections: {str(e)}")
+
+@app.get("/api/stats")
+def detection_stats(
+    bucket: str = Query("hour", description="Bucket size: hour or day"),
+    start: Optional[float] = Query(None, description="Start of time range (unix seconds); defaults to 24 buckets back"),
+    end: Optional[float] = Query(None, description="End of time range (unix seconds); defaults to now"),
+    disease: Optional[str] = Query(None, description="Raw class name to restrict the series to"),
+):
+    """Detections per class per time bucket, served from pre-aggregated rollups"""
+    try:
+        return detection_store.rollup_stats(bucket=bucket, start=start, end=end, disease=disease)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to load stats: {str(e)}")
+
+# ============================================
+# Detection Job Endpoints
+# ============================================
+
+def save_uploads(files, inputs_dir):
+    """Copy uploaded files into a job's inputs directory; returns their paths in order"""
+    image_paths = []
+    for index, file in enumerate(files):
+        name = os.path.basename(file.filename or f"image_{index}.jpg")
+        path = os.path.join(inputs_dir, f"{index:05d}_{name}")
+        file.file.seek(0)
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(file.file, f)
+        image_paths.append(path)
+    return image_paths
+
+@app.post("/api/jobs")
+async def create_job(
+    files: Optional[List[UploadFile]] = File(None),
+    directory: Optional[str] = Form(None),
+):
+    """
+    Submit a detection job for uploaded images or a server-side directory.
+    Returns immediately with a job id; poll /api/jobs/{job_id} for progress.
+    """
+    if model is None or class_mapping is None:
+        raise HTTPException(status_code=503, detail="Model not loaded. Run cnn_train.py to generate it.")
+    
+    if not files and not directory:
+        raise HTTPException(status_code=400, detail="Provide image files or a directory")
+    
+    try:
+        if directory:
+            input_root = os.path.realpath(JOB_INPUT_ROOT)
+            directory = os.path.realpath(os.path.join(input_root, directory))
+            if os.path.commonpath([input_root, directory]) != input_root:
+                raise HTTPException(status_code=400, detail=f"Directory must be inside {input_root}")
+            if not os.path.isdir(directory):
+                raise HTTPException(status_code=400, detail=f"Directory not found: {directory}")
+            
+            image_paths = await asyncio.to_thread(find_images, directory)
+            if not image_paths:
+                raise HTTPException(status_code=400, detail=f"No images found in {directory}")
+            job = job_manager.submit(image_paths, source=directory)
+        else:
+            job_id, inputs_dir = job_manager.new_job_dir()
+            try:
+                # Copying large batches to disk would otherwise block the event loop
+                image_paths = await asyncio.to_thread(save_uploads, files, inputs_dir)
+                job = job_manager.submit(image_paths, source="upload", job_id=job_id)
+            except BaseException:
+                # Rejected (e.g. JobLimitError) or failed: do not leave the uploads behind
+                await asyncio.to_thread(job_manager.discard_job_dir, job_id)
+                raise
+        
+        return job
+    
+    except HTTPException:
+        raise
+    except JobLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to create job: {str(e)}")
+
+@app.get("/api/jobs")
+async def list_jobs():
+    """List detection jobs, newest first"""
+    return {"jobs": job_manager.list()}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get job status and progress"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a job; images already scored keep their results"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+@app.get("/api/jobs/{job_id}/results")
+async def job_results(job_id: str):
+    """Stream job results as newline-delimited JSON, following the job until it finishes"""
+    if job_manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    
+    results_path = job_manager.results_path(job_id)
+    
+    def read_from(offset):
+        with open(results_path, 'rb') as f:
+            f.seek(offset)
+            return f.read()
+    
+    async def stream_results():
+        offset = 0
+        while True:
+            # Check status before reading so no batch written after it is missed
+            finished = job_manager.get(job_id)["status"] in FINISHED_STATES
+            # File reads run in the threadpool; waiting between polls stays on the loop
+            data = await asyncio.to_thread(read_from, offset)
+            
+            # Only forward complete lines
+            data = data[:data.rfind(b'\n') + 1]
+            if data:
+                offset += len(data)
+                yield data
+            elif finished:
+                break
+            else:
+                await asyncio.sleep(0.5)
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+# ============================================
+# Motor and Servo Endpoints
+# ============================================
+
 @app.post("/api/motor/control")
 async def motor_control(direction: str):
     """
-    Control robot motors (placeholder for future GPIO implementation)
+    Send one motor command. The motors keep moving only while commands or
+    heartbeats keep arriving (see MOTOR_DEADMAN_MS); interactive control
+    should use the /api/motor/ws WebSocket instead.
     """
-    valid_directions = ["front", "back", "left", "right", "stop"]
-    if direction.lthower() not in valid_directions:
-        raise HTTPException(status_code=400, detail=f"Invalid direction. Must be one of: {valid_directions}")
+    direction = direction.lower()
+    if direction not in MOTOR_DIRECTIONS:
+        raise HTTPException(status_code=400, detail=f"Invalid direction. Must be one of: {list(MOTOR_DIRECTIONS)}")
     
-    # TODO: Implement GPIO control when Raspberry Pi is available
+    motor_controller.submit(direction)
     return {
         "success": True,
         "message": f"Motor command received: {direction}",
-        "note": "GPIO control not yet implemented"
+        "direction": direction,
+        "deadman_ms": MOTOR_DEADMAN_MS
     }
 
+@app.get("/api/motor/status")
+async def motor_status():
+    """Motor driver, current direction, command counters and latencies"""
+    return motor_controller.stats()
+
+@app.websocket("/api/motor/ws")
+async def motor_ws(websocket: WebSocket):
+    """
+    Low-latency motor control. JSON messages:
+    
+    - client {"type": "command", "direction", "seq", "t"}: queued without
+      waiting for the driver (a newer command replaces one not yet applied)
+      and answered with {"type": "ack", "seq", "direction", "t"}, echoing
+      the client's `t` so it can measure the round trip
+    - client {"type": "heartbeat"}: keeps the motion this client started
+      running; without its commands or heartbeats for MOTOR_DEADMAN_MS the
+      motors stop
+    - server {"type": "ping", "t", "direction", "rtt_ms"} every
+      MOTOR_PING_SECONDS; the client answers {"type": "pong", "t"}
+    
+    Motion started by a client stops when its connection closes.
+    """
+    await websocket.accept()
+    session = object()
+    # Acks and pings come from two tasks
+    send_lock = asyncio.Lock()
+    
+    async def send(message):
+        async with send_lock:
+            await websocket.send_json(message)
+    
+    async def receive_messages():
+        while True:
+            message = await websocket.receive_json()
+            if not isinstance(message, dict):
+                continue
+            kind = message.get("type")
+            if kind == "command":
+                direction = str(message.get("direction", "")).lower()
+                if direction not in MOTOR_DIRECTIONS:
+                    await send({"type": "error", "seq": message.get("seq"),
+                                "detail": f"Invalid direction. Must be one of: {list(MOTOR_DIRECTIONS)}"})
+                    continue
+                motor_controller.submit(direction, owner=session)
+                await send({"type": "ack", "seq": message.get("seq"), "direction": direction, "t": message.get("t")})
+            elif kind == "heartbeat":
+                motor_controller.heartbeat(session)
+            elif kind == "pong" and isinstance(message.get("t"), (int, float)):
+                motor_controller.record_rtt(message["t"])
+    
+    async def send_pings():
+        while True:
+            await asyncio.sleep(MOTOR_PING_SECONDS)
+            await send({"type": "ping", "t": time.time(), "direction": motor_controller.direction,
+                        "rtt_ms": motor_controller.rtt.snapshot()["last_ms"]})
+    
+    tasks = [asyncio.create_task(receive_messages()), asyncio.create_task(send_pings())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, WebSocketDisconnect):
+                pass
+            except Exception as e:
+                print(f"Motor WebSocket error: {e}")
+        motor_controller.release(session)
+
+# Placeholder endpoint for servo control (for future implementation)
 @app.post("/api/servo/control")
 async def servo_control(action: str):
     """
@@ -336,218 +739,483 @@ async def servo_control(action: str):
 # Camera Endpoints
 # ============================================
 
-def convert_frame_to_rgb(frame):
-    """Convert camera frame to RGB format"""
-    if len(frame.shape) == 3 and frame.shape[2] == 4:
-        rgb_frame = np.zeros((frame.shape[0], frame.shape[1], 3), dtype=np.uint8)
-        rgb_frame[:, :, 0] = frame[:, :, 2]  # R
-        rgb_frame[:, :, 1] = frame[:, :, 1]  # G
-        rgb_frame[:, :, 2] = frame[:, :, 0]  # B
-        return rgb_frame
-    elif len(frame.shape) == 3 and frame.shape[2] == 3:
-        return frame
-    else:
-        return frame
+@app.get("/api/cameras")
+async def list_cameras():
+    """Configured cameras with their source and lifecycle state"""
+    return {
+        "default": DEFAULT_CAMERA_ID,
+        "items": [
+            {
+                "source": config.source,
+                "available": camera_source_available(config.source),
+                **camera_pipelines[config.id].status(),
+            }
+            for config in CAMERA_CONFIGS
+        ],
+    }
 
-def process_frame(frame):
-    """Apply minimal post-processing for natural look"""
-    rgb_frame = convert_frame_to_rgb(frame)
-    mean_brightness = rgb_frame.mean()
+@app.post("/api/camera/start")
+async def start_camera(camera: Optional[str] = Query(None, description=CAMERA_ID_HELP)):
+    """
+    Start the camera in the background and return immediately. Poll (or
+    long-poll) /api/camera/status until it reports ready.
+    """
+    pipeline = get_camera(camera)
+    config = CAMERA_CONFIGS_BY_ID[pipeline.name]
+    if not camera_source_available(config.source):
+        raise HTTPException(status_code=503, detail=f"Camera source '{config.source}' not available on this system")
     
-    image = Image.fromarray(rgb_frame, 'RGB')
+    status = pipeline.request_start()
+    return {"success": True, "message": "Camera starting", **status}
+
+@app.get("/api/camera/status")
+async def camera_status(
+    wait: float = Query(0, ge=0, le=30,
+                        description="Wait up to this many seconds for the camera to be ready or stopped"),
+    camera: Optional[str] = Query(None, description=CAMERA_ID_HELP),
+):
+    """
+    Camera lifecycle state: stopped, starting, warming, streaming or stopping.
+    ready is true once the first frame has been processed; error holds the
+    reason the last start failed.
+    """
+    pipeline = get_camera(camera)
+    if wait > 0:
+        # Awaits a state change on the event loop; no worker thread is held while waiting
+        return await pipeline.wait_for_state_async(("streaming", "stopped"), wait)
+    return pipeline.status()
+
+@app.get("/api/camera/stream")
+async def camera_stream(
+    request: Request,
+    quality: str = Query(DEFAULT_TIER, description=f"Stream tier: {', '.join(TIER_NAMES)} or auto"),
+    camera: Optional[str] = Query(None, description=CAMERA_ID_HELP),
+):
+    """
+    MJPEG stream endpoint for live video.
+    Each client always gets the newest frame (stale frames are dropped, never
+    queued). With quality=auto the tier follows the client's measured send
+    throughput.
+    """
+    pipeline = get_camera(camera)
+    if not pipeline.streaming:
+        raise HTTPException(status_code=400, detail="Camera not started. Call /api/camera/start first")
+    if quality != "auto" and quality not in TIER_NAMES:
+        raise HTTPException(status_code=400, detail=f"Invalid quality. Must be one of: {TIER_NAMES + ['auto']}")
     
-    # Minimal brightness correction only if very dark
-    if mean_brightness < 30:
-        enhancer = ImageEnhance.Brightness(image)
-        image = enhancer.enhance(1.3)
+    controller = AdaptiveTierController(target_fps=CAMERA_TARGET_FPS) if quality == "auto" else None
+    # Achieved fps, skipped frames and frame age for this client (listed in /api/camera/metrics)
+    stream_stats = StreamStats(controller.tier if controller else quality)
     
-    # Very minimal color correction
-    r, g, b = image.split()
-    b = ImageEnhance.Brightness(b).enhance(0.98)
-    r = ImageEnhance.Brightness(r).enhance(1.01)
-    g = ImageEnhance.Brightness(g).enhance(1.00)
-    image = Image.merge('RGB', (r, g, b))
+    async def generate_frames():
+        # Async generator: runs on the event loop, so viewers never occupy threadpool threads
+        tier = stream_stats.tier
+        pipeline.add_stream(stream_stats)
+        pipeline.tier_subscriptions.acquire(tier)
+        # Raises capture to full rate and resumes encoding
+        pipeline.acquire("stream")
+        last_sequence = 0
+        try:
+            while pipeline.streaming:
+                # Wait (without blocking the loop) until the encode stage publishes a newer frame
+                frame = await pipeline.broadcaster.wait_for_frame_async(last_sequence, timeout=1.0)
+                if frame is None:
+                    if await request.is_disconnected():
+                        break
+                    continue
+                last_sequence = frame.sequence
+                
+                # Right after a tier switch the frame may predate the new tier; send the nearest one
+                data = frame_variant(frame, tier)
+                
+                stream_stats.record_send(frame.sequence, frame.timestamp)
+                send_started = time.perf_counter()
+                yield mjpeg_part(data)
+                
+                if controller is not None:
+                    # Resumes once the server has handed the chunk to the socket
+                    new_tier = controller.record_send(len(data), time.perf_counter() - send_started)
+                    if new_tier != tier:
+                        pipeline.tier_subscriptions.switch(tier, new_tier)
+                        tier = stream_stats.tier = new_tier
+        finally:
+            pipeline.release("stream")
+            pipeline.tier_subscriptions.release(tier)
+            pipeline.remove_stream(stream_stats)
     
-    return np.array(image)
+    return StreamingResponse(
+        generate_frames(),
+        media_type="multipart/x-mixed-replace; boundary=frame",
+        headers={
+            "Cache-Control": "no-cache, no-store, must-revalidate",
+            "Pragma": "no-cache",
+            "Expires": "0",
+            "X-Accel-Buffering": "no",  # Disable buffering for nginx if used
+            "X-Stream-Id": str(stream_stats.id),
+        }
+    )
 
-def camera_capture_thread():
-    """Background thread that continuously captures frames when streaming"""
-    global camera, camera_streaming, current_frame
+@app.websocket("/api/camera/ws")
+async def camera_ws(websocket: WebSocket, quality: str = DEFAULT_TIER, window: int = 2, camera: Optional[str] = None):
+    """
+    Binary WebSocket video: one message per JPEG with a header carrying the
+    sequence number, capture timestamp and, when it changes, the latest live
+    classification (format in video_transport.py). At most `window` frames
+    are unacknowledged at a time; a slow client skips frames instead of
+    having them buffered.
+    """
+    pipeline = camera_pipelines.get(camera or DEFAULT_CAMERA_ID)
+    if pipeline is None:
+        await websocket.close(code=1008, reason=f"Unknown camera '{camera}'")
+        return
+    if not pipeline.streaming:
+        await websocket.close(code=1008, reason="Camera not started. Call /api/camera/start first")
+        return
+    if quality not in TIER_NAMES or not 1 <= window <= 10:
+        await websocket.close(code=1008, reason=f"quality must be one of {TIER_NAMES}; window 1-10")
+        return
     
-    while True:
-        if camera_streaming and camera is not None:
-            try:
-                with camera_lock:
-                    if camera is not None and camera_streaming:
-                        request = camera.capture_request()
-                        frame = request.make_array("main")
-                        request.release()
-                        
-                        # Process frame
-                        rgb_frame = process_frame(frame)
-                        
-                        # Convert to JPEG
-                        image = Image.fromarray(rgb_frame, 'RGB')
-                        img_bytes = io.BytesIO()
-                        image.save(img_bytes, format='JPEG', quality=85)
-                        img_bytes.seek(0)
-                        
-                        # Update frame (no lock needed for simple assignment)
-                        frame_data = img_bytes.getvalue()
-                        current_frame = frame_data
-                time.sleep(0.033)  # ~30 FPS
-            except Exception as e:
-                print(f"Camera capture error: {e}")
-                import traceback
-                traceback.print_exc()
-                time.sleep(0.1)
-        else:
-            time.sleep(0.1)
-
-# Start camera capture thread
-if PICAMERA2_AVAILABLE:
-    camera_thread = threading.Thread(target=camera_capture_thread, daemon=True)
-    camera_thread.start()
-
-@app.post("/api/camera/start")
-async def start_camera():
-    """Start Pi camera stream"""
-    global camera, camera_streaming
+    await websocket.accept()
+    stream_stats = StreamStats(quality)
+    pipeline.add_stream(stream_stats)
+    pipeline.tier_subscriptions.acquire(quality)
+    pipeline.acquire("stream")
     
-    if not PICAMERA2_AVAILABLE:
-        raise HTTPException(status_code=503, detail="picamera2 not available on this system")
+    # Sequence numbers sent but not yet acknowledged, oldest first
+    in_flight = deque()
+    credit = asyncio.Event()
     
-    try:
-        with camera_lock:
-            if camera is None:
-                camera = Picamera2(camera_num=0)
-                
-                # Configure camera
-                try:
-                    config = camera.create_preview_configuration(
-                        main={"size": (640, 480), "format": "RGB888"},
-                        colour_space="sRGB"
-                    )
-                    camera.configure(config)
-                except:
-                    config = camera.create_preview_configuration(main={"size": (640, 480)})
-                    camera.configure(config)
-                
-                # Set camera controls
+    async def receive_messages():
+        while True:
+            message = await websocket.receive_json()
+            if not isinstance(message, dict):
+                continue
+            ack = message.get("ack")
+            # Sequence numbers only; bool is an int subclass but never a valid ack
+            if isinstance(ack, int) and not isinstance(ack, bool):
+                while in_flight and in_flight[0] <= ack:
+                    in_flight.popleft()
+                credit.set()
+            new_tier = message.get("quality")
+            if new_tier in TIER_NAMES and new_tier != stream_stats.tier:
+                pipeline.tier_subscriptions.switch(stream_stats.tier, new_tier)
+                stream_stats.tier = new_tier
+    
+    async def send_frames():
+        last_sequence = 0
+        last_classification = None
+        while pipeline.streaming:
+            if len(in_flight) >= window:
+                # Out of credit: wait for an ack; frames published meanwhile are skipped
+                credit.clear()
                 try:
-                    camera.set_controls({
-                        "AwbEnable": True,
-                        "AeEnable": True,
-                    })
-                except:
+                    await asyncio.wait_for(credit.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
                     pass
-                
-                camera.start()
-                
-                # Warm up camera
-                for i in range(5):
-                    test_request = camera.capture_request()
-                    test_request.release()
-                    time.sleep(0.3)
+                continue
             
-            camera_streaming = True
-            # Reset frame buffer - wait a moment for first frame
-            current_frame = None
-            time.sleep(0.5)  # Give camera time to start capturing
-        
-        return {"success": True, "message": "Camera started"}
+            frame = await pipeline.broadcaster.wait_for_frame_async(last_sequence, timeout=1.0)
+            if frame is None:
+                continue
+            last_sequence = frame.sequence
+            data = frame_variant(frame, stream_stats.tier)
+            
+            metadata = None
+            classification = pipeline.live_analyzer.latest
+            if classification is not None and classification is not last_classification:
+                metadata = {"classification": classification}
+                last_classification = classification
+            
+            stream_stats.record_send(frame.sequence, frame.timestamp)
+            in_flight.append(frame.sequence)
+            await websocket.send_bytes(pack_video_message(frame.sequence, frame.timestamp, data, metadata))
     
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Failed to start camera: {str(e)}")
-
-@app.get("/api/camera/stream")
-async def camera_stream():
-    """MJPEG stream endpoint for live video"""
-    global camera_streaming, current_frame
+    tasks = [asyncio.create_task(receive_messages()), asyncio.create_task(send_frames())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Collect results so a client disconnect is not logged as an unhandled error
+        for task in tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, WebSocketDisconnect):
+                pass
+            except Exception as e:
+                print(f"Camera WebSocket error: {e}")
+        pipeline.release("stream")
+        pipeline.tier_subscriptions.release(stream_stats.tier)
+        pipeline.remove_stream(stream_stats)
     
-    if not camera_streaming:
+    try:
+        # Camera stopped (the client may already be gone)
+        await websocket.close(code=1001, reason="Camera stopped")
+    except Exception:
+        pass
+
+def snapshot_etag(camera_id, frame):
+    return f'"{SNAPSHOT_ETAG_PREFIX}-{camera_id}-{frame.sequence}"'
+
+@app.get("/api/camera/snapshot")
+async def camera_snapshot(
+    request: Request,
+    wait: float = Query(0, ge=0, le=30,
+                        description="Long-poll: if the client already has the latest frame, wait up to this many seconds for the next one"),
+    camera: Optional[str] = Query(None, description=CAMERA_ID_HELP),
+):
+    """
+    Latest encoded frame as a JPEG, for clients that poll instead of holding
+    an MJPEG connection. The ETag is derived from the frame sequence number;
+    send it back in If-None-Match to get a 304 when nothing has changed.
+    """
+    pipeline = get_camera(camera)
+    if not pipeline.streaming:
         raise HTTPException(status_code=400, detail="Camera not started. Call /api/camera/start first")
     
-    def generate_frames():
-        frame_count = 0
-        while camera_streaming:
-            # Wait for frame to be available (with timeout)
-            wait_count = 0
-            while current_frame is None and camera_streaming and wait_count < 100:
-                time.sleep(0.01)
-                wait_count += 1
-            
-            if current_frame:
-                try:
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + current_frame + b'\r\n')
-                    frame_count += 1
-                except Exception as e:
-                    print(f"Error yielding frame: {e}")
-                    break
-            else:
-                # If no frame available, wait a bit longer
-                time.sleep(0.1)
-            
-            time.sleep(0.033)  # ~30 FPS
+    broadcaster = pipeline.broadcaster
+    # Polling clients hold a snapshot consumer for a few seconds, so full-resolution frames keep being encoded
+    if pipeline.lease("snapshot", wait + SNAPSHOT_LEASE_SECONDS):
+        # Coming out of keep-warm (or scaled-only streaming) the published frame is stale; wait for a fresh one
+        await broadcaster.wait_for_frame_async(broadcaster.sequence, timeout=1.0)
+    frame = broadcaster.latest() or await broadcaster.wait_for_frame_async(0, timeout=1.0)
+    if frame is not None and frame.data is None:
+        # Encoded before the lease took effect, with only scaled stream tiers
+        frame = await broadcaster.wait_for_frame_async(frame.sequence, timeout=1.0) or frame
+    if frame is None:
+        raise HTTPException(status_code=503, detail="No frame available yet")
     
-    return StreamingResponse(
-        generate_frames(),
-        media_type="multipart/x-mixed-replace; boundary=frame",
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        client_tags = {tag.strip() for tag in if_none_match.split(",")}
+        if snapshot_etag(pipeline.name, frame) in client_tags or "*" in client_tags:
+            newer = None
+            if wait > 0:
+                newer = await broadcaster.wait_for_frame_async(frame.sequence, timeout=wait)
+            if newer is None:
+                return Response(status_code=304, headers={
+                    "ETag": snapshot_etag(pipeline.name, frame),
+                    "Cache-Control": "no-cache",
+                })
+            frame = newer
+    
+    return Response(
+        content=frame_variant(frame, DEFAULT_TIER),
+        media_type="image/jpeg",
         headers={
-            "Cache-Control": "no-cache, no-store, must-revalidate",
-            "Pragma": "no-cache",
-            "Expires": "0",
-            "X-Accel-Buffering": "no"  # Disable buffering for nginx if used
+            "ETag": snapshot_etag(pipeline.name, frame),
+            "Cache-Control": "no-cache",
+            "X-Frame-Sequence": str(frame.sequence),
+            "X-Frame-Timestamp": f"{frame.timestamp:.3f}",
         }
     )
 
 @app.post("/api/camera/capture")
-async def capture_image():
-    """Capture current frame from camera and return as image"""
-    global camera, camera_streaming, current_frame
-    
-    if not camera_streaming or current_frame is None:
+async def capture_image(
+    window_ms: int = Query(CAPTURE_WINDOW_MS, ge=0, le=5000,
+                           description="Pick the sharpest frame from this many ms before the newest"),
+    camera: Optional[str] = Query(None, description=CAMERA_ID_HELP),
+):
+    """Capture the sharpest recent frame from camera and return as image"""
+    pipeline = get_camera(camera)
+    # The history is filled even while idle (keep-warm); the last published JPEG is the fallback
+    sharpest = pipeline.history.sharpest(window_ms / 1000.0)
+    frame = pipeline.broadcaster.latest()
+    if not pipeline.streaming or (sharpest is None and frame is None):
         raise HTTPException(status_code=400, detail="Camera not streaming or no frame available")
     
     try:
-        # Get current frame
-        frame_data = current_frame
+        # Pick the least motion-blurred frame from the recent history
+        if sharpest is not None:
+            rgb, captured_at, sharpness = sharpest
+            frame_data = await asyncio.to_thread(encode_jpeg, Image.fromarray(rgb, 'RGB'), 85)
+        else:
+            frame_data, captured_at, sharpness = frame_variant(frame, DEFAULT_TIER), frame.timestamp, None
         
-        # Stop streaming
-        camera_streaming = False
+        # Stop streaming (the lifecycle thread releases the camera in the background)
+        pipeline.request_stop()
         
         # Return captured frame as JPEG
         return Response(
             content=frame_data,
             media_type="image/jpeg",
-            headers={"Content-Disposition": "inline; filename=captured.jpg"}
+            headers={
+                "Content-Disposition": "inline; filename=captured.jpg",
+                "X-Frame-Timestamp": f"{captured_at:.3f}",
+                "X-Frame-Sharpness": f"{sharpness:.1f}" if sharpness is not None else "",
+            }
         )
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to capture image: {str(e)}")
 
-@app.post("/api/camera/stop")
-async def stop_camera():
-    """Stop camera stream and release resources"""
-    global camera, camera_streaming, current_frame
+@app.post("/api/camera/detect")
+async def capture_and_detect(
+    window_ms: int = Query(CAPTURE_WINDOW_MS, ge=0, le=5000,
+                           description="Classify the sharpest frame from this many ms before the newest"),
+    include_image: bool = Query(True, description="Return the analyzed frame as a base64 JPEG"),
+    camera: Optional[str] = Query(None, description=CAMERA_ID_HELP),
+):
+    """
+    Classify the sharpest recent camera frame in one call. The RGB frame goes
+    straight from the capture pipeline into preprocessing and the model (no
+    JPEG encode/decode in between); streaming keeps running.
+    """
+    pipeline = get_camera(camera)
+    start_time = time.perf_counter()
     
-    try:
-        camera_streaming = False
-        current_frame = None
-        
-        with camera_lock:
-            if camera is not None:
-                camera.stop()
-                camera.close()
-                camera = None
-        
-        return {"success": True, "message": "Camera stopped"}
+    if model is None or class_mapping is None:
+        raise HTTPException(status_code=503, detail="Model not loaded. Run cnn_train.py to generate it.")
+    if not pipeline.streaming:
+        raise HTTPException(status_code=400, detail="Camera not started. Call /api/camera/start first")
     
+    sharpest = pipeline.history.sharpest(window_ms / 1000.0)
+    if sharpest is None:
+        raise HTTPException(status_code=400, detail="No frame available yet")
+    rgb, captured_at, sharpness = sharpest
+    
+    try:
+        # Model, hash and encoder run off the event loop so streams keep flowing
+        result, image_hash = await asyncio.to_thread(classify_and_hash_array, rgb)
+        image_data = None
+        if include_image:
+            jpeg = await asyncio.to_thread(encode_jpeg, Image.fromarray(rgb, 'RGB'), 85)
+            image_data = "data:image/jpeg;base64," + base64.b64encode(jpeg).decode('ascii')
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to stop camera: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Failed to analyze camera frame: {str(e)}")
+    
+    latency_ms = round((time.perf_counter() - start_time) * 1000, 2)
+    detection_store.record(
+        source=f"camera:{pipeline.name}",
+        disease=result["raw_disease_name"],
+        confidence=result["confidence"],
+        top_k=result["top_predictions"],
+        image_hash=image_hash,
+        model_version=model_version,
+        latency_ms=latency_ms,
+    )
+    
+    return {
+        "success": True,
+        **result,
+        "snapshot": {
+            "image": image_data,
+            "captured_at": captured_at,
+            "sharpness": round(sharpness, 1),
+            "width": rgb.shape[1],
+            "height": rgb.shape[0],
+        },
+        "latency_ms": latency_ms,
+        "model_info": {
+            "input_shape": str(model.input_shape),
+            "num_classes": len(class_mapping)
+        }
+    }
+
+@app.post("/api/camera/stop")
+async def stop_camera(camera: Optional[str] = Query(None, description=CAMERA_ID_HELP)):
+    """Stop the camera stream and release the camera in the background"""
+    pipeline = get_camera(camera)
+    status = pipeline.request_stop()
+    return {"success": True, "message": "Camera stopping", **status}
+
+@app.post("/api/camera/analysis/start")
+async def start_live_analysis(camera: Optional[str] = Query(None, description=CAMERA_ID_HELP)):
+    """Start classifying the low-res analysis stream in the background"""
+    pipeline = get_camera(camera)
+    if model is None or class_mapping is None:
+        raise HTTPException(status_code=503, detail="Model not loaded. Run cnn_train.py to generate it.")
+    source = pipeline.source
+    if source is not None and source.lores_format is None:
+        raise HTTPException(status_code=400, detail="Camera has no lores analysis stream")
+    
+    pipeline.start_analysis()
+    return {"success": True, "message": "Live analysis started", "analysis_fps": ANALYSIS_FPS}
+
+@app.post("/api/camera/analysis/stop")
+async def stop_live_analysis(camera: Optional[str] = Query(None, description=CAMERA_ID_HELP)):
+    """Stop live classification"""
+    pipeline = get_camera(camera)
+    pipeline.stop_analysis()
+    return {"success": True, "message": "Live analysis stopped"}
+
+@app.get("/api/camera/analysis")
+async def live_analysis_status(camera: Optional[str] = Query(None, description=CAMERA_ID_HELP)):
+    """Latest live classification of the analysis stream"""
+    pipeline = get_camera(camera)
+    return {
+        **pipeline.live_analyzer.status(),
+        "analysis_fps": ANALYSIS_FPS,
+        "camera": pipeline.source.info() if pipeline.source is not None else None,
+    }
+
+@app.post("/api/recordings/start")
+async def start_recording(camera: Optional[str] = Query(None, description=CAMERA_ID_HELP)):
+    """Record the camera feed to rolling on-disk segments (keeps capture at full rate)"""
+    pipeline = get_camera(camera)
+    pipeline.start_recording()
+    return {"success": True, "message": "Recording started", **pipeline.recorder.stats()}
+
+@app.post("/api/recordings/stop")
+async def stop_recording(camera: Optional[str] = Query(None, description=CAMERA_ID_HELP)):
+    """Stop recording; recorded segments are kept"""
+    pipeline = get_camera(camera)
+    await asyncio.to_thread(pipeline.stop_recording)
+    return {"success": True, "message": "Recording stopped"}
+
+@app.get("/api/recordings")
+def list_recordings(
+    start: Optional[float] = Query(None, description="Start of time range (unix seconds)"),
+    end: Optional[float] = Query(None, description="End of time range (unix seconds)"),
+    camera: Optional[str] = Query(None, description=CAMERA_ID_HELP),
+):
+    """Recording status and the segments overlapping a time range"""
+    pipeline = get_camera(camera)
+    recorder = pipeline.recorder
+    return {**recorder.stats(), "items": recorder.segments(start=start, end=end)}
+
+@app.get("/api/recordings/clip")
+def recording_clip(
+    start: float = Query(..., description="Start of time range (unix seconds, inclusive)"),
+    end: Optional[float] = Query(None, description="End of time range (unix seconds, inclusive); defaults to now"),
+    camera: Optional[str] = Query(None, description=CAMERA_ID_HELP),
+):
+    """
+    Recorded frames in a time range as an MJPEG file (concatenated JPEGs),
+    served from the segment files as stored, without re-encoding
+    """
+    pipeline = get_camera(camera)
+    end = time.time() if end is None else end
+    if end < start:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    
+    # The segment files are opened up front, so the Content-Length below still
+    # holds if the quota evicts a segment while the clip is streaming
+    ranges = pipeline.recorder.open_frame_ranges(start, end)
+    frames = sum(len(records) for _, records in ranges)
+    if frames == 0:
+        raise HTTPException(status_code=404, detail="No recorded frames in this time range")
+    size = sum(records[-1][1] + records[-1][2] - records[0][1] for _, records in ranges)
+    
+    return StreamingResponse(
+        FrameRecorder.iter_ranges(ranges),
+        media_type="video/x-motion-jpeg",
+        headers={
+            "Content-Length": str(size),
+            "Content-Disposition": f"attachment; filename=clip-{int(start)}-{int(end)}.mjpeg",
+            "X-Frame-Count": str(frames),
+            "X-First-Frame-Timestamp": f"{ranges[0][1][0][0]:.3f}",
+            "X-Last-Frame-Timestamp": f"{ranges[-1][1][-1][0]:.3f}",
+        }
+    )
+
+@app.get("/api/camera/metrics")
+async def camera_metrics(camera: Optional[str] = Query(None, description=CAMERA_ID_HELP)):
+    """Per-stage timings, achieved fps, dropped frames and frame age of the camera pipeline and each stream"""
+    pipeline = get_camera(camera)
+    return pipeline.metrics()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,291 @@
+"""
+Motor control: drivers and the command controller behind /api/motor.
+
+Drivers turn a direction into wheel motion and hide the hardware:
+
+- GpioMotorDriver: two DC motors on an H-bridge (e.g. L298N) through
+  gpiozero, one forward and one backward pin per side.
+- SimulatedMotorDriver: records commands instead of moving anything, for
+  development machines and tests.
+
+MotorController sits between the API and the driver. It applies commands
+on its own thread, coalescing bursts: a command that arrives while the
+previous one is still pending replaces it, and repeating the current
+direction never reaches the driver. It is also the deadman: while the
+motors run, the client driving them must keep sending commands or
+heartbeats, and when none arrives within deadman_seconds (browser closed,
+Wi-Fi dropped) the motors are stopped. Other clients cannot keep them
+running.
+"""
+
+import sys
+import threading
+import time
+from collections import deque
+
+from frame_pacing import AgeStats
+
+# Add system dist-packages to path for gpiozero
+if '/usr/lib/python3/dist-packages' not in sys.path:
+    sys.path.insert(0, '/usr/lib/python3/dist-packages')
+
+try:
+    from gpiozero import Motor
+    GPIOZERO_AVAILABLE = True
+except ImportError:
+    GPIOZERO_AVAILABLE = False
+
+MOTOR_DIRECTIONS = ("front", "back", "left", "right", "stop")
+MOTOR_DRIVER_NAMES = ("gpio", "simulated")
+
+# Wheel speeds (left, right): 1 forward, -1 backward; left/right turn in place
+DIRECTION_SPEEDS = {
+    "front": (1, 1),
+    "back": (-1, -1),
+    "left": (-1, 1),
+    "right": (1, -1),
+    "stop": (0, 0),
+}
+
+
+class MotorDriverError(Exception):
+    """Raised when a motor driver cannot be opened"""
+
+
+class MotorDriver:
+    """Interface for motor backends used by MotorController"""
+
+    name = "base"
+
+    def open(self):
+        """Claim the hardware; motors start stopped"""
+
+    def drive(self, direction):
+        """Run the motors in one of MOTOR_DIRECTIONS until the next call"""
+        raise NotImplementedError
+
+    def close(self):
+        """Stop the motors and release the hardware"""
+
+    def info(self):
+        return {"driver": self.name}
+
+
+class GpioMotorDriver(MotorDriver):
+    """Left and right DC motors on an H-bridge via gpiozero"""
+
+    name = "gpio"
+
+    def __init__(self, pins=(17, 18, 22, 23), speed=1.0):
+        """pins: (left forward, left backward, right forward, right backward) BCM numbers"""
+        self.pins = pins
+        self.speed = speed
+        self._motors = None
+
+    def open(self):
+        if not GPIOZERO_AVAILABLE:
+            raise MotorDriverError("gpiozero not available on this system")
+        left_forward, left_backward, right_forward, right_backward = self.pins
+        try:
+            self._motors = (
+                Motor(forward=left_forward, backward=left_backward),
+                Motor(forward=right_forward, backward=right_backward),
+            )
+        except Exception as e:
+            raise MotorDriverError(f"Could not claim motor GPIO pins {list(self.pins)}: {e}")
+
+    def drive(self, direction):
+        for motor, speed in zip(self._motors, DIRECTION_SPEEDS[direction]):
+            if speed > 0:
+                motor.forward(self.speed)
+            elif speed < 0:
+                motor.backward(self.speed)
+            else:
+                motor.stop()
+
+    def close(self):
+        if self._motors is not None:
+            for motor in self._motors:
+                motor.stop()
+                motor.close()
+            self._motors = None
+
+    def info(self):
+        return {"driver": self.name, "pins": list(self.pins), "speed": self.speed}
+
+
+class SimulatedMotorDriver(MotorDriver):
+    """Keeps the commanded direction and a log of recent commands instead of moving"""
+
+    name = "simulated"
+
+    def __init__(self, delay=0.0, log_size=100):
+        """delay simulates a slow driver call (seconds)"""
+        self.delay = delay
+        self.direction = "stop"
+        self.calls = 0
+        # (unix time, direction) of recent drive() calls
+        self.log = deque(maxlen=log_size)
+
+    def drive(self, direction):
+        if self.delay:
+            time.sleep(self.delay)
+        self.direction = direction
+        self.calls += 1
+        self.log.append((time.time(), direction))
+
+    def close(self):
+        self.direction = "stop"
+
+    def info(self):
+        return {"driver": self.name, "direction": self.direction, "drive_calls": self.calls}
+
+
+def create_motor_driver(name, pins=None):
+    """Build a motor driver by name (see MOTOR_DRIVER_NAMES)"""
+    if name == "gpio":
+        return GpioMotorDriver(pins) if pins else GpioMotorDriver()
+    if name == "simulated":
+        return SimulatedMotorDriver()
+    raise MotorDriverError(f"Unknown motor driver: {name}. Must be one of: {list(MOTOR_DRIVER_NAMES)}")
+
+
+class MotorController:
+    """Applies the latest motor command on a worker thread and stops the motors when clients go quiet"""
+
+    def __init__(self, driver, deadman_seconds=0.5):
+        self.driver = driver
+        self.deadman_seconds = deadman_seconds
+        self.direction = "stop"
+
+        self.received = 0
+        self.applied = 0
+        self.coalesced = 0
+        self.deadman_stops = 0
+        self.errors = 0
+        # Command received to driver call finished
+        self.apply_latency = AgeStats()
+        # Ping sent to pong received, measured on the control WebSocket
+        self.rtt = AgeStats()
+
+        self._condition = threading.Condition()
+        # (direction, owner, received at) waiting for the worker; newer commands replace it
+        self._pending = None
+        self._owner = None
+        self._last_heartbeat = time.monotonic()
+        self._closed = False
+        self._thread = None
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="motor-control", daemon=True)
+            self._thread.start()
+
+    def submit(self, direction, owner=None):
+        """
+        Queue a command (one of MOTOR_DIRECTIONS) without waiting for the
+        driver. owner identifies the client, so its disconnect can stop the
+        motion it started. Also counts as a heartbeat.
+        """
+        with self._condition:
+            self.received += 1
+            if self._pending is not None:
+                # Not applied yet: only the latest direction matters
+                self.coalesced += 1
+            self._pending = (direction, owner, time.time())
+            self._last_heartbeat = time.monotonic()
+            self._ensure_thread()
+            self._condition.notify()
+
+    def heartbeat(self, owner=None):
+        """
+        The client driving the motors is still connected; postpones the
+        deadman stop. Heartbeats from other clients are ignored, so an idle
+        viewer cannot keep a stalled driver's motion going.
+        """
+        with self._condition:
+            pending_owner = self._pending[1] if self._pending is not None else None
+            if owner is not None and owner in (self._owner, pending_owner):
+                self._last_heartbeat = time.monotonic()
+
+    def release(self, owner):
+        """A client went away: stop the motors if it started the current motion"""
+        with self._condition:
+            pending_owner = self._pending[1] if self._pending is not None else None
+            if owner is not None and owner in (self._owner, pending_owner):
+                self._pending = ("stop", None, time.time())
+                self._ensure_thread()
+                self._condition.notify()
+
+    def record_rtt(self, sent_at):
+        """Record a round trip for a ping sent at `sent_at` (unix seconds)"""
+        self.rtt.record(sent_at)
+
+    def _next_command(self):
+        """Wait for a command, or produce a stop once the deadman expires (caller holds the lock)"""
+        while self._pending is None and not self._closed:
+            if self.direction == "stop":
+                self._condition.wait()
+                continue
+            remaining = self._last_heartbeat + self.deadman_seconds - time.monotonic()
+            if remaining <= 0:
+                print(f"Motor deadman: no heartbeat for {self.deadman_seconds}s, stopping motors")
+                self.deadman_stops += 1
+                return ("stop", None, time.time())
+            self._condition.wait(remaining)
+        if self._pending is None:
+            return ("stop", None, time.time())
+        command, self._pending = self._pending, None
+        return command
+
+    def _run(self):
+        while True:
+            with self._condition:
+                direction, owner, received_at = self._next_command()
+                closed = self._closed
+
+            # The driver is called outside the lock, so commands arriving meanwhile coalesce
+            if direction == self.direction:
+                with self._condition:
+                    self.coalesced += 1
+                    self._owner = owner if direction != "stop" else None
+            else:
+                try:
+                    self.driver.drive(direction)
+                    self.direction = direction
+                    with self._condition:
+                        self.applied += 1
+                        self._owner = owner if direction != "stop" else None
+                    self.apply_latency.record(received_at)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Motor driver error: {e}")
+            if closed:
+                return
+
+    def close(self):
+        """Stop the motors and release the driver"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        try:
+            self.driver.close()
+        except Exception as e:
+            print(f"Motor driver error on close: {e}")
+
+    def stats(self):
+        return {
+            **self.driver.info(),
+            "direction": self.direction,
+            "deadman_ms": round(self.deadman_seconds * 1000),
+            "commands_received": self.received,
+            "commands_applied": self.applied,
+            "commands_coalesced": self.coalesced,
+            "deadman_stops": self.deadman_stops,
+            "driver_errors": self.errors,
+            "apply_latency": self.apply_latency.snapshot(),
+            "rtt": self.rtt.snapshot(),
+        }
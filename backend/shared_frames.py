@@ -0,0 +1,218 @@
+"""
+Shared-memory ring of raw camera frames.
+
+Only one process can own the camera. In daemon mode (camera_daemon.py) that
+process writes every captured RGB frame into a multiprocessing.shared_memory
+ring, and any number of local processes (the API, inference workers) attach
+to it by name and map frames as NumPy arrays without JPEG round-trips or
+pickling.
+
+Layout of the shared block:
+
+    header    uint64[9]: magic, version, slots, height, width, channels,
+              latest sequence, latest slot, generation
+    counters  uint64[slots]   per-slot seqlock counter (odd while writing)
+    sequences uint64[slots]   frame sequence number stored in the slot
+    stamps    float64[slots]  capture timestamp (unix seconds)
+    data      uint8[slots, height, width, channels], 64-byte aligned
+
+The single writer bumps a slot's counter to odd, copies the frame in, stores
+its sequence and timestamp, bumps the counter back to even and then
+publishes the slot as latest. A reader records the (even) counter before
+using a slot and checks it is unchanged afterwards; with several slots a
+reader has several frame periods to finish with a zero-copy view before the
+writer comes back around.
+
+Every ring gets a new generation number when it is created. A restarted
+daemon creates a new block under the same name, while readers still map the
+old one, which never advances again; readers re-attach by name and compare
+generations to tell a restart from a stalled camera (see SharedMemorySource).
+"""
+
+import sys
+import time
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+SHM_MAGIC = 0x4147524943414D31  # "AGRICAM1"
+SHM_VERSION = 2
+HEADER_FIELDS = 9
+(_MAGIC, _VERSION, _SLOTS, _HEIGHT, _WIDTH, _CHANNELS, _LATEST_SEQUENCE, _LATEST_SLOT,
+ _GENERATION) = range(HEADER_FIELDS)
+
+# Reads that find the slot being written retry this many times, backing off
+# from READ_BACKOFF up to READ_BACKOFF_MAX seconds between attempts
+READ_RETRIES = 8
+READ_BACKOFF = 0.0001
+READ_BACKOFF_MAX = 0.002
+
+DEFAULT_SHM_NAME = "agri_robo_camera"
+
+# array: view into shared memory (or a private copy); counter: slot seqlock value when read
+SharedFrame = namedtuple("SharedFrame", ["array", "sequence", "timestamp", "slot", "counter"])
+
+
+def _align(offset, alignment=64):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def _layout(slots):
+    """Byte offsets of (counters, sequences, stamps, data)"""
+    counters = HEADER_FIELDS * 8
+    sequences = counters + slots * 8
+    stamps = sequences + slots * 8
+    data = _align(stamps + slots * 8)
+    return counters, sequences, stamps, data
+
+
+class SharedFrameRing:
+    """Single-writer, many-reader ring of fixed-size uint8 frames in shared memory"""
+
+    def __init__(self, shm, owner):
+        self._shm = shm
+        self.owner = owner
+        buf = shm.buf
+
+        self._header = np.ndarray((HEADER_FIELDS,), dtype=np.uint64, buffer=buf)
+        if int(self._header[_MAGIC]) != SHM_MAGIC or int(self._header[_VERSION]) != SHM_VERSION:
+            raise ValueError(f"Shared memory {shm.name} is not a camera frame ring")
+        self.slots = int(self._header[_SLOTS])
+        self.shape = (int(self._header[_HEIGHT]), int(self._header[_WIDTH]), int(self._header[_CHANNELS]))
+
+        counters, sequences, stamps, data = _layout(self.slots)
+        self._counters = np.ndarray((self.slots,), dtype=np.uint64, buffer=buf, offset=counters)
+        self._sequences = np.ndarray((self.slots,), dtype=np.uint64, buffer=buf, offset=sequences)
+        self._stamps = np.ndarray((self.slots,), dtype=np.float64, buffer=buf, offset=stamps)
+        self._data = np.ndarray((self.slots,) + self.shape, dtype=np.uint8, buffer=buf, offset=data)
+
+    @classmethod
+    def create(cls, name, shape, slots=4):
+        """Create the ring (camera daemon side); shape is (height, width, channels)"""
+        height, width, channels = shape
+        size = _layout(slots)[3] + slots * height * width * channels
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a daemon that did not shut down cleanly
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.uint64, buffer=shm.buf)
+        header[:] = 0
+        header[_SLOTS], header[_HEIGHT], header[_WIDTH], header[_CHANNELS] = slots, height, width, channels
+        header[_GENERATION] = time.time_ns()
+        header[_VERSION] = SHM_VERSION
+        header[_MAGIC] = SHM_MAGIC
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Map an existing ring (reader side); raises FileNotFoundError if no daemon runs"""
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            shm = shared_memory.SharedMemory(name=name)
+            # Readers must not unlink the block when they exit
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def generation(self):
+        """Identifies this block; a restarted daemon's ring has a different one"""
+        return int(self._header[_GENERATION])
+
+    @property
+    def sequence(self):
+        """Sequence number of the latest complete frame (0 before the first)"""
+        return int(self._header[_LATEST_SEQUENCE])
+
+    def write(self, frame, timestamp=None):
+        """Copy one frame into the next slot and publish it; returns its sequence number"""
+        sequence = self.sequence + 1
+        slot = sequence % self.slots
+        self._counters[slot] += 1  # odd: slot being written
+        np.copyto(self._data[slot], frame)
+        self._sequences[slot] = sequence
+        self._stamps[slot] = time.time() if timestamp is None else timestamp
+        self._counters[slot] += 1  # even: slot complete
+        self._header[_LATEST_SLOT] = slot
+        self._header[_LATEST_SEQUENCE] = sequence
+        return sequence
+
+    def latest(self):
+        """
+        Zero-copy view of the latest frame, or None before the first frame.
+        The view stays valid while still_valid(frame) is True. Returns None
+        as well if the writer keeps the slot busy through READ_RETRIES reads.
+        """
+        for attempt in range(READ_RETRIES):
+            if attempt:
+                # Give the writer time to finish the slot instead of spinning against it
+                time.sleep(min(READ_BACKOFF * 2 ** (attempt - 1), READ_BACKOFF_MAX))
+            slot = int(self._header[_LATEST_SLOT])
+            counter = int(self._counters[slot])
+            if counter == 0 or counter % 2:
+                if self.sequence == 0:
+                    return None
+                continue  # Being rewritten; the header will point elsewhere shortly
+            frame = SharedFrame(
+                self._data[slot], int(self._sequences[slot]), float(self._stamps[slot]), slot, counter
+            )
+            if int(self._counters[slot]) == counter:
+                return frame
+        return None
+
+    def still_valid(self, frame):
+        """True if the slot behind a zero-copy frame has not been overwritten since it was read"""
+        return int(self._counters[frame.slot]) == frame.counter
+
+    def copy_latest(self, out=None):
+        """
+        Private copy of the latest frame (into `out` if given), verified
+        against concurrent writes; None if no consistent copy could be made
+        """
+        for _ in range(READ_RETRIES):
+            frame = self.latest()
+            if frame is None:
+                return None
+            if out is None:
+                array = frame.array.copy()
+            else:
+                np.copyto(out, frame.array)
+                array = out
+            if self.still_valid(frame):
+                return frame._replace(array=array)
+        return None
+
+    def wait_for_frame(self, after_sequence, timeout=None, poll_interval=0.001, out=None):
+        """Wait until a frame newer than after_sequence exists; returns a copy, or None on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.sequence > after_sequence:
+                frame = self.copy_latest(out)
+                if frame is not None:
+                    return frame
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(poll_interval)
+
+    def close(self):
+        """Unmap the ring; the owner also removes it"""
+        # Views into the buffer must be released before it can be closed
+        self._header = self._counters = self._sequences = self._stamps = self._data = None
+        self._shm.close()
+        if self.owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
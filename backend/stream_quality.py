@@ -0,0 +1,135 @@
+"""
+Adaptive JPEG quality/resolution tiers for camera streaming.
+
+Each frame is encoded once per tier that currently has viewers, and the
+encoded bytes are shared by every client on that tier. Tiers nobody watches
+are not encoded at all, including the full-resolution default tier. Clients either pick a
+fixed tier or let an AdaptiveTierController move them between tiers based on
+how long each frame takes to send.
+"""
+
+import io
+import threading
+import time
+from collections import namedtuple
+
+from PIL import Image
+
+StreamTier = namedtuple("StreamTier", ["name", "quality", "scale"])
+
+# Ordered from best to cheapest; "high" is the full-resolution stream (also recorded and served as snapshots)
+STREAM_TIERS = (
+    StreamTier("high", 85, 1.0),
+    StreamTier("medium", 70, 0.75),
+    StreamTier("low", 50, 0.5),
+)
+TIERS_BY_NAME = {tier.name: tier for tier in STREAM_TIERS}
+TIER_NAMES = [tier.name for tier in STREAM_TIERS]
+DEFAULT_TIER = "high"
+
+
+def encode_jpeg(image, quality):
+    img_bytes = io.BytesIO()
+    image.save(img_bytes, format='JPEG', quality=quality)
+    return img_bytes.getvalue()
+
+
+def encode_tier(image, tier):
+    if tier.scale != 1.0:
+        size = (max(1, int(image.width * tier.scale)), max(1, int(image.height * tier.scale)))
+        image = image.resize(size, Image.Resampling.BILINEAR)
+    return encode_jpeg(image, tier.quality)
+
+
+def encode_tiers(image, tier_names):
+    """Encode an RGB PIL image once for every requested tier"""
+    return {name: encode_tier(image, TIERS_BY_NAME[name]) for name in tier_names}
+
+
+def frame_variant(frame, tier_name):
+    """
+    Encoded bytes of a published frame for a tier. A frame encoded before a
+    client switched tiers may lack the new one; the nearest encoded tier is
+    sent instead.
+    """
+    if not frame.variants:
+        return frame.data
+    index = TIER_NAMES.index(tier_name)
+    nearest = min(frame.variants, key=lambda name: abs(TIER_NAMES.index(name) - index))
+    return frame.variants[nearest]
+
+
+class TierSubscriptions:
+    """Counts stream clients per tier so only tiers somebody watches get encoded"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {name: 0 for name in TIER_NAMES}
+
+    def acquire(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def release(self, name):
+        with self._lock:
+            self._counts[name] = max(0, self._counts[name] - 1)
+
+    def switch(self, old_name, new_name):
+        with self._lock:
+            self._counts[old_name] = max(0, self._counts[old_name] - 1)
+            self._counts[new_name] += 1
+
+    def active(self):
+        with self._lock:
+            return [name for name, count in self._counts.items() if count > 0]
+
+    def counts(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+class AdaptiveTierController:
+    """
+    Chooses a stream tier for one client from measured send times.
+
+    After each frame the stream records how long the send took. If sending
+    takes most of the frame interval, the client cannot keep up and moves to
+    a cheaper tier; if it stays well under the interval for a while, it tries
+    the next better tier again.
+    """
+
+    def __init__(self, target_fps=30, start_tier=DEFAULT_TIER,
+                 downgrade_ratio=0.8, upgrade_ratio=0.3, upgrade_hold_seconds=5.0, smoothing=0.2):
+        self.frame_interval = 1.0 / target_fps
+        self.index = TIER_NAMES.index(start_tier)
+        self.downgrade_ratio = downgrade_ratio
+        self.upgrade_ratio = upgrade_ratio
+        self.upgrade_hold_seconds = upgrade_hold_seconds
+        self.smoothing = smoothing
+
+        self.send_time = 0.0
+        self.throughput = 0.0
+        self._last_change = time.monotonic()
+
+    @property
+    def tier(self):
+        return TIER_NAMES[self.index]
+
+    def record_send(self, num_bytes, seconds):
+        """Record one frame's send time; returns the tier to use for the next frame"""
+        self.send_time += self.smoothing * (seconds - self.send_time)
+        if seconds > 0:
+            self.throughput += self.smoothing * (num_bytes / seconds - self.throughput)
+
+        now = time.monotonic()
+        load = self.send_time / self.frame_interval
+        if load > self.downgrade_ratio and self.index < len(TIER_NAMES) - 1:
+            self.index += 1
+            self._last_change = now
+            # Frames on the new tier are smaller; start the average over
+            self.send_time = 0.0
+        elif (load < self.upgrade_ratio and self.index > 0
+              and now - self._last_change > self.upgrade_hold_seconds):
+            self.index -= 1
+            self._last_change = now
+        return self.tier
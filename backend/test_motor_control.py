@@ -0,0 +1,110 @@
+"""
+Check the motor command controller with the simulated driver (no robot
+needed): a burst of commands against a slow driver is coalesced to the
+latest direction, moving motors stop when the driving client's heartbeats
+stop (heartbeats from other clients do not count), and a client's
+disconnect stops the motion it started.
+
+Run from the backend folder: python test_motor_control.py
+"""
+
+import sys
+import time
+
+from motor_control import MotorController, SimulatedMotorDriver
+
+DEADMAN_SECONDS = 0.3
+
+
+def wait_for_direction(controller, direction, timeout=2.0):
+    deadline = time.time() + timeout
+    while controller.direction != direction and time.time() < deadline:
+        time.sleep(0.01)
+    return controller.direction == direction
+
+
+def check_coalescing():
+    driver = SimulatedMotorDriver(delay=0.05)
+    controller = MotorController(driver, deadman_seconds=5.0)
+    try:
+        for direction in ["front", "left", "right", "back"] * 5:
+            controller.submit(direction)
+        applied = wait_for_direction(controller, "back")
+        time.sleep(0.2)
+        stats = controller.stats()
+        print(f"1. {stats['commands_received']} commands, {driver.calls} driver calls, "
+              f"{stats['commands_coalesced']} coalesced, final direction {controller.direction}")
+        return applied and driver.calls < stats["commands_received"]
+    finally:
+        controller.close()
+
+
+def check_deadman():
+    driver = SimulatedMotorDriver()
+    controller = MotorController(driver, deadman_seconds=DEADMAN_SECONDS)
+    client = object()
+    try:
+        controller.submit("front", owner=client)
+        wait_for_direction(controller, "front")
+        # Heartbeats keep the motors running past the deadman timeout
+        for _ in range(6):
+            time.sleep(DEADMAN_SECONDS / 3)
+            controller.heartbeat(client)
+        kept_running = controller.direction == "front"
+        stopped = wait_for_direction(controller, "stop", timeout=DEADMAN_SECONDS * 3)
+        print(f"2. Running with heartbeats: {kept_running}; stopped after heartbeats ended: {stopped} "
+              f"({controller.deadman_stops} deadman stops)")
+        return kept_running and stopped and controller.deadman_stops == 1
+    finally:
+        controller.close()
+
+
+def check_heartbeat_owner():
+    driver = SimulatedMotorDriver()
+    controller = MotorController(driver, deadman_seconds=DEADMAN_SECONDS)
+    driving_client, idle_client = object(), object()
+    try:
+        controller.submit("front", owner=driving_client)
+        wait_for_direction(controller, "front")
+        # The driving client stalls; only the idle client keeps sending heartbeats
+        deadline = time.time() + DEADMAN_SECONDS * 3
+        while controller.direction != "stop" and time.time() < deadline:
+            controller.heartbeat(idle_client)
+            time.sleep(DEADMAN_SECONDS / 6)
+        stopped = controller.direction == "stop"
+        print(f"3. Stopped despite heartbeats from an idle client: {stopped} "
+              f"({controller.deadman_stops} deadman stops)")
+        return stopped and controller.deadman_stops == 1
+    finally:
+        controller.close()
+
+
+def check_release():
+    driver = SimulatedMotorDriver()
+    controller = MotorController(driver, deadman_seconds=5.0)
+    client, other_client = object(), object()
+    try:
+        controller.submit("left", owner=client)
+        wait_for_direction(controller, "left")
+        controller.release(other_client)
+        time.sleep(0.1)
+        kept_running = controller.direction == "left"
+        controller.release(client)
+        stopped = wait_for_direction(controller, "stop")
+        print(f"4. Running after another client left: {kept_running}; stopped after its client left: {stopped}")
+        return kept_running and stopped
+    finally:
+        controller.close()
+
+
+if __name__ == "__main__":
+    results = [check_coalescing(), check_deadman(), check_heartbeat_owner(), check_release()]
+    success = all(results)
+
+    print("\n" + "=" * 60)
+    if success:
+        print("✓ Motor commands are coalesced and stopped by the deadman and on disconnect")
+    else:
+        print("✗ Motor controller checks failed")
+    print("=" * 60)
+    sys.exit(0 if success else 1)
@@ -0,0 +1,120 @@
+"""
+Check that concurrent MJPEG viewers do not consume threadpool threads.
+Starts the API on a local port with a simulated frame source (no camera
+needed), opens 50 concurrent /api/camera/stream connections, and verifies
+that every viewer receives frames while the process thread count stays flat.
+
+Run from the backend folder: python test_stream_concurrency.py
+"""
+
+import socket
+import sys
+import threading
+import time
+
+import uvicorn
+
+import main
+
+NUM_VIEWERS = 50
+PORT = 8765
+FRAME = b'\xff\xd8' + b'\x00' * 20000 + b'\xff\xd9'  # JPEG-sized payload
+
+
+def publish_frames(stop_event, fps=30):
+    """Stand-in for the camera capture thread"""
+    while not stop_event.is_set():
+        main.camera_pipeline.broadcaster.publish(FRAME)
+        time.sleep(1.0 / fps)
+
+
+def open_viewer():
+    sock = socket.create_connection(("127.0.0.1", PORT))
+    sock.sendall(b"GET /api/camera/stream HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    sock.settimeout(5.0)
+    return sock
+
+
+def received_frame(sock):
+    """Read until at least one multipart frame boundary has arrived"""
+    data = b""
+    while data.count(b"--frame") < 1:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return False
+        data += chunk
+    return True
+
+
+def check_concurrent_viewers():
+    print("=" * 60)
+    print(f"Testing {NUM_VIEWERS} concurrent stream viewers")
+    print("=" * 60)
+
+    config = uvicorn.Config(main.app, host="127.0.0.1", port=PORT, log_level="warning", lifespan="off")
+    server = uvicorn.Server(config)
+    server_thread = threading.Thread(target=server.run, daemon=True)
+    server_thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    main.camera_pipeline.streaming = True
+    stop_event = threading.Event()
+    publisher = threading.Thread(target=publish_frames, args=(stop_event,), daemon=True)
+    publisher.start()
+
+    viewers = []
+    try:
+        # Warm up: one viewer, so any lazily created threads already exist
+        warmup = open_viewer()
+        received_frame(warmup)
+        warmup.close()
+        time.sleep(0.5)
+
+        threads_before = threading.active_count()
+        print(f"\n1. Threads before viewers: {threads_before}")
+
+        viewers = [open_viewer() for _ in range(NUM_VIEWERS)]
+        receiving = sum(1 for sock in viewers if received_frame(sock))
+        time.sleep(1.0)  # let every viewer stream for a while
+        receiving_after = sum(1 for sock in viewers if received_frame(sock))
+
+        threads_during = threading.active_count()
+        print(f"2. Viewers receiving frames: {receiving}/{NUM_VIEWERS} (after 1s: {receiving_after})")
+        print(f"3. Threads with {NUM_VIEWERS} viewers: {threads_during}")
+        print(f"4. Viewers tracked by API: {main.camera_pipeline.viewers}")
+
+        for sock in viewers:
+            sock.close()
+        viewers = []
+        deadline = time.time() + 5.0
+        while main.camera_pipeline.viewers > 0 and time.time() < deadline:
+            time.sleep(0.1)
+        print(f"5. Viewers tracked after disconnect: {main.camera_pipeline.viewers}")
+
+        success = (
+            receiving == NUM_VIEWERS
+            and receiving_after == NUM_VIEWERS
+            and threads_during <= threads_before
+            and main.camera_pipeline.viewers == 0
+        )
+    finally:
+        for sock in viewers:
+            sock.close()
+        stop_event.set()
+        main.camera_pipeline.streaming = False
+        server.should_exit = True
+        server_thread.join(timeout=5.0)
+
+    print("\n" + "=" * 60)
+    if success:
+        print("✓ Viewers are served without extra threads and released on disconnect")
+    else:
+        print("✗ Stream viewers consumed threads or were not released")
+    print("=" * 60)
+    return success
+
+
+if __name__ == "__main__":
+    success = check_concurrent_viewers()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,50 @@
+"""
+Wire formats for the camera video transports.
+
+MJPEG (/api/camera/stream): each JPEG is one multipart/x-mixed-replace part.
+
+WebSocket (/api/camera/ws): each JPEG is one binary message:
+
+    offset  size  field
+    0       1     version (VIDEO_MESSAGE_VERSION)
+    1       8     frame sequence number (uint64, little endian)
+    9       8     capture timestamp, unix seconds (float64)
+    17      4     metadata length in bytes, 0 if none (uint32)
+    21      n     metadata: UTF-8 JSON, e.g. {"classification": {...}}
+    21+n    ...   JPEG bytes
+
+Clients reply with text messages: {"ack": <sequence>} once a frame has been
+handled (this drives flow control), and optionally {"quality": "<tier>"} to
+change stream tier.
+"""
+
+import json
+import struct
+
+VIDEO_MESSAGE_VERSION = 1
+VIDEO_HEADER = struct.Struct("<BQdI")
+
+MJPEG_BOUNDARY = b"frame"
+
+
+def mjpeg_part(data):
+    """One multipart/x-mixed-replace part for a JPEG"""
+    return (b'--' + MJPEG_BOUNDARY + b'\r\n'
+            b'Content-Type: image/jpeg\r\n'
+            b'Content-Length: ' + str(len(data)).encode() + b'\r\n\r\n' + data + b'\r\n')
+
+
+def pack_video_message(sequence, timestamp, data, metadata=None):
+    """Binary WebSocket message: header, optional JSON metadata, JPEG"""
+    meta = json.dumps(metadata, separators=(",", ":")).encode() if metadata else b""
+    return b"".join((VIDEO_HEADER.pack(VIDEO_MESSAGE_VERSION, sequence, timestamp, len(meta)), meta, data))
+
+
+def unpack_video_message(message):
+    """Inverse of pack_video_message; returns (sequence, timestamp, metadata or None, jpeg bytes)"""
+    version, sequence, timestamp, meta_length = VIDEO_HEADER.unpack_from(message)
+    if version != VIDEO_MESSAGE_VERSION:
+        raise ValueError(f"Unsupported video message version: {version}")
+    start = VIDEO_HEADER.size
+    metadata = json.loads(message[start:start + meta_length]) if meta_length else None
+    return sequence, timestamp, metadata, message[start + meta_length:]
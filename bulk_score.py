@@ -0,0 +1,250 @@
+"""
+Offline bulk scoring and evaluation over an image directory.
+
+Walks a directory (optionally with class subfolders, like the train/ and val/
+folders cnn_train.py consumes), decodes and preprocesses images in a process
+pool using the same preprocessing as the /api/detect-disease endpoint, runs
+batched inference, and writes one row per image to CSV or Parquet.
+
+When images sit in class subfolders, the folder name is used as the label and
+a confusion matrix with per-class precision and recall is reported.
+
+Usage:
+    python bulk_score.py val --output val_scores.csv
+    python bulk_score.py captures/2024-06-01 --output day.parquet --workers 4
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'backend'))
+
+from detection_jobs import find_images
+from inference import preprocess_image, summarize_prediction
+
+OUTPUT_FIELDS = ["path", "label", "predicted", "confidence", "correct", "top_predictions", "error"]
+
+
+def load_image(args):
+    """Process pool worker: decode and preprocess one image"""
+    path, img_size = args
+    try:
+        with Image.open(path) as image:
+            return path, preprocess_image(image, img_size), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def preprocess_in_pool(image_paths, img_size, workers, window):
+    """Yield (path, array, error) in input order, keeping at most `window` images in flight"""
+    # Spawn (not fork) so workers never inherit TensorFlow's threads
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending = deque()
+        for path in image_paths:
+            pending.append(pool.submit(load_image, (path, img_size)))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def label_for(path, root, class_names):
+    """Use the first path component below root as the label if it is a known class"""
+    relative = os.path.relpath(path, root)
+    folder = relative.split(os.sep)[0]
+    if folder != relative and folder in class_names:
+        return folder
+    return None
+
+
+def write_rows(rows, output_path):
+    if output_path.endswith('.parquet'):
+        try:
+            import pandas as pd
+        except ImportError:
+            print("Error: writing Parquet requires pandas and pyarrow (pip install pandas pyarrow)")
+            sys.exit(1)
+        pd.DataFrame(rows, columns=OUTPUT_FIELDS).to_parquet(output_path, index=False)
+    else:
+        with open(output_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=OUTPUT_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def evaluate(rows, class_mapping):
+    """Build a confusion matrix (rows = true class, columns = predicted) and per-class metrics"""
+    class_names = [class_mapping[i] for i in sorted(class_mapping)]
+    index = {name: i for i, name in enumerate(class_names)}
+    confusion = np.zeros((len(class_names), len(class_names)), dtype=np.int64)
+
+    for row in rows:
+        if row["label"] and row["predicted"] in index:
+            confusion[index[row["label"]], index[row["predicted"]]] += 1
+
+    per_class = {}
+    for i, name in enumerate(class_names):
+        true_positive = confusion[i, i]
+        predicted = confusion[:, i].sum()
+        actual = confusion[i, :].sum()
+        per_class[name] = {
+            "precision": round(float(true_positive / predicted), 4) if predicted else None,
+            "recall": round(float(true_positive / actual), 4) if actual else None,
+            "support": int(actual),
+        }
+
+    total = confusion.sum()
+    return {
+        "classes": class_names,
+        "confusion_matrix": confusion.tolist(),
+        "per_class": per_class,
+        "accuracy": round(float(np.trace(confusion) / total), 4) if total else None,
+        "labelled_images": int(total),
+    }
+
+
+def print_evaluation(evaluation):
+    print("\nPer-class metrics:")
+    print(f"  {'Class':<50} {'Precision':>10} {'Recall':>10} {'Support':>8}")
+    for name, metrics in evaluation["per_class"].items():
+        if metrics["support"] == 0 and metrics["precision"] is None:
+            continue
+        precision = f"{metrics['precision']:.3f}" if metrics["precision"] is not None else "-"
+        recall = f"{metrics['recall']:.3f}" if metrics["recall"] is not None else "-"
+        print(f"  {name:<50} {precision:>10} {recall:>10} {metrics['support']:>8}")
+
+    print("\nConfusion matrix (rows = true class, columns = predicted):")
+    for i, (name, counts) in enumerate(zip(evaluation["classes"], evaluation["confusion_matrix"])):
+        print(f"  {i:>2} {name[:40]:<40} " + " ".join(f"{c:>4}" for c in counts))
+
+    print(f"\nAccuracy: {evaluation['accuracy']} over {evaluation['labelled_images']} labelled images")
+
+
+def find_model_path(model_path):
+    if model_path:
+        return model_path
+    for name in ('tomato_disease_model_best.h5', 'tomato_disease_model.h5'):
+        candidate = os.path.join(PROJECT_ROOT, name)
+        if os.path.exists(candidate):
+            return candidate
+    print("Error: model file not found. Run cnn_train.py or pass --model.")
+    sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score every image in a directory with the disease model")
+    parser.add_argument("directory", help="Image directory (class subfolders enable evaluation)")
+    parser.add_argument("--output", default="scores.csv", help="Output file (.csv or .parquet)")
+    parser.add_argument("--model", help="Model file (default: best or final model in project root)")
+    parser.add_argument("--mapping", default=os.path.join(PROJECT_ROOT, 'class_mapping.json'),
+                        help="Class mapping JSON")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2,
+                        help="Processes used for decoding and preprocessing")
+    parser.add_argument("--report", help="Also write the evaluation report as JSON to this path")
+    args = parser.parse_args()
+
+    image_paths = find_images(args.directory)
+    if not image_paths:
+        print(f"No images found in {args.directory}")
+        sys.exit(1)
+
+    with open(args.mapping, 'r') as f:
+        class_mapping = {int(k): v for k, v in json.load(f).items()}
+    class_names = set(class_mapping.values())
+
+    from tensorflow.keras.models import load_model
+
+    model_path = find_model_path(args.model)
+    print(f"Loading model from: {model_path}")
+    model = load_model(model_path, compile=False)
+    img_size = model.input_shape[1:3]
+
+    print(f"Scoring {len(image_paths)} images from {args.directory} "
+          f"(batch size {args.batch_size}, {args.workers} workers)")
+
+    rows = []
+    batch_rows = []
+    batch_arrays = []
+    inference_time = 0.0
+    start_time = time.perf_counter()
+
+    def flush_batch():
+        nonlocal inference_time
+        if not batch_arrays:
+            return
+        t0 = time.perf_counter()
+        predictions = model.predict(np.stack(batch_arrays), verbose=0)
+        inference_time += time.perf_counter() - t0
+        for row, probabilities in zip(batch_rows, predictions):
+            result = summarize_prediction(probabilities, class_mapping)
+            row["predicted"] = result["raw_disease_name"]
+            row["confidence"] = result["confidence"]
+            row["top_predictions"] = json.dumps(result["top_predictions"])
+            if row["label"]:
+                row["correct"] = row["label"] == row["predicted"]
+        batch_rows.clear()
+        batch_arrays.clear()
+
+    window = args.batch_size * max(args.workers, 1) * 2
+    for path, array, error in preprocess_in_pool(image_paths, img_size, args.workers, window):
+        row = {
+            "path": os.path.relpath(path, args.directory),
+            "label": label_for(path, args.directory, class_names),
+            "predicted": None,
+            "confidence": None,
+            "correct": None,
+            "top_predictions": None,
+            "error": error,
+        }
+        rows.append(row)
+        if array is None:
+            continue
+        batch_rows.append(row)
+        batch_arrays.append(array)
+        if len(batch_arrays) >= args.batch_size:
+            flush_batch()
+            print(f"  {len(rows)}/{len(image_paths)} images", end="\r")
+    flush_batch()
+
+    elapsed = time.perf_counter() - start_time
+    scored = sum(1 for row in rows if row["error"] is None)
+
+    write_rows(rows, args.output)
+    print(f"\n✓ Wrote {len(rows)} rows to {args.output}")
+    print(f"  Scored: {scored}, unreadable: {len(rows) - scored}")
+    print(f"  Throughput: {len(rows) / elapsed:.1f} images/sec end-to-end, "
+          f"{scored / inference_time if inference_time else 0:.1f} images/sec inference only")
+
+    report = {
+        "directory": args.directory,
+        "images": len(rows),
+        "scored": scored,
+        "elapsed_seconds": round(elapsed, 3),
+        "images_per_second": round(len(rows) / elapsed, 2),
+    }
+    if any(row["label"] for row in rows):
+        evaluation = evaluate(rows, class_mapping)
+        print_evaluation(evaluation)
+        report["evaluation"] = evaluation
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"✓ Wrote report to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
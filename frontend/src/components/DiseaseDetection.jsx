@@ -9,6 +9,7 @@ function DiseaseDetection() {
   const [error, setError] = useState(null)
   const [cameraActive, setCameraActive] = useState(false)
   const [capturing, setCapturing] = useState(false)
+  const [analyzedFrame, setAnalyzedFrame] = useState(null)
   const videoRef = useRef(null)
 
   const handleImageUpload = (e) => {
@@ -28,18 +29,25 @@ function DiseaseDetection() {
   const startCamera = async () => {
     try {
       setError(null)
-      const response = await axios.post('/api/camera/start')
-      if (response.data.success) {
+      await axios.post('/api/camera/start')
+      // Start returns at once; wait for the first frame before opening the stream
+      const status = await axios.get('/api/camera/status', { params: { wait: 10 } })
+      if (status.data.error) {
+        throw new Error(status.data.error)
+      }
+      if (status.data.ready) {
         setCameraActive(true)
         setPreview(null)
         setSelectedImage(null)
         setResult(null)
         
         // Stream URL will be set by useEffect when cameraActive changes
+      } else {
+        setError('Camera is taking too long to start. Please try again.')
       }
     } catch (err) {
       console.error('Error starting camera:', err)
-      setError(err.response?.data?.detail || 'Failed to start camera. Please try again.')
+      setError(err.response?.data?.detail || err.message || 'Failed to start camera. Please try again.')
       setCameraActive(false)
     }
   }
@@ -48,6 +56,7 @@ function DiseaseDetection() {
     try {
       await axios.post('/api/camera/stop')
       setCameraActive(false)
+      setAnalyzedFrame(null)
       if (videoRef.current) {
         videoRef.current.src = ''
       }
@@ -56,6 +65,26 @@ function DiseaseDetection() {
     }
   }
 
+  const captureAndDetect = async () => {
+    if (!cameraActive) return
+    
+    try {
+      setLoading(true)
+      setError(null)
+      setResult(null)
+      
+      // One round-trip: the backend classifies the raw frame and keeps streaming
+      const response = await axios.post('/api/camera/detect')
+      setResult(response.data)
+      setAnalyzedFrame(response.data.snapshot?.image || null)
+    } catch (err) {
+      console.error('Error detecting from camera:', err)
+      setError(err.response?.data?.detail || 'Failed to detect disease. Please try again.')
+    } finally {
+      setLoading(false)
+    }
+  }
+
   const captureImage = async () => {
     if (!cameraActive) return
     
@@ -201,6 +230,16 @@ function DiseaseDetection() {
               </button>
             )}
             
+            {cameraActive && (
+              <button
+                onClick={captureAndDetect}
+                disabled={loading}
+                className="flex-1 px-4 py-3 bg-primary-600 text-white rounded-lg font-medium hover:bg-primary-700 transition-all disabled:opacity-50 disabled:cursor-not-allowed flex items-center justify-center gap-2"
+              >
+                {loading ? '⏳ Analyzing...' : '🔬 Detect Live'}
+              </button>
+            )}
+            
             {cameraActive && (
               <button
                 onClick={stopCamera}
@@ -228,6 +267,13 @@ function DiseaseDetection() {
                   console.log('Camera stream image loaded')
                 }}
               />
+              {analyzedFrame && (
+                <img
+                  src={analyzedFrame}
+                  alt="Analyzed Frame"
+                  className="absolute bottom-2 right-2 w-24 h-auto rounded border-2 border-white shadow-lg"
+                />
+              )}
               {!videoRef.current?.complete && (
                 <div className="absolute inset-0 flex items-center justify-center text-white">
                   <div className="text-center">
@@ -1,35 +1,112 @@
-import React, { useState } from 'react'
+import React, { useState, useEffect, useRef } from 'react'
 import axios from 'axios'
 
+// While driving, heartbeats keep the motors running; the backend stops them after MOTOR_DEADMAN_MS (500 ms) without one
+const HEARTBEAT_INTERVAL_MS = 150
+const RECONNECT_DELAY_MS = 1000
+
+function motorSocketUrl() {
+  const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws'
+  return `${protocol}://${window.location.host}/api/motor/ws`
+}
+
 function MotorControl() {
-  const [isMoving, setIsMoving] = useState(false)
-  const [currentDirection, setCurrentDirection] = useState(null)
+  const [currentDirection, setCurrentDirection] = useState('stop')
+  const [connected, setConnected] = useState(false)
+  const [commandRtt, setCommandRtt] = useState(null)
+  const wsRef = useRef(null)
+  const seqRef = useRef(0)
+  const directionRef = useRef('stop')
+  const httpPendingRef = useRef(false)
 
-  const handleMotorControl = async (direction) => {
-    setCurrentDirection(direction)
-    setIsMoving(true)
-    
+  const postCommand = async (direction) => {
+    // HTTP fallback while the WebSocket is down; one request at a time
+    if (httpPendingRef.current) return
+    httpPendingRef.current = true
+    const sentAt = performance.now()
     try {
-      const response = await axios.post('/api/motor/control', null, {
-        params: { direction }
-      })
-      console.log('Motor control response:', response.data)
+      await axios.post('/api/motor/control', null, { params: { direction } })
+      setCommandRtt(performance.now() - sentAt)
     } catch (error) {
       console.error('Error controlling motor:', error)
-      alert(`Motor control error: ${error.message}`)
     } finally {
-      // Reset after a short delay for visual feedback
-      setTimeout(() => {
-        setIsMoving(false)
-        setCurrentDirection(null)
-      }, 500)
+      httpPendingRef.current = false
+    }
+  }
+
+  useEffect(() => {
+    let closed = false
+    let reconnectTimer = null
+
+    const connect = () => {
+      const ws = new WebSocket(motorSocketUrl())
+      wsRef.current = ws
+
+      ws.onopen = () => setConnected(true)
+
+      ws.onmessage = (event) => {
+        const message = JSON.parse(event.data)
+        if (message.type === 'ack') {
+          setCommandRtt(performance.now() - message.t)
+        } else if (message.type === 'ping') {
+          ws.send(JSON.stringify({ type: 'pong', t: message.t }))
+          // The server may have stopped the motors (deadman or another client);
+          // motion started elsewhere is not adopted, so this tab never resends it
+          if (message.direction === 'stop') {
+            directionRef.current = 'stop'
+            setCurrentDirection('stop')
+          }
+        } else if (message.type === 'error') {
+          console.error('Motor control error:', message.detail)
+        }
+      }
+
+      ws.onclose = () => {
+        setConnected(false)
+        if (wsRef.current === ws) wsRef.current = null
+        if (!closed) reconnectTimer = setTimeout(connect, RECONNECT_DELAY_MS)
+      }
+    }
+
+    connect()
+
+    const heartbeatTimer = setInterval(() => {
+      // Only the tab driving the robot keeps it moving
+      if (directionRef.current === 'stop') return
+      const ws = wsRef.current
+      if (ws && ws.readyState === WebSocket.OPEN) {
+        ws.send(JSON.stringify({ type: 'heartbeat' }))
+      } else {
+        // Without the WebSocket, repeating the command keeps the motors running
+        postCommand(directionRef.current)
+      }
+    }, HEARTBEAT_INTERVAL_MS)
+
+    return () => {
+      closed = true
+      clearTimeout(reconnectTimer)
+      clearInterval(heartbeatTimer)
+      if (wsRef.current) wsRef.current.close()
+    }
+  }, [])
+
+  const handleMotorControl = (direction) => {
+    directionRef.current = direction
+    setCurrentDirection(direction)
+
+    const ws = wsRef.current
+    if (ws && ws.readyState === WebSocket.OPEN) {
+      seqRef.current += 1
+      ws.send(JSON.stringify({ type: 'command', direction, seq: seqRef.current, t: performance.now() }))
+    } else {
+      postCommand(direction)
     }
   }
 
   const buttonClass = (direction) => {
     const baseClass = "px-6 py-4 rounded-lg font-semibold text-white transition-all duration-200 transform hover:scale-110 active:scale-95 shadow-lg disabled:opacity-50 disabled:cursor-not-allowed"
     const activeClass = currentDirection === direction ? "ring-4 ring-offset-2" : ""
-    
+
     switch(direction) {
       case 'front':
         return `${baseClass} ${activeClass} bg-green-500 hover:bg-green-600`
@@ -49,54 +126,49 @@ function MotorControl() {
       <p className="text-gray-600 mb-4">
         Control the robot's movement direction
       </p>
-      
+
       {/* Control Pad */}
       <div className="flex flex-col items-center gap-2">
         {/* Forward Button */}
         <button
           onClick={() => handleMotorControl('front')}
-          disabled={isMoving}
           className={buttonClass('front')}
         >
           ⬆️ Forward
         </button>
-        
+
         {/* Left and Right Row */}
         <div className="flex gap-4">
           <button
             onClick={() => handleMotorControl('left')}
-            disabled={isMoving}
             className={buttonClass('left')}
           >
             ⬅️ Left
           </button>
           <button
             onClick={() => handleMotorControl('stop')}
-            disabled={isMoving}
             className="px-6 py-4 rounded-lg font-semibold text-white bg-gray-600 hover:bg-gray-700 transition-all duration-200 transform hover:scale-110 active:scale-95 shadow-lg"
           >
             ⏹️ Stop
           </button>
           <button
             onClick={() => handleMotorControl('right')}
-            disabled={isMoving}
             className={buttonClass('right')}
           >
             ➡️ Right
           </button>
         </div>
-        
+
         {/* Backward Button */}
         <button
           onClick={() => handleMotorControl('back')}
-          disabled={isMoving}
           className={buttonClass('back')}
         >
           ⬇️ Backward
         </button>
       </div>
 
-      {currentDirection && (
+      {currentDirection !== 'stop' && (
         <div className="mt-4 p-3 bg-blue-50 rounded-lg text-center">
           <p className="text-sm text-blue-700">
             Moving: <span className="font-bold">{currentDirection.toUpperCase()}</span>
@@ -104,9 +176,16 @@ function MotorControl() {
         </div>
       )}
 
+      <div className="mt-4 p-3 bg-gray-50 rounded-lg text-center">
+        <p className="text-xs text-gray-600">
+          {connected ? '🟢 Connected' : '🟠 Reconnecting (using HTTP)'}
+          {commandRtt !== null && ` · command latency ${commandRtt.toFixed(0)} ms`}
+        </p>
+      </div>
+
       <div className="mt-4 p-3 bg-yellow-50 rounded-lg">
         <p className="text-xs text-yellow-700">
-          ⚠️ Note: GPIO control will be implemented when Raspberry Pi is connected
+          ⚠️ The robot stops on its own if this page loses its connection to the backend
         </p>
       </div>
     </div>
@@ -114,4 +193,3 @@ function MotorControl() {
 }
 
 export default MotorControl
-
@@ -12,6 +12,7 @@ export default defineConfig({
       '/api': {
         target: 'http://127.0.0.1:8000',
         changeOrigin: true,
+        ws: true, // Motor control WebSocket (/api/motor/ws)
       }
     }
   }
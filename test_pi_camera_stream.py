@@ -4,12 +4,17 @@ Pi Camera Web Streamer
 Streams live camera feed to web browser - accessible from laptop
 Open http://<raspberry-pi-ip>:8080 in your laptop browser
 Press 's' in terminal to start, 'q' to stop
+
+Any number of browser tabs can watch at once: every viewer gets its own
+server thread and always receives the newest frame. Per-viewer fps is
+printed every few seconds and served as JSON at /stats.
 """
 import sys
 import os
+import json
 import time
 import threading
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from io import BytesIO
 
 # Add system dist-packages to path
@@ -52,8 +57,16 @@ except Exception as e:
 # Global variables
 camera = None
 streaming = False
+# Latest JPEG and its sequence number; replaced (never modified) by the camera thread
 frame_buffer = None
+frame_sequence = 0
 frame_lock = threading.Lock()
+frame_ready = threading.Condition(frame_lock)
+
+# Connected viewers: client address -> {"frames", "fps", "connected_at"}
+clients = {}
+clients_lock = threading.Lock()
+STATS_INTERVAL = 5.0
 
 # Image processing imports
 from PIL import Image, ImageEnhance
@@ -93,7 +106,7 @@ def process_frame(frame):
 
 def camera_thread():
     """Thread that captures frames from camera"""
-    global camera, streaming, frame_buffer
+    global camera, streaming, frame_buffer, frame_sequence
     
     try:
         camera = Picamera2(camera_num=0)
@@ -146,9 +159,12 @@ def camera_thread():
                     image.save(img_bytes, format='JPEG', quality=85)
                     img_bytes.seek(0)
                     
-                    # Update frame buffer
-                    with frame_lock:
-                        frame_buffer = img_bytes.getvalue()
+                    # Update frame buffer and wake every viewer
+                    jpeg = img_bytes.getvalue()
+                    with frame_ready:
+                        frame_buffer = jpeg
+                        frame_sequence += 1
+                        frame_ready.notify_all()
                 except Exception as e:
                     print(f"   Error capturing frame: {e}")
                     time.sleep(0.1)
@@ -164,8 +180,6 @@ class StreamingHandler(BaseHTTPRequestHandler):
     """HTTP handler for MJPEG streaming"""
     
     def do_GET(self):
-        global streaming, frame_buffer
-        
         if self.path == '/':
             # Serve HTML page
             self.send_response(200)
@@ -275,44 +289,108 @@ class StreamingHandler(BaseHTTPRequestHandler):
             """
             self.wfile.write(html.encode())
         
-        elif self.path == '/stream':
-            # MJPEG stream
-            self.send_response(200)
-            self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
-            self.end_headers()
-            
-            while streaming:
-                with frame_lock:
-                    if frame_buffer:
-                        try:
-                            self.wfile.write(b'--frame\r\n')
-                            self.send_header('Content-Type', 'image/jpeg')
-                            self.send_header('Content-Length', str(len(frame_buffer)))
-                            self.end_headers()
-                            self.wfile.write(frame_buffer)
-                            self.wfile.write(b'\r\n')
-                        except:
-                            break
-                time.sleep(0.033)  # ~30 FPS
+        elif self.path.split('?')[0] == '/stream':
+            self.stream_frames()
         
-        elif self.path == '/start':
-            streaming = True
+        elif self.path == '/stats':
+            with clients_lock:
+                body = json.dumps({"streaming": streaming, "clients": clients}).encode()
             self.send_response(200)
-            self.send_header('Content-type', 'application/json')
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
             self.end_headers()
-            self.wfile.write(b'{"status": "started"}')
+            self.wfile.write(body)
         
-        elif self.path == '/stop':
-            streaming = False
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(b'{"status": "stopped"}')
+        elif self.path in ('/start', '/stop'):
+            self.set_streaming(self.path == '/start')
+        
+        else:
+            self.send_error(404)
+    
+    def do_POST(self):
+        # The page's START/STOP buttons POST here
+        if self.path in ('/start', '/stop'):
+            self.set_streaming(self.path == '/start')
+        else:
+            self.send_error(404)
+    
+    def set_streaming(self, enabled):
+        global streaming
+        
+        streaming = enabled
+        if not enabled:
+            # Wake viewers so their stream loops exit
+            with frame_ready:
+                frame_ready.notify_all()
+        body = b'{"status": "started"}' if enabled else b'{"status": "stopped"}'
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def stream_frames(self):
+        """MJPEG stream; runs on this viewer's own thread"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        
+        client = f"{self.client_address[0]}:{self.client_address[1]}"
+        stats = {"frames": 0, "fps": 0.0, "connected_at": time.time()}
+        with clients_lock:
+            clients[client] = stats
+        
+        last_sequence = 0
+        window_start = time.monotonic()
+        window_frames = 0
+        try:
+            while streaming:
+                # Only hold the lock to wait for and grab the newest frame
+                with frame_ready:
+                    frame_ready.wait_for(lambda: frame_sequence > last_sequence or not streaming, timeout=1.0)
+                    jpeg = frame_buffer
+                    sequence = frame_sequence
+                if jpeg is None or sequence == last_sequence:
+                    continue
+                last_sequence = sequence
+                
+                # Socket I/O happens outside the lock, so a slow viewer never stalls the camera
+                self.wfile.write(
+                    b'--frame\r\n'
+                    b'Content-Type: image/jpeg\r\n'
+                    b'Content-Length: ' + str(len(jpeg)).encode() + b'\r\n\r\n'
+                )
+                self.wfile.write(jpeg)
+                self.wfile.write(b'\r\n')
+                
+                stats["frames"] += 1
+                window_frames += 1
+                elapsed = time.monotonic() - window_start
+                if elapsed >= 1.0:
+                    stats["fps"] = round(window_frames / elapsed, 1)
+                    window_start = time.monotonic()
+                    window_frames = 0
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with clients_lock:
+                clients.pop(client, None)
     
     def log_message(self, format, *args):
         # Suppress HTTP logs
         pass
 
+def report_client_fps():
+    """Print each viewer's achieved fps every STATS_INTERVAL seconds"""
+    while True:
+        time.sleep(STATS_INTERVAL)
+        with clients_lock:
+            snapshot = dict(clients)
+        if snapshot:
+            summary = ", ".join(f"{client} {stats['fps']:.1f} fps" for client, stats in snapshot.items())
+            print(f"   Viewers ({len(snapshot)}): {summary}")
+
 def get_local_ip():
     """Get local IP address"""
     import socket
@@ -339,7 +417,8 @@ port = 8080
 ip_address = get_local_ip()
 
 try:
-    server = HTTPServer(('0.0.0.0', port), StreamingHandler)
+    server = ThreadingHTTPServer(('0.0.0.0', port), StreamingHandler)
+    server.daemon_threads = True
     print(f"   ✓ Server started on port {port}")
     print(f"\n" + "=" * 70)
     print("🌐 Camera Stream is now available!")
@@ -350,12 +429,14 @@ try:
     print(f"   http://raspberrypi.local:8080")
     print(f"\nControls:")
     print(f"  - Use START/STOP buttons in the browser")
+    print(f"  - Per-viewer fps: http://{ip_address}:{port}/stats")
     print(f"  - Or press 'q' in terminal to quit server")
     print("=" * 70 + "\n")
     
     # Start server in background thread
     server_thread = threading.Thread(target=server.serve_forever, daemon=True)
     server_thread.start()
+    threading.Thread(target=report_client_fps, daemon=True).start()
     
     # Wait for user to quit
     try: